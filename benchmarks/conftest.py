@@ -0,0 +1,49 @@
+"""
+Fixtures for the benchmarks, which run against a SQLite stand-in by default.
+
+Environment variables:
+    - ``VALARPY_BENCH_CONFIG``: the path to a connection.json of a database loaded with
+      ``tests/resources/testdb.sql``, to run against MariaDB instead of SQLite
+    - ``VALARPY_BENCH_WELLS``: the number of synthetic wells (default 1,000,000)
+    - ``VALARPY_BENCH_FEATURES``: the number of wells with a feature (default 100,000)
+    - ``VALARPY_BENCH_FRAMES``: the number of values per feature (default 250)
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from benchmarks.seed import seed, sqlite_database
+from valarpy import Valar
+from valarpy.connection import GlobalConnection
+
+N_WELLS = int(os.environ.get("VALARPY_BENCH_WELLS", 1_000_000))
+N_FEATURED = int(os.environ.get("VALARPY_BENCH_FEATURES", 100_000))
+N_FRAMES = int(os.environ.get("VALARPY_BENCH_FRAMES", 250))
+SQLITE_DIR = Path(__file__).parent.parent / ".benchmarks"
+
+
+@pytest.fixture(scope="session")
+def seeded():
+    config = os.environ.get("VALARPY_BENCH_CONFIG")
+    if config is not None:
+        with Valar(config):
+            yield _seed()
+    else:
+        path = SQLITE_DIR / f"valar-{N_WELLS}-{N_FEATURED}-{N_FRAMES}.sqlite"
+        db = sqlite_database(path)
+        db.connect(reuse_if_open=True)
+        GlobalConnection.bind(db)
+        try:
+            yield _seed()
+        finally:
+            db.close()
+
+
+def _seed():
+    GlobalConnection.enable_write()
+    try:
+        return seed(N_WELLS, N_FEATURED, N_FRAMES)
+    finally:
+        GlobalConnection.disable_write()
@@ -0,0 +1,168 @@
+"""
+Creates a database of synthetic runs, wells, treatments, and features for the benchmarks.
+"""
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import re
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Type
+
+import numpy as np
+import peewee
+
+from valarpy.metamodel import BaseModel, EnumField
+from valarpy.snapshot import _regexp, create_schema
+
+TEST_SQL = Path(__file__).parent.parent / "tests" / "resources" / "testdb.sql"
+FEATURE_NAME = "bench_feature"
+WELLS_PER_RUN = 96
+
+
+class Seeded(NamedTuple):
+    """
+    The synthetic rows that the benchmarks query.
+    """
+
+    run_ids: np.ndarray
+    run_names: List[str]
+    well_ids: np.ndarray
+    featured_well_ids: np.ndarray
+    n_frames: int
+
+
+def sqlite_database(path: Path) -> peewee.SqliteDatabase:
+    """
+    Opens a SQLite stand-in for Valar with a table for every model (see ``valarpy.snapshot.create_schema``).
+    On creation, also runs the INSERT statements in ``tests/resources/testdb.sql``.
+    """
+    exists = path.exists()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = peewee.SqliteDatabase(str(path), pragmas=dict(journal_mode="wal", synchronous=0))
+    db.register_function(_regexp, "regexp", 2)
+    if exists:
+        return db
+    create_schema(db)
+    sql = TEST_SQL.read_text(encoding="utf8")
+    for statement in re.findall(r"^INSERT INTO .*?;$", sql, flags=re.MULTILINE | re.DOTALL):
+        db.execute_sql(statement)
+    return db
+
+
+def seed(n_wells: int, n_featured: int, n_frames: int) -> Seeded:
+    """
+    Inserts runs of 96 wells, each with one treatment, and one feature for the first ``n_featured`` wells.
+    Does nothing but look up the rows if they were already inserted with the same arguments.
+    Requires an open connection with write access.
+
+    Args:
+        n_wells: The number of wells, rounded up to a multiple of 96
+        n_featured: The number of wells with a ``WellFeatures`` row
+        n_frames: The number of float32 values in each feature
+    """
+    from valarpy import model
+
+    marker = f"bench_seed_{n_wells}_{n_featured}_{n_frames}"
+    n_runs = -(-n_wells // WELLS_PER_RUN)
+    run_names = [f"bench_run_{i}" for i in range(n_runs)]
+    if model.Refs.fetch_or_none(marker) is None:
+        _seed(model, run_names, n_featured, n_frames)
+        _insert(model.Refs, [dict(name=marker)])
+    runs = model.Runs.select(model.Runs.id).where(model.Runs.name << run_names)
+    run_ids = np.array(sorted(r.id for r in runs), dtype=np.int64)
+    wells = model.Wells.select(model.Wells.id).where(model.Wells.run << run_ids.tolist())
+    well_ids = np.array(sorted(w.id for w in wells), dtype=np.int64)
+    return Seeded(run_ids, run_names, well_ids, well_ids[:n_featured], n_frames)
+
+
+def _seed(model: Any, run_names: List[str], n_featured: int, n_frames: int) -> None:
+    user = _insert(model.Users, [dict(username="bench_user")])[0]
+    plate_type = _insert(model.PlateTypes, [dict(n_rows=8, n_columns=12)])[0]
+    battery = _insert(model.Batteries, [dict(name="bench_battery")])[0]
+    project = _insert(model.Projects, [dict(name="bench_project", creator=user)])[0]
+    experiment = _insert(
+        model.Experiments,
+        [dict(name="bench_experiment", battery=battery, creator=user, project=project)],
+    )[0]
+    sauron = _insert(model.Saurons, [dict(name="bench_sauron")])[0]
+    config = _insert(model.SauronConfigs, [dict(sauron=sauron)])[0]
+    control = _insert(model.ControlTypes, [dict(name="bench_control")])[0]
+    compound = _insert(model.Compounds, [dict(inchikey="bench_compound")])[0]
+    batch = _insert(model.Batches, [dict(lookup_hash="bench_batch", compound=compound)])[0]
+    feature = model.Features.fetch_or_none(FEATURE_NAME)
+    if feature is None:
+        feature = _insert(model.Features, [dict(name=FEATURE_NAME, data_type="float")])[0]
+    plates = _insert(
+        model.Plates, [dict(person_plated=user, plate_type=plate_type) for _ in run_names]
+    )
+    runs = _insert(
+        model.Runs,
+        [
+            dict(
+                name=name,
+                tag=name,
+                experiment=experiment,
+                experimentalist=user,
+                plate=plate,
+                sauron_config=config,
+            )
+            for name, plate in zip(run_names, plates)
+        ],
+    )
+    rows = [
+        dict(run=run, well_index=i, n=8, age=7, control_type=control if i % 2 == 0 else None)
+        for run in runs
+        for i in range(1, WELLS_PER_RUN + 1)
+    ]
+    wells = _insert(model.Wells, rows)
+    _insert(model.WellTreatments, [dict(well=w, batch=batch, micromolar_dose=10.0) for w in wells])
+    rng = np.random.default_rng(0)
+    for start in range(0, min(n_featured, len(wells)), 10000):
+        rows = []
+        for well in wells[start : min(start + 10000, n_featured)]:
+            floats = rng.random(n_frames, dtype=np.float32).astype(">f4").tobytes()
+            rows.append(
+                dict(well=well, type=feature, floats=floats, sha1=hashlib.sha1(floats).digest())
+            )
+        _insert(model.WellFeatures, rows)
+
+
+def _insert(model: Type[BaseModel], rows: List[Dict[str, Any]]) -> List[int]:
+    # fill in the NOT NULL columns that have no default, with unique values where required
+    fields = [
+        f
+        for f in model._meta.sorted_fields
+        if not f.primary_key and (f.name in rows[0] or _required(f))
+    ]
+    tuples = [tuple(_value(f, row, i) for f in fields) for i, row in enumerate(rows)]
+    return model.bulk_load(tuples, fields=fields)
+
+
+def _required(field: peewee.Field) -> bool:
+    has_default = field.default is not None or any(
+        "DEFAULT" in str(c.sql) for c in field.constraints or [] if isinstance(c, peewee.SQL)
+    )
+    return not field.null and not has_default
+
+
+def _value(field: peewee.Field, row: Dict[str, Any], i: int) -> Any:
+    if field.name in row:
+        return row[field.name]
+    if isinstance(field, peewee.ForeignKeyField):
+        raise ValueError(f"No value for {field.model.__name__}.{field.name}")
+    if isinstance(field, EnumField):
+        return field.choices[0]
+    if isinstance(field, peewee.BlobField):
+        return hashlib.sha1(f"{field.model.__name__}{i}".encode("utf8")).digest()
+    if isinstance(field, peewee.DateTimeField):
+        return datetime.datetime(2021, 1, 1)
+    if isinstance(field, peewee.DateField):
+        return datetime.date(2021, 1, 1)
+    if isinstance(field, (peewee.IntegerField, peewee.FloatField)):
+        return i if field.unique else 0
+    return f"bench_{field.model._meta.table_name}_{i}" if field.unique else "bench"
+
+
+__all__ = ["FEATURE_NAME", "Seeded", "seed", "sqlite_database"]
@@ -0,0 +1,27 @@
+import pytest
+
+from benchmarks.seed import FEATURE_NAME
+from valarpy.arrays import feature_matrix
+from valarpy.blobs import BlobCache
+
+
+@pytest.mark.benchmark(group="blobs")
+class TestBlobs:
+    def test_feature_matrix(self, benchmark, seeded):
+        wells = seeded.featured_well_ids.tolist()
+        matrix = benchmark.pedantic(feature_matrix, (FEATURE_NAME,), dict(wells=wells), rounds=3)
+        assert matrix.data.shape == (len(wells), seeded.n_frames)
+
+    def test_feature_matrix_cached(self, benchmark, seeded, tmp_path):
+        wells = seeded.featured_well_ids.tolist()
+        cache = BlobCache(tmp_path)
+        # the first call fills the cache, so that every round reads only digests from the database
+        feature_matrix(FEATURE_NAME, wells=wells, blob_cache=cache)
+        matrix = benchmark.pedantic(
+            feature_matrix, (FEATURE_NAME,), dict(wells=wells, blob_cache=cache), rounds=3
+        )
+        assert matrix.data.shape == (len(wells), seeded.n_frames)
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
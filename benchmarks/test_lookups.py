@@ -0,0 +1,54 @@
+import pytest
+
+SIZES = [10**3, 10**4, 10**5, 10**6]
+
+
+@pytest.mark.benchmark(group="fetch")
+class TestFetch:
+    def test_fetch_by_id(self, benchmark, seeded):
+        from valarpy.model import Runs
+
+        run_id = int(seeded.run_ids[len(seeded.run_ids) // 2])
+        assert benchmark(Runs.fetch, run_id).id == run_id
+
+    def test_fetch_by_name(self, benchmark, seeded):
+        from valarpy.model import Runs
+
+        name = seeded.run_names[len(seeded.run_names) // 2]
+        assert benchmark(Runs.fetch, name).name == name
+
+    def test_fetch_cached(self, benchmark, seeded):
+        from valarpy.model import Refs
+
+        Refs.clear_cache()
+        assert benchmark(Refs.fetch, "ref_four").id == 4
+
+
+@pytest.mark.benchmark(group="fetch_all")
+class TestFetchAll:
+    @pytest.mark.parametrize("n", SIZES)
+    def test_fetch_all(self, benchmark, seeded, n):
+        from valarpy.model import Wells
+
+        if n > len(seeded.well_ids):
+            pytest.skip(f"Only {len(seeded.well_ids)} wells were seeded")
+        ids = seeded.well_ids[:n].tolist()
+        rows = benchmark.pedantic(Wells.fetch_all, (ids,), rounds=3 if n >= 10**5 else 10)
+        assert len(rows) == n
+
+    def test_fetch_all_regex(self, benchmark, seeded):
+        from valarpy.model import Runs
+
+        patterns = [f"^{name}$" for name in seeded.run_names[:100]]
+        found = benchmark.pedantic(Runs.fetch_all_regex, (patterns,), dict(limit=1), rounds=3)
+        assert all(len(runs) == 1 for runs in found)
+
+    def test_build_or_query(self, benchmark, seeded):
+        from valarpy.model import Runs
+
+        values = [*seeded.run_ids[:500].tolist(), *seeded.run_names[:500]]
+        assert benchmark(Runs._build_or_query, values) is not None
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
@@ -0,0 +1,35 @@
+import pytest
+
+from valarpy.wells import WellTable
+
+
+@pytest.mark.benchmark(group="scan")
+class TestScans:
+    def test_iter_where(self, benchmark, seeded):
+        from valarpy.model import Wells
+
+        def scan():
+            return sum(len(c) for c in Wells.iter_where(Wells.run << runs, chunk_size=10000))
+
+        runs = seeded.run_ids.tolist()
+        assert benchmark.pedantic(scan, rounds=3) == len(seeded.well_ids)
+
+    def test_frame_where(self, benchmark, seeded):
+        from valarpy.model import Wells
+
+        runs = seeded.run_ids.tolist()
+        df = benchmark.pedantic(Wells.frame_where, (Wells.run << runs,), rounds=3)
+        assert len(df) == len(seeded.well_ids)
+
+    def test_well_table(self, benchmark, seeded):
+        from valarpy.model import Wells
+
+        runs = seeded.run_ids.tolist()
+        table = benchmark.pedantic(
+            WellTable.load, (Wells.run << runs,), dict(features=False), rounds=3
+        )
+        assert len(table) == len(seeded.well_ids)
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
@@ -0,0 +1,34 @@
+import pytest
+
+from valarpy.connection import GlobalConnection
+
+N_ROWS = 10000
+
+
+@pytest.fixture()
+def rolled_back(seeded):
+    GlobalConnection.enable_write()
+    database = GlobalConnection.get_database()
+    try:
+        with database.atomic() as transaction:
+            yield seeded
+            transaction.rollback()
+    finally:
+        GlobalConnection.disable_write()
+
+
+@pytest.mark.benchmark(group="insert")
+class TestWrites:
+    def test_bulk_load(self, benchmark, rolled_back):
+        from valarpy.model import Wells
+
+        run = int(rolled_back.run_ids[0])
+        rows = [(run, i % 96 + 1, 8) for i in range(N_ROWS)]
+        ids = benchmark.pedantic(
+            Wells.bulk_load, (rows,), dict(fields=["run", "well_index", "n"]), rounds=3
+        )
+        assert len(ids) == N_ROWS
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+import valarpy
+
+CONFIG_PATH = Path(__file__).parent / "resources" / "connection.json"
+CONFIG_DATA = json.loads(CONFIG_PATH.read_text(encoding="utf8"))
+
+
+class TestAio:
+    def test_aopened(self):
+        async def go():
+            async with valarpy.aopened(CONFIG_DATA) as model:
+                refs = await asyncio.gather(*[model.Refs.afetch_or_none(i) for i in [4, 20, 4]])
+                assert [getattr(ref, "name", None) for ref in refs] == [
+                    "ref_four",
+                    None,
+                    "ref_four",
+                ]
+                assert (await model.Refs.afetch("ref_four")).id == 4
+                dat = await model.Refs.afetch_all_or_none(["ref_four", "non", 4])
+                assert [getattr(ref, "id", None) for ref in dat] == [4, None, 4]
+                refs = await model.Refs.alist_where(name="ref_four")
+                assert [ref.id for ref in refs] == [4]
+                assert [ref.id async for ref in model.Refs.aiter_where(model.Refs.id > 0)] == [4]
+
+        asyncio.run(go())
+
+    def test_aiter_where(self):
+        from valarpy import aio
+
+        async def go():
+            async with valarpy.aopened(CONFIG_DATA) as model:
+                query = model.Refs.select().where(model.Refs.id > 0)
+                assert [ref.id async for ref in aio.aiterate(query, chunk_size=1)] == [4]
+                # stop early, then iterate again
+                async for _ in model.Refs.aiter_where(model.Refs.id > 0):
+                    break
+                assert [ref.name async for ref in model.Refs.aiter_where(id=4)] == ["ref_four"]
+                await model.Refs.afetch(4)
+                assert len(aio._worker_connections) > 0
+            # the workers' connections are closed on exit
+            assert len(aio._worker_connections) == 0
+
+        asyncio.run(go())
+
+    def test_aopened_pooled(self):
+        async def go():
+            async with valarpy.aopened({**CONFIG_DATA, "max_connections": 4}) as model:
+                refs = await asyncio.gather(*[model.Refs.afetch(4) for _ in range(20)])
+                assert {ref.id for ref in refs} == {4}
+                # the workers return their connections after each query
+                assert model.conn.pool_stats["in_use"] == 0
+
+        asyncio.run(go())
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
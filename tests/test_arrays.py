@@ -0,0 +1,195 @@
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from valarpy import Valar
+from valarpy.arrays import (
+    SensorSeries,
+    StimulusFrameCache,
+    dtype_of,
+    feature_matrix,
+    iter_sensor_data,
+    sensor_time_axis,
+)
+from valarpy.blobs import BlobCache
+from valarpy.instrumentation import tracking
+
+
+@pytest.fixture(scope="module")
+def setup():
+    with Valar(Path(__file__).parent / "resources" / "connection.json") as valar:
+        yield valar
+
+
+@pytest.fixture()
+def writing(setup):
+    # rows written by a test are rolled back
+    from valarpy.connection import GlobalConnection
+
+    try:
+        GlobalConnection.enable_write()
+        with setup.rolling_back():
+            yield setup
+    finally:
+        GlobalConnection.disable_write()
+
+
+def _blob(values, dtype) -> bytes:
+    return np.array(values, dtype=dtype).tobytes()
+
+
+class TestArrays:
+    def test_dtype_of(self):
+        assert dtype_of("float") == np.dtype(">f4")
+        assert dtype_of("unsigned_byte") == np.dtype("u1")
+        assert dtype_of("double").byteorder == ">"
+        with pytest.raises(ValueError):
+            dtype_of("other")
+        data = np.frombuffer(np.arange(3, dtype=">f4").tobytes(), dtype=dtype_of("float"))
+        assert data.tolist() == [0, 1, 2]
+
+    def test_feature_matrix_args(self):
+        with pytest.raises(ValueError):
+            feature_matrix("MI")
+        with pytest.raises(ValueError):
+            feature_matrix("MI", runs=[1], wells=[1])
+
+    def test_sensor_time_axis(self):
+        from valarpy.model import Sensors
+
+        sensor = Sensors(blob_type="every_n_milliseconds", n_between=10, data_type="byte")
+        assert sensor_time_axis(sensor, 3).tolist() == [0, 10, 20]
+        series = SensorSeries(1, sensor, np.zeros(2, dtype="i1"))
+        assert series.time_unit == "ms"
+        assert series.times.tolist() == [0, 10]
+        run_id, _, values = series
+        assert run_id == 1 and len(values) == 2
+        assert sensor_time_axis(Sensors(blob_type="arbitrary", n_between=10), 3) is None
+
+    def test_feature_matrix(self, writing, tmp_path):
+        from benchmarks.seed import FEATURE_NAME, seed
+        from valarpy.model import Features, WellFeatures
+
+        seeded = seed(96, 0, 1)
+        feature = Features.fetch(FEATURE_NAME)
+        dtype = dtype_of(feature.data_type)
+        w0, w1, w2 = seeded.well_ids[:3].tolist()
+        values = {w2: [1.5, -2.0, 3.25], w0: [0.5], w1: [4.0, 5.0]}
+        for well, floats in values.items():
+            blob = _blob(floats, dtype)
+            WellFeatures(
+                well=well, type=feature, floats=blob, sha1=hashlib.sha1(blob).digest()
+            ).save()
+        expected = np.array([[0.5, np.nan, np.nan], [4.0, 5.0, np.nan], [1.5, -2.0, 3.25]])
+        # ordered by well ID, and padded with NaN
+        data, well_ids = feature_matrix(FEATURE_NAME, wells=[w2, w0, w1])
+        assert well_ids.tolist() == [w0, w1, w2]
+        assert data.dtype == np.float32
+        np.testing.assert_array_equal(data, expected)
+        data, well_ids = feature_matrix(feature, runs=[int(seeded.run_ids[0])])
+        assert well_ids.tolist() == [w0, w1, w2]
+        np.testing.assert_array_equal(data, expected)
+        data, _ = feature_matrix(feature.id, wells=[w0, w1, w2], blob_cache=BlobCache(tmp_path))
+        np.testing.assert_array_equal(data, expected)
+        data, well_ids = feature_matrix(feature, wells=[seeded.well_ids[3]])
+        assert data.shape == (0, 0) and len(well_ids) == 0
+
+    def test_iter_sensor_data(self, writing, tmp_path):
+        from benchmarks.seed import seed
+        from valarpy.model import Runs, SensorData, Sensors
+
+        run_id = int(seed(96, 0, 1).run_ids[0])
+        ms = Sensors(
+            name="test_sensor_ms", data_type="short", blob_type="every_n_milliseconds", n_between=10
+        )
+        ms.save()
+        arbitrary = Sensors(name="test_sensor_arbitrary", data_type="double", blob_type="arbitrary")
+        arbitrary.save()
+        values = {ms.id: [-3, 0, 7, 300], arbitrary.id: [0.25, 1e10]}
+        for sensor in [arbitrary, ms]:
+            blob = _blob(values[sensor.id], dtype_of(sensor.data_type))
+            SensorData(
+                run=run_id, sensor=sensor, floats=blob, floats_sha1=hashlib.sha1(blob).digest()
+            ).save()
+        for blob_cache in [None, BlobCache(tmp_path)]:
+            series = list(iter_sensor_data([run_id], [ms, arbitrary], blob_cache=blob_cache))
+            assert [s.sensor.id for s in series] == sorted(values.keys())
+            for s in series:
+                assert s.run_id == run_id
+                assert s.values.dtype == dtype_of(s.sensor.data_type)
+                assert s.values.tolist() == values[s.sensor.id]
+        assert series[0].times.tolist() == [0, 10, 20, 30]
+        # the connection can be used after closing the generator early
+        rows = iter_sensor_data([run_id], ["test_sensor_ms", "test_sensor_arbitrary"])
+        next(rows)
+        rows.close()
+        assert Runs.fetch(run_id).id == run_id
+
+    def test_iter_sensor_data_other(self, writing):
+        from benchmarks.seed import seed
+        from valarpy.model import SensorData, Sensors
+
+        run_id = int(seed(96, 0, 1).run_ids[0])
+        other = Sensors(name="test_sensor_other", data_type="other", blob_type="arbitrary")
+        other.save()
+        short = Sensors(name="test_sensor_short", data_type="short", blob_type="arbitrary")
+        short.save()
+        blobs = {other.id: b"\x00\x01\xff", short.id: _blob([-3, 7], dtype_of("short"))}
+        for sensor_id, blob in blobs.items():
+            SensorData(
+                run=run_id, sensor=sensor_id, floats=blob, floats_sha1=hashlib.sha1(blob).digest()
+            ).save()
+        # with all sensors, the blobs of the sensor with no defined encoding are raw bytes
+        series = {s.sensor.id: s.values for s in iter_sensor_data([run_id])}
+        assert series[other.id].dtype == np.dtype("u1")
+        assert series[other.id].tolist() == [0, 1, 255]
+        assert series[short.id].tolist() == [-3, 7]
+        only = list(iter_sensor_data([run_id], [other]))
+        assert [s.values.tobytes() for s in only] == [b"\x00\x01\xff"]
+
+    def test_stimulus_frame_cache(self, writing, tmp_path):
+        from valarpy.model import Assays, Stimuli, StimulusFrames
+
+        frames = {}
+        stimuli = [Stimuli(name=f"test_stimulus_{i}", default_color="ffffff") for i in range(2)]
+        for i, stimulus in enumerate(stimuli):
+            stimulus.save()
+            frames[stimulus.id] = np.arange(i, i + 5, dtype=np.uint8)
+        sha1 = hashlib.sha1(b"".join(f.tobytes() for f in frames.values())).digest()
+        assays = [Assays(name=f"test_assay_{i}", length=5, frames_sha1=sha1) for i in range(2)]
+        for assay in assays:
+            assay.save()
+        for stimulus_id, values in frames.items():
+            blob = values.tobytes()
+            StimulusFrames(
+                assay=assays[0],
+                stimulus=stimulus_id,
+                frames=blob,
+                frames_sha1=hashlib.sha1(blob).digest(),
+            ).save()
+        cache = StimulusFrameCache(directory=tmp_path)
+        with tracking() as log:
+            found = cache.get(assays[0].name)
+        assert log.stats()["n_queries"] == 1
+        assert found.keys() == frames.keys()
+        for stimulus_id, values in frames.items():
+            assert found[stimulus_id].tolist() == values.tolist()
+            assert not found[stimulus_id].flags.writeable
+        assert (tmp_path / f"{sha1.hex()}.npz").exists()
+        # by ID or name, or by another assay with the same frames_sha1
+        with tracking() as log:
+            assert cache.get(assays[0].id).keys() == frames.keys()
+            assert cache.get(assays[0].name).keys() == frames.keys()
+            assert cache.get(assays[1]).keys() == frames.keys()
+        assert log.stats()["n_queries"] == 0
+        # a new cache reads the file
+        with tracking() as log:
+            found = StimulusFrameCache(directory=tmp_path).get(assays[0])
+        assert log.stats()["n_queries"] == 0
+        assert found[stimuli[1].id].tolist() == frames[stimuli[1].id].tolist()
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
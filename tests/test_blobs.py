@@ -0,0 +1,66 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from valarpy import Valar
+from valarpy.blobs import BlobCache
+
+
+@pytest.fixture(scope="module")
+def setup():
+    with Valar(Path(__file__).parent / "resources" / "connection.json") as valar:
+        yield valar
+
+
+class TestBlobs:
+    def test_path_of(self, tmp_path):
+        cache = BlobCache(tmp_path)
+        assert cache.path_of(bytes([0xAB, 0xCD, 0xEF])) == tmp_path / "ab" / "cdef"
+        assert cache.path_of("abcdef") == tmp_path / "ab" / "cdef"
+
+    def test_undeclared(self, tmp_path):
+        from valarpy.model import Refs
+
+        with pytest.raises(ValueError):
+            BlobCache(tmp_path).fetch(Refs.name)
+
+    def test_fetch(self, setup, tmp_path):
+        from valarpy.connection import GlobalConnection
+        from valarpy.model import ConfigFiles
+
+        texts = ["a = 1", "a = 2", "a = 1"]
+        cache = BlobCache(tmp_path)
+        try:
+            GlobalConnection.enable_write()
+            with setup.rolling_back():
+                rows = []
+                for text in texts:
+                    sha1 = hashlib.sha1(text.encode("utf8")).digest()
+                    rows.append(ConfigFiles(toml_text=text, text_sha1=sha1))
+                    rows[-1].save()
+                # the wrong digest for its text
+                wrong = ConfigFiles(toml_text="a = 3", text_sha1=hashlib.sha1(b"a = 4").digest())
+                wrong.save()
+                ids = [row.id for row in rows]
+                first = cache.fetch(ConfigFiles.toml_text, ConfigFiles.id << ids)
+                assert first == dict(zip(ids, texts))
+                # the duplicate text is fetched once
+                assert cache.info()["misses"] == 2
+                assert cache.info()["bytes_fetched"] == 10
+                for text in texts:
+                    path = cache.path_of(hashlib.sha1(text.encode("utf8")).digest())
+                    assert path.read_text(encoding="utf8") == text
+                # served from disk
+                second = cache.fetch(ConfigFiles.toml_text, ConfigFiles.id << ids)
+                assert second == first
+                assert cache.info()["misses"] == 2 and cache.info()["hits"] == 4
+                # returned but not written
+                assert cache.fetch(ConfigFiles.toml_text, id=wrong.id) == {wrong.id: "a = 3"}
+                assert not cache.path_of(wrong.text_sha1).exists()
+        finally:
+            GlobalConnection.disable_write()
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from valarpy.caching import DatabaseCaches, LruCache
+
+
+class TestCaching:
+    def test_max_size(self):
+        cache = LruCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+        # b was least recently used
+        assert "b" not in cache
+        assert cache.get("a") == 1 and cache.get("c") == 3
+        assert cache.get("b") is None
+        assert cache.info() == dict(hits=3, misses=1, size=2, bytes=0)
+
+    def test_max_bytes(self):
+        cache = LruCache(max_bytes=5, sizeof=len)
+        cache.put("a", b"abc")
+        cache.put("b", b"de")
+        assert len(cache) == 2
+        cache.put("c", b"f")
+        assert "a" not in cache and "b" in cache and "c" in cache
+        cache.put("d", b"too large")
+        assert "d" not in cache
+        assert cache.info()["bytes"] == 3
+        with pytest.raises(ValueError):
+            LruCache(max_bytes=5)
+
+    def test_ttl(self):
+        cache = LruCache(ttl=0.01)
+        cache.put("a", 1)
+        assert cache.get("a") == 1
+        time.sleep(0.02)
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_database_caches(self):
+        class Database:
+            pass
+
+        one, two = Database(), Database()
+        caches = DatabaseCaches(max_size=2)
+        caches.get(one).put("a", 1)
+        assert caches.get(one) is caches.get(one)
+        assert caches.get(one).get("a") == 1
+        assert caches.get(two).get("a") is None
+        DatabaseCaches.clear_all(two)
+        assert len(caches.get(one)) == 1
+        DatabaseCaches.clear_all(one)
+        assert len(caches.get(one)) == 0
+        caches.get(one).put("a", 1)
+        caches.get(two).put("a", 2)
+        caches.clear()
+        assert len(caches.get(one)) == len(caches.get(two)) == 0
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
@@ -25,6 +25,43 @@ class TestModel:
 
             list(Refs.select())
 
+    def test_pooled(self):
+        with Valar({**CONFIG_DATA, "max_connections": 4, "stale_timeout": 60}) as valar:
+            from valarpy.model import Refs
+
+            assert valar.is_pooled
+            assert valar.pool_stats["max_connections"] == 4
+            assert valar.pool_stats["in_use"] == 0
+            # connections for reads outside a transaction are returned after each statement
+            assert list(Refs.select()) is not None
+            assert len(list(Refs.iter_where(Refs.id > 0))) > 0
+            assert valar.pool_stats["in_use"] == 0
+            assert valar.pool_stats["idle"] == 1
+            with valar.atomic():
+                assert list(Refs.select()) is not None
+                assert Refs.select().count() > 0
+                assert valar.pool_stats["in_use"] == 1
+            assert valar.pool_stats["in_use"] == 0
+        assert not Valar(CONFIG_DATA).is_pooled
+        assert Valar(CONFIG_DATA).pool_stats is None
+
+    def test_pooled_id_table(self):
+        from valarpy import temptables
+
+        with Valar({**CONFIG_DATA, "max_connections": 4, "stale_timeout": 60}) as valar:
+            from valarpy.model import Refs
+
+            ids = list(range(4, 4 + temptables.MIN_IDS + 1))
+            wheres = Refs.fetch_to_query(ids)
+            assert isinstance(wheres[0], temptables.IdIn)
+            # compiling without running creates no table
+            assert str(Refs.select().where(*wheres)) is not None
+            assert valar.pool_stats["in_use"] == 0
+            # the connection checked out to create the table is returned after streaming
+            assert [r.id for r in Refs.iter_where(*wheres)] == [4]
+            assert [len(f) for f in Refs.iter_where(*wheres, as_frame=True)] == [1]
+            assert valar.pool_stats["in_use"] == 0
+
     def test_config_path_env(self):
         popped = None
         try:
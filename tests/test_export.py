@@ -0,0 +1,114 @@
+from pathlib import Path
+
+import peewee
+import pytest
+
+from valarpy import Valar
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+@pytest.fixture(scope="module")
+def setup():
+    with Valar(Path(__file__).parent / "resources" / "connection.json") as valar:
+        yield valar
+
+
+class TestExport:
+    def test_schema(self, setup):
+        from valarpy.export import arrow_schema
+        from valarpy.model import Refs
+
+        schema = arrow_schema(Refs)
+        assert schema.field("id").type == pa.int64()
+        assert schema.field("name").type == pa.string()
+        assert schema.field("created").type == pa.timestamp("us")
+        with pytest.raises(ValueError):
+            arrow_schema(Refs.select(Refs.name.alias("x")))
+
+    def test_iter_batches(self, setup):
+        from valarpy.export import iter_batches
+        from valarpy.model import Refs
+
+        batches = list(iter_batches(Refs, batch_size=1))
+        assert [batch.to_pydict()["name"] for batch in batches] == [["ref_four"]]
+        assert list(iter_batches(Refs, after_id=4)) == []
+        with pytest.raises(ValueError):
+            list(iter_batches(Refs.select(Refs.name)))
+
+    def test_export_parquet(self, setup, tmp_path):
+        from valarpy.export import export_parquet
+        from valarpy.model import Refs, Users
+
+        result = export_parquet(Refs, tmp_path, row_group_size=1)
+        assert result.n_rows == 1
+        assert result.last_id == 4
+        assert pq.read_table(tmp_path).column("name").to_pylist() == ["ref_four"]
+        # nothing new to export
+        result = export_parquet(Refs, tmp_path)
+        assert result.n_rows == 1
+        assert len(result.files) == 1
+        with pytest.raises(ValueError):
+            export_parquet(Users, tmp_path)
+
+    def test_null_first_batch(self, setup, tmp_path):
+        from valarpy.connection import GlobalConnection
+        from valarpy.export import export_parquet, iter_batches
+        from valarpy.model import Refs
+
+        # NULL for ref_four, in the first batch
+        later = peewee.Case(None, [(Refs.id > 4, Refs.id * 2)], None).alias("later")
+        query = Refs.select(Refs.id, Refs.name.alias("x"), later)
+        try:
+            GlobalConnection.enable_write()
+            with setup.rolling_back():
+                ids = Refs.bulk_load([("test_export_a",), ("test_export_b",)], fields=[Refs.name])
+                batches = list(iter_batches(query, batch_size=1))
+                types = [batch.schema.field("later").type for batch in batches]
+                assert types == [pa.null(), pa.int64(), pa.int64()]
+                values = [v for batch in batches for v in batch.column("later").to_pylist()]
+                assert values == [None, *[2 * i for i in ids]]
+                assert all(batch.schema.field("x").type == pa.string() for batch in batches)
+                result = export_parquet(query, tmp_path, row_group_size=1)
+                assert result.n_rows == 3
+                assert result.last_id == ids[-1]
+                # a new file starts when the type is known
+                assert len(result.files) == 2
+                table = pq.read_table(result.files[1])
+                assert table.column("later").to_pylist() == [2 * i for i in ids]
+        finally:
+            GlobalConnection.disable_write()
+
+    def test_join_across_batches(self, setup, tmp_path):
+        from benchmarks.seed import seed
+        from valarpy.connection import GlobalConnection
+        from valarpy.export import export_parquet, iter_batches
+        from valarpy.model import Batches, WellTreatments, Wells
+
+        try:
+            GlobalConnection.enable_write()
+            with setup.rolling_back():
+                seeded = seed(96, 0, 1)
+                w0, w1, w2 = seeded.well_ids[:3].tolist()
+                # a second treatment for the well at the end of the first batch
+                extra = Batches(lookup_hash="test_export_batch")
+                extra.save()
+                WellTreatments(well=w1, batch=extra).save()
+                query = (
+                    Wells.select(Wells.id, WellTreatments.batch)
+                    .join(WellTreatments)
+                    .where(Wells.id << [w0, w1, w2])
+                )
+                batches = [batch.to_pydict()["id"] for batch in iter_batches(query, batch_size=2)]
+                assert batches == [[w0, w1, w1], [w2]]
+                result = export_parquet(query, tmp_path, row_group_size=2, row_groups_per_file=1)
+                assert result.n_rows == 4
+                assert pq.read_table(result.files[0]).column("id").to_pylist() == [w0, w1, w1]
+                assert result.last_id == w2
+        finally:
+            GlobalConnection.disable_write()
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
@@ -0,0 +1,82 @@
+from pathlib import Path
+
+import pytest
+
+from valarpy import Valar
+
+
+@pytest.fixture(scope="module")
+def setup():
+    with Valar(Path(__file__).parent / "resources" / "connection.json") as valar:
+        yield valar
+
+
+class TestGraphs:
+    def test_load_runs(self, setup, monkeypatch):
+        from valarpy.connection import GlobalConnection
+        from valarpy.graphs import N_QUERIES, load_runs
+        from valarpy.model import Refs, ValarLookupError, ValarTableTypeError
+
+        database = GlobalConnection.get_database()
+        sqls = []
+        execute_sql = database.execute_sql
+        monkeypatch.setattr(
+            database, "execute_sql", lambda sql, *args: sqls.append(sql) or execute_sql(sql, *args)
+        )
+        graph = load_runs([])
+        assert graph.runs == [] and graph.all_wells() == []
+        assert len(sqls) == 0
+        with pytest.raises(ValarLookupError):
+            load_runs([1, "nonexistent_run"])
+        # the runs query fails before the others
+        assert 0 < len(sqls) <= N_QUERIES
+        with pytest.raises(ValarTableTypeError):
+            load_runs([Refs(id=1)])
+        with pytest.raises(TypeError):
+            # noinspection PyTypeChecker
+            load_runs([1.5])
+
+    def test_load_runs_seeded(self, setup, monkeypatch):
+        from benchmarks.seed import seed
+        from valarpy.connection import GlobalConnection
+        from valarpy.graphs import N_QUERIES, load_runs
+
+        database = GlobalConnection.get_database()
+        try:
+            GlobalConnection.enable_write()
+            with setup.rolling_back():
+                seeded = seed(96, 0, 1)
+                sqls = []
+                execute_sql = database.execute_sql
+                monkeypatch.setattr(
+                    database,
+                    "execute_sql",
+                    lambda sql, *args: sqls.append(sql) or execute_sql(sql, *args),
+                )
+                graph = load_runs([seeded.run_names[0]])
+                assert len(sqls) == N_QUERIES
+                [run] = graph.runs
+                assert run.id == seeded.run_ids[0]
+                wells = graph.wells_of(run)
+                assert [w.id for w in wells] == seeded.well_ids.tolist()
+                assert [w.well_index for w in wells] == list(range(1, 97))
+                treatments = [graph.treatments_of(w) for w in wells]
+                # every foreign key in the graph is already loaded
+                assert run.experiment.battery.name == "bench_battery"
+                assert run.plate.plate_type.n_columns == 12
+                for well, [treatment] in zip(wells, treatments):
+                    assert well.run is run
+                    assert treatment.well is well
+                    assert treatment.batch is treatments[0][0].batch
+                    assert treatment.batch.compound.inchikey == "bench_compound"
+                    if well.well_index % 2 == 0:
+                        assert well.control_type.name == "bench_control"
+                    else:
+                        assert well.control_type is None
+                assert len(sqls) == N_QUERIES
+        finally:
+            GlobalConnection.disable_write()
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
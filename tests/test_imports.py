@@ -0,0 +1,68 @@
+import pickle
+import re
+import subprocess
+import sys
+
+import pytest
+
+# generous, so that only a regression like importing pandas at import time exceeds it
+BUDGET_SEC = 0.5
+
+
+def _import_time(module: str) -> float:
+    # the cumulative microseconds reported by -X importtime for the module
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        match = re.fullmatch(r"import time:\s*\d+ \|\s*(\d+) \|\s*" + re.escape(module), line)
+        if match is not None:
+            return int(match.group(1)) / 1e6
+    raise AssertionError(f"No import time for {module} in {result.stderr}")
+
+
+def _loaded(module: str, candidates) -> set:
+    code = f"import sys, {module}; print(' '.join(m for m in {candidates!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return set(result.stdout.split())
+
+
+class TestImports:
+    def test_package_is_light(self):
+        assert _loaded("valarpy", ["peewee", "pymysql", "pandas", "numpy"]) == set()
+
+    def test_model_does_not_import_pandas(self):
+        assert _loaded("valarpy.model", ["pandas", "numpy", "asyncio"]) == set()
+
+    def test_budget(self):
+        assert min(_import_time("valarpy.model") for _ in range(3)) < BUDGET_SEC
+
+    def test_lazy_attributes(self):
+        import pandas as pd
+
+        import valarpy
+        from valarpy.connection import Valar
+        from valarpy.metamodel import TableDescriptionFrame
+
+        assert valarpy.Valar is Valar
+        assert issubclass(TableDescriptionFrame, pd.DataFrame)
+        with pytest.raises(AttributeError):
+            assert valarpy.not_an_attribute
+
+    def test_description_frame_pickles(self):
+        from valarpy.metamodel import TableDescriptionFrame
+
+        df = TableDescriptionFrame({"name": ["id"], "type": ["int"]})
+        assert TableDescriptionFrame.__module__ == "valarpy.frames"
+        loaded = pickle.loads(pickle.dumps(df))
+        assert isinstance(loaded, TableDescriptionFrame)
+        assert loaded.equals(df)
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
@@ -0,0 +1,30 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from valarpy import opened
+
+CONFIG_PATH = Path(__file__).parent / "resources" / "connection.json"
+CONFIG_DATA = json.loads(CONFIG_PATH.read_text(encoding="utf8"))
+
+
+class TestInfo:
+    def test_table_stats(self):
+        from valarpy.info import table_stats
+
+        with opened(CONFIG_DATA) as model:
+            for exact, max_workers in [(False, 1), (True, 1), (True, 4)]:
+                stats = table_stats(exact=exact, max_workers=max_workers)
+                assert len(stats) == len(model.BaseModel.__subclasses__())
+                assert all(stat.error is None for stat in stats)
+                assert all(stat.seconds >= 0 for stat in stats)
+                refs = [stat for stat in stats if stat.model is model.Refs][0]
+                if exact:
+                    assert refs.n_rows == 1
+            with pytest.raises(ValueError):
+                table_stats(max_workers=0)
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
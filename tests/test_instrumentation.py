@@ -0,0 +1,72 @@
+import json
+import logging
+from pathlib import Path
+
+import pytest
+
+from valarpy import Valar
+from valarpy.instrumentation import (
+    MAX_CACHED_SQL,
+    QueryLog,
+    QueryRecord,
+    _cached_fingerprint,
+    fingerprint,
+    tracking,
+)
+
+CONFIG_PATH = Path(__file__).parent / "resources" / "connection.json"
+CONFIG_DATA = json.loads(CONFIG_PATH.read_text(encoding="utf8"))
+
+
+class TestInstrumentation:
+    def test_fingerprint(self):
+        fp, table = fingerprint("SELECT `t1`.`id` FROM `refs` AS `t1` WHERE `t1`.`id` IN (%s, %s)")
+        assert fp == "SELECT `t1`.`id` FROM `refs` AS `t1` WHERE `t1`.`id` IN (...)"
+        assert table == "refs"
+        fp, table = fingerprint("INSERT INTO `wells` (`run_id`) VALUES (%s), (%s)  LIMIT 10")
+        assert fp == "INSERT INTO `wells` (`run_id`) VALUES (...) LIMIT ?"
+        assert table == "wells"
+        assert fingerprint("BEGIN") == ("BEGIN", None)
+
+    def test_fingerprint_long(self):
+        sql = "SELECT `id` FROM `wells` WHERE `id` IN (" + ", ".join(["%s"] * 2000) + ")"
+        assert len(sql) >= MAX_CACHED_SQL
+        size = _cached_fingerprint.cache_info().currsize
+        assert fingerprint(sql) == ("SELECT `id` FROM `wells` WHERE `id` IN (...)", "wells")
+        # long statements are not held by the cache
+        assert _cached_fingerprint.cache_info().currsize == size
+
+    def test_query_log(self):
+        log = QueryLog(max_size=2)
+        for i in range(3):
+            log.add(QueryRecord("SELECT", "refs", 0.5, 10, 100, 0.0))
+        log.add(QueryRecord("INSERT", "wells", 2.0, 1, None, 0.0))
+        assert len(log.recent()) == 2
+        stats = log.stats()
+        assert stats["n_queries"] == 4
+        assert stats["n_bytes"] == 300
+        assert stats["by_table"]["refs"]["n_queries"] == 3
+        assert stats["by_table"]["refs"]["max_seconds"] == 0.5
+        assert list(stats["by_fingerprint"].keys()) == ["INSERT", "SELECT"]
+        log.clear()
+        assert log.stats()["n_queries"] == 0
+
+    def test_tracking(self, caplog):
+        with Valar({**CONFIG_DATA, "slow_query_sec": 0}) as valar:
+            from valarpy.model import Refs
+
+            with caplog.at_level(logging.WARNING, logger="valarpy"):
+                with valar.tracking() as log:
+                    list(Refs.select())
+                    with tracking() as inner:
+                        list(Refs.iter_where(Refs.id > 0))
+            assert log.stats()["by_table"]["refs"]["n_queries"] == 2
+            assert inner.stats()["n_queries"] == 1
+            assert log.recent()[0].n_rows == 1
+            assert log.recent()[0].n_bytes > 0
+            assert valar.stats()["n_queries"] >= 2
+            assert "test_instrumentation.py" in caplog.text
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
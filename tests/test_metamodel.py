@@ -3,6 +3,7 @@ from pathlib import Path
 import pytest
 
 from valarpy import Valar
+from valarpy.instrumentation import tracking
 
 
 @pytest.fixture(scope="module")
@@ -91,6 +92,33 @@ class TestMetamodel:
         # dat = Refs.fetch_all_or_none(["ref_four", "non", 4, Refs.fetch(4)], join_fn=lambda s: s.join(Refs))
         # assert [getattr(ref, "id", None) for ref in dat] == [4, None, 4, 4]
 
+    def test_fetch_all_or_none_batched(self, setup):
+        from valarpy.model import Refs
+
+        things = ["ref_four", "non", 4, 20, Refs(id=4, name="ref_four"), "ref_four"]
+        expected = [4, None, 4, None, 4, 4]
+        for batch_size in [1, 2, None]:
+            for max_workers in [1, 3]:
+                Refs.clear_cache()
+                dat = Refs.fetch_all_or_none(things, batch_size=batch_size, max_workers=max_workers)
+                assert [getattr(ref, "id", None) for ref in dat] == expected
+        assert [ref.id for ref in Refs.fetch_all([4, "ref_four"], batch_size=1)] == [4, 4]
+
+    def test_fetch_all_or_none_workers_in_transaction(self, setup):
+        from valarpy.connection import GlobalConnection
+        from valarpy.model import Refs
+
+        with Valar(Path(__file__).parent / "resources" / "connection.json") as valar:
+            try:
+                GlobalConnection.enable_write()
+                with valar.rolling_back():
+                    Refs(name="phantom").save()
+                    # the batches run on this connection, which can see the uncommitted row
+                    dat = Refs.fetch_all_or_none(["phantom", 4], batch_size=1, max_workers=2)
+                    assert [getattr(ref, "name", None) for ref in dat] == ["phantom", "ref_four"]
+            finally:
+                GlobalConnection.disable_write()
+
     def test_fetch_like(self, setup):
         from valarpy.model import Refs
 
@@ -108,6 +136,66 @@ class TestMetamodel:
         ref = Refs.fetch_or_none(".*", regex=True)
         assert ref is not None and ref.id == 4
 
+    def test_fetch_all_like(self, setup):
+        from valarpy.model import Refs
+
+        found = Refs.fetch_all_like(["four", "five", "ref_"], batch_size=2)
+        assert [[ref.id for ref in refs] for refs in found] == [[4], [], [4]]
+        assert found[0][0] is found[2][0]
+        assert Refs.fetch_all_like(["ref"], limit=0) == [[]]
+        assert Refs.fetch_all_like([]) == []
+        with pytest.raises(TypeError):
+            Refs.fetch_all_like([4])
+
+    def test_fetch_all_regex(self, setup):
+        from valarpy.model import Refs
+
+        found = Refs.fetch_all_regex(["^ref_f", "five$", ".*"], limit=1)
+        assert [[ref.id for ref in refs] for refs in found] == [[4], [], [4]]
+        # the server applies the limit
+        with tracking() as log:
+            found = Refs.fetch_all_regex([".*", ".*"], limit=1)
+        assert [[ref.id for ref in refs] for refs in found] == [[4], [4]]
+        assert log.stats()["n_rows"] == 2
+
+    def test_cache(self, setup):
+        from valarpy.model import Refs, Wells
+
+        assert Wells.cache_info() is None
+        Refs.clear_cache()
+        before = Refs.cache_info()
+        assert before["size"] == 0
+        ref = Refs.fetch("ref_four")
+        # cached under both its id and its name
+        assert Refs.fetch(4) is ref
+        assert Refs.fetch_or_none("ref_four") is ref
+        assert Refs.fetch_all_or_none([4, "ref_four", "non"]) == [ref, ref, None]
+        after = Refs.cache_info()
+        assert after["hits"] - before["hits"] == 4
+        assert after["size"] == 2
+        Refs.clear_cache()
+        assert Refs.cache_info()["size"] == 0
+
+    def test_cache_rollback(self, setup):
+        from valarpy.connection import GlobalConnection
+        from valarpy.model import Refs
+
+        with Valar(Path(__file__).parent / "resources" / "connection.json") as valar:
+            try:
+                GlobalConnection.enable_write()
+                with valar.rolling_back():
+                    Refs(name="phantom").save()
+                    assert Refs.fetch("phantom").name == "phantom"
+                    # rows read in a transaction are not cached
+                    assert Refs.cache_info()["size"] == 0
+            finally:
+                GlobalConnection.disable_write()
+            assert Refs.fetch_or_none("phantom") is None
+            # each database has its own cache
+            Refs.fetch(4)
+            assert Refs.cache_info()["size"] == 2
+        assert Refs.cache_info()["size"] == 0
+
     def test_fetch_to_query(self, setup):
         from valarpy.model import Refs
 
@@ -141,6 +229,60 @@ class TestMetamodel:
             # noinspection PyTypeChecker
             Refs.fetch_to_query(lambda x: x)
 
+    def test_fetch_to_query_id_table(self, setup, monkeypatch):
+        from valarpy import temptables
+        from valarpy.model import Refs
+
+        monkeypatch.setattr(temptables, "MIN_IDS", 2)
+        ref = Refs.fetch(4)
+        wheres = Refs.fetch_to_query([4, ref.name, ref, 1000])
+        assert isinstance(wheres[0], temptables.IdIn)
+        assert [r.id for r in Refs.select().where(*wheres)] == [4]
+        # the same IDs reuse the table, and the same set twice in a statement is listed the second time
+        table = temptables.id_table(Refs._meta.database.obj, [4, 1000])
+        assert temptables.id_table(Refs._meta.database.obj, [1000, 4, 4]).__name__ == table.__name__
+        again = Refs.fetch_to_query([4, 1000])
+        assert [r.id for r in Refs.select().where(*wheres, *again)] == [4]
+        with pytest.raises(TypeError):
+            # noinspection PyTypeChecker
+            Refs.fetch_to_query([4, 5, lambda x: x])
+
+    def test_fetch_to_query_id_table_evicted(self, setup, monkeypatch):
+        from valarpy import temptables
+        from valarpy.model import Refs
+
+        monkeypatch.setattr(temptables, "MIN_IDS", 2)
+        monkeypatch.setattr(temptables, "MAX_TABLES", 2)
+        wheres = Refs.fetch_to_query([4, 1000])
+        assert [r.id for r in Refs.select().where(*wheres)] == [4]
+        for i in range(3):
+            assert list(Refs.select().where(*Refs.fetch_to_query([2000 + i, 3000]))) == []
+        assert len(temptables._tables(Refs._meta.database.obj)) == 2
+        # the evicted table is created again
+        assert [r.id for r in Refs.select().where(*wheres)] == [4]
+        # every table that a statement uses is kept
+        many = [Refs.fetch_to_query([4, 1000 + i])[0] for i in range(4)]
+        assert [r.id for r in Refs.select().where(*many)] == [4]
+        temptables.drop_id_tables(Refs._meta.database.obj)
+        assert [r.id for r in Refs.select().where(*wheres)] == [4]
+
+    def test_fetch_to_query_id_table_rollback(self, setup, monkeypatch):
+        from valarpy import temptables
+        from valarpy.model import Refs
+
+        monkeypatch.setattr(temptables, "MIN_IDS", 2)
+        database = Refs._meta.database.obj
+        temptables.drop_id_tables(database)
+        wheres = Refs.fetch_to_query([4, 1001])
+        with database.atomic():
+            with database.atomic() as savepoint:
+                assert [r.id for r in Refs.select().where(*wheres)] == [4]
+                savepoint.rollback()
+            # the table was emptied by the rollback, so it is created again
+            assert [r.id for r in Refs.select().where(*wheres)] == [4]
+        assert [r.id for r in Refs.select().where(*wheres)] == [4]
+        temptables.drop_id_tables(database)
+
     def test_list_where(self, setup):
         from valarpy.model import Refs
 
@@ -150,6 +292,40 @@ class TestMetamodel:
         refs = Refs.list_where(name="ref_four")
         assert [getattr(ref, "id", None) for ref in refs] == [4]
 
+    def test_iter_where(self, setup):
+        from valarpy.model import Refs
+
+        assert [ref.id for ref in Refs.iter_where(Refs.id > 0)] == [4]
+        chunks = list(Refs.iter_where(name="ref_four", chunk_size=10))
+        assert [[ref.id for ref in chunk] for chunk in chunks] == [[4]]
+        dfs = list(Refs.iter_where(Refs.id > 0, as_frame=True))
+        assert len(dfs) == 1
+        assert dfs[0]["name"].tolist() == ["ref_four"]
+        assert str(dfs[0]["id"].dtype) == "Int64"
+        with pytest.raises(ValueError):
+            Refs.iter_where(chunk_size=0)
+
+    def test_frame_where(self, setup):
+        from valarpy.model import Refs
+
+        df = Refs.frame_where(Refs.id > 0)
+        assert df["name"].tolist() == ["ref_four"]
+        assert str(df["id"].dtype) == "Int64"
+        assert str(df["created"].dtype) == "datetime64[ns]"
+        df = Refs.frame_where(name="ref_four", columns=["id", Refs.name])
+        assert list(df.columns) == ["id", "name"]
+        assert len(Refs.frame_where(Refs.id < 0)) == 0
+        with pytest.raises(ValueError):
+            Refs.frame_where(columns=["nonexistent"])
+
+    def test_to_frame(self, setup):
+        from peewee import fn
+
+        from valarpy.model import Refs
+
+        df = Refs.select(Refs.name, fn.COUNT(Refs.id).alias("n")).group_by(Refs.name).to_frame()
+        assert df.to_dict(orient="records") == [dict(name="ref_four", n=1)]
+
     def test_description(self, setup):
         from valarpy.model import Features
 
@@ -190,6 +366,26 @@ class TestMetamodel:
         lines = Features.get_schema().split("\n")
         assert len(lines) == 6
 
+    def test_deferred_select(self, setup):
+        from valarpy.model import Runs
+
+        assert Runs._valar_info.deferred == ("notes",)
+        assert Runs.notes not in Runs.select()._returning
+        assert Runs.notes in Runs.select(Runs.id, Runs.notes)._returning
+        with pytest.raises(ValueError):
+            Runs.load_deferred([], "nonexistent")
+
+    def test_model_info(self, setup):
+        from valarpy.model import Refs, Runs, WellFeatures, Wells
+
+        assert Refs._valar_info.indexing_cols == ("name",)
+        assert Refs.get_indexing_cols() == {"name"}
+        assert Wells._valar_info.foreign_keys["run"] is Runs
+        assert Wells._valar_info.dtypes["well_index"] == "Int64"
+        assert "floats" in WellFeatures._valar_info.blob_cols
+        with pytest.raises(TypeError):
+            Refs._valar_info.dtypes["name"] = "int64"
+
     def test_sstring(self, setup):
 
         from valarpy.model import ControlTypes
@@ -0,0 +1,109 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from valarpy import Valar
+from valarpy.replicas import _cached_is_replica_safe, is_replica_safe
+
+CONFIG_PATH = Path(__file__).parent / "resources" / "connection.json"
+CONFIG_DATA = json.loads(CONFIG_PATH.read_text(encoding="utf8"))
+
+
+class TestReplicas:
+    def test_is_replica_safe(self):
+        assert is_replica_safe("SELECT `t1`.`id` FROM `refs` AS `t1`")
+        assert is_replica_safe("  select 1")
+        assert not is_replica_safe("INSERT INTO `refs` (`name`) SELECT 'a'")
+        assert not is_replica_safe("SELECT `id` FROM `refs` FOR UPDATE")
+        assert not is_replica_safe("SELECT LAST_INSERT_ID()")
+        assert not is_replica_safe(
+            "SELECT `id` FROM `refs` WHERE `id` IN (SELECT id FROM valarpy_ids_0)"
+        )
+        long = "SELECT `id` FROM `refs` WHERE `id` IN (" + ", ".join(["%s"] * 2000) + ")"
+        size = _cached_is_replica_safe.cache_info().currsize
+        assert is_replica_safe(long)
+        assert not is_replica_safe(long + " FOR UPDATE")
+        assert _cached_is_replica_safe.cache_info().currsize == size
+
+    def test_config(self):
+        assert not Valar(CONFIG_DATA).is_replicated
+        assert Valar({**CONFIG_DATA, "replicas": [CONFIG_DATA["host"]]}).is_replicated
+        with pytest.raises(ValueError):
+            Valar({**CONFIG_DATA, "replicas": [CONFIG_DATA["host"]], "replica_strategy": "x"})
+
+    @pytest.mark.parametrize("strategy", ["round_robin", "latency"])
+    def test_routing(self, strategy):
+        # the replica is the same server, so every query can be checked
+        config = {**CONFIG_DATA, "replicas": [{"host": CONFIG_DATA["host"]}]}
+        with Valar({**config, "replica_strategy": strategy}) as valar:
+            from valarpy.model import Refs
+
+            primary, replica = valar._db, valar._db.replicas[0]
+            assert valar._db.database_for("SELECT 1") is replica
+            assert valar._db.database_for("UPDATE refs SET name = 'x'") is primary
+            with valar.on_primary():
+                assert valar._db.database_for("SELECT 1") is primary
+            with valar.atomic():
+                assert valar._db.database_for("SELECT 1") is primary
+            assert Refs.fetch(4).id == 4
+            assert len(list(Refs.iter_where(Refs.id > 0))) == 1
+            assert not replica.is_closed()
+        assert replica.is_closed()
+
+    def test_pooled(self):
+        config = {**CONFIG_DATA, "max_connections": 4, "replicas": [CONFIG_DATA["host"]]}
+        with Valar(config) as valar:
+            from valarpy.model import Refs
+
+            replica = valar._db.replicas[0]
+            assert [ref.id for ref in Refs.select().where(Refs.id == 4)] == [4]
+            assert len(list(Refs.iter_where(Refs.id > 0))) == 1
+            # both connections were returned to their pools
+            assert replica.is_closed() and valar._db.is_closed()
+            assert len(replica._in_use) == 0 and len(replica._connections) == 1
+            assert valar.pool_stats["in_use"] == 0
+
+    def test_pooled_probe(self):
+        config = {**CONFIG_DATA, "max_connections": 4, "replicas": [CONFIG_DATA["host"]]}
+        config["replica_strategy"] = "latency"
+        with Valar(config) as valar:
+            from valarpy.model import Refs
+
+            replica = valar._db.replicas[0]
+            assert [ref.id for ref in Refs.select().where(Refs.id == 4)] == [4]
+            # the connection that measured latency was returned too
+            assert len(replica._in_use) == 0
+
+    def test_writes_read_primary(self, monkeypatch):
+        from valarpy.connection import GlobalConnection
+
+        with Valar({**CONFIG_DATA, "replicas": [CONFIG_DATA["host"]]}) as valar:
+            from valarpy.model import Refs
+
+            replica = valar._db.replicas[0]
+            execute_sql = replica.execute_sql
+            sqls = []
+
+            def record(sql, *args, **kwargs):
+                sqls.append(sql)
+                return execute_sql(sql, *args, **kwargs)
+
+            monkeypatch.setattr(replica, "execute_sql", record)
+            try:
+                GlobalConnection.enable_write()
+                with valar.rolling_back():
+                    ref, created = Refs.get_or_create(name="ref_four")
+                    assert ref.id == 4 and not created
+                ref, created = Refs.get_or_create(name="ref_four")
+                assert ref.id == 4 and not created
+            finally:
+                GlobalConnection.disable_write()
+            assert sqls == []
+            Refs.clear_cache()
+            assert Refs.fetch(4).name == "ref_four"
+            assert len(sqls) == 1
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pytest
+
+from valarpy import Valar
+from valarpy.micromodels import ValarTableTypeError
+
+
+@pytest.fixture(scope="module")
+def setup():
+    with Valar(Path(__file__).parent / "resources" / "connection.json") as valar:
+        yield valar
+
+
+class TestSnapshot:
+    def test_snapshot(self, setup, tmp_path):
+        from valarpy.model import Features, Refs
+        from valarpy.snapshot import snapshot
+
+        path = tmp_path / "valar.sqlite"
+        counts = snapshot(path, [Refs.fetch("ref_four"), Features])
+        assert counts["refs"] == 1
+        assert path.exists()
+        with pytest.raises(FileExistsError):
+            snapshot(path, [Refs])
+        with pytest.raises(ValarTableTypeError):
+            snapshot(tmp_path / "other.sqlite", ["ref_four"])
+        with Valar({"snapshot": str(path)}) as valar:
+            assert valar.is_snapshot
+            assert not valar.is_pooled
+            assert Refs.fetch(4).name == "ref_four"
+            refs = Refs.fetch_all_or_none(["ref_four", "ref_five"])
+            assert [None if r is None else r.id for r in refs] == [4, None]
+            assert valar.stats()["n_queries"] > 0
+        # the server's connection is bound again, and its cache is not the snapshot's
+        Refs.clear_cache()
+        n_queries = setup.stats()["n_queries"]
+        with setup.tracking() as log:
+            assert Refs.fetch("ref_four").id == 4
+        assert log.stats()["n_queries"] == 1
+        assert setup.stats()["n_queries"] == n_queries + 1
+
+    def test_regexp(self):
+        from valarpy.snapshot import _regexp
+
+        assert _regexp("^ref_", "ref_four")
+        assert not _regexp("^ref_", "REF_four")
+        assert not _regexp("five$", "ref_four")
+        assert _regexp("x", None) is None
+
+    def test_missing(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            Valar({"snapshot": str(tmp_path / "missing.sqlite")}).open()
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
@@ -0,0 +1,70 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from valarpy import Valar
+from valarpy.wells import NULL, WellTable
+
+
+@pytest.fixture(scope="module")
+def setup():
+    with Valar(Path(__file__).parent / "resources" / "connection.json"):
+        yield
+
+
+def _table() -> WellTable:
+    wells = dict(
+        id=[1, 2, 3, 4],
+        run_id=[10, 10, 11, 11],
+        well_index=[1, 2, 1, 2],
+        n=[5, 5, 5, 0],
+        age=[7, NULL, 7, 7],
+        control_type_id=[NULL, 1, NULL, 1],
+        variant_id=[NULL, NULL, NULL, NULL],
+    )
+    treatments = dict(well_id=[1, 1, 3], batch_id=[20, 21, 20], micromolar_dose=[1.0, np.nan, 2.0])
+    features = dict(id=[100, 101], well_id=[2, 4], type_id=[1, 1])
+    return WellTable(wells, treatments, features)
+
+
+class TestWells:
+    def test_filter(self):
+        table = _table()
+        assert table["age"].dtype == np.int32
+        controls = table.filter(control_type_id=NULL)
+        assert list(controls.ids) == [1, 3]
+        assert list(controls.treatments["batch_id"]) == [20, 21, 20]
+        assert len(controls.features["id"]) == 0
+        assert list(table.filter(table["age"] > 0, run_id=[11]).ids) == [3, 4]
+        assert list(table.treated_with([21])) == [True, False, False, False]
+        with pytest.raises(ValueError):
+            table.filter(nonexistent=1)
+
+    def test_group_by(self):
+        groups = _table().group_by("run_id")
+        assert list(groups.keys()) == [10, 11]
+        assert list(groups[10].treatments["well_id"]) == [1, 1]
+        assert list(groups[11].features["id"]) == [101]
+        groups = _table().group_by("run_id", "control_type_id")
+        assert list(groups[(11, 1)].ids) == [4]
+
+    def test_frame(self):
+        table = _table()
+        df = table.to_frame()
+        assert str(df["id"].dtype) == "int64"
+        assert df["age"].isna().tolist() == [False, True, False, False]
+        again = WellTable.from_frame(df, table.treatments_frame(), table.features_frame())
+        assert list(again["age"]) == list(table["age"])
+        assert np.isnan(again.treatments["micromolar_dose"][1])
+        with pytest.raises(ValueError):
+            WellTable.from_frame(df.drop(columns=["n"]))
+
+    def test_load(self, setup):
+        table = WellTable.load(run=-1)
+        assert len(table) == 0
+        assert table.group_by("run_id") == {}
+
+
+if __name__ == ["__main__"]:
+    pytest.main()
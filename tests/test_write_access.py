@@ -1,4 +1,5 @@
 import json
+import threading
 from pathlib import Path
 
 import pytest
@@ -66,6 +67,77 @@ class TestModel:
                     except Exception:  # nosec
                         pass
 
+    def test_write_is_thread_local(self):
+        with opened(CONFIG_DATA) as model:
+            backend = model.conn.backend
+            from valarpy.model import Refs
+
+            errors = []
+
+            def try_write():
+                try:
+                    Refs(name="test_write_is_thread_local").save()
+                except WriteNotEnabledError as e:
+                    errors.append(e)
+
+            try:
+                backend.enable_write()
+                thread = threading.Thread(target=try_write)
+                thread.start()
+                thread.join()
+                assert len(errors) == 1
+                assert backend.is_write_enabled()
+            finally:
+                backend.disable_write()
+            assert not backend.is_write_enabled()
+
+    def test_deferred(self):
+        with opened(CONFIG_DATA) as model:
+            backend = model.conn.backend
+            from valarpy.model import ConfigFiles
+
+            try:
+                backend.enable_write()
+                with model.conn.rolling_back():
+                    for text in ["a = 1", "a = 2"]:
+                        ConfigFiles(toml_text=text, text_sha1=text.encode("utf8")).save()
+                    rows = ConfigFiles.list_where(ConfigFiles.toml_text << ["a = 1", "a = 2"])
+                    assert "toml_text" not in rows[0].get_data()
+                    # loaded on access
+                    assert rows[0].toml_text == "a = 1"
+                    assert not rows[0].is_dirty()
+                    ConfigFiles.load_deferred(rows, "toml_text")
+                    assert rows[1].get_data()["toml_text"] == "a = 2"
+            finally:
+                backend.disable_write()
+
+    def test_bulk_load(self):
+        import pandas as pd
+
+        with opened(CONFIG_DATA) as model:
+            backend = model.conn.backend
+            from valarpy.model import Refs
+
+            with pytest.raises(WriteNotEnabledError):
+                Refs.bulk_load([("test_bulk_load",)], fields=["name"])
+            try:
+                backend.enable_write()
+                with model.conn.rolling_back():
+                    names = [f"test_bulk_load_{i}" for i in range(5)]
+                    ids = Refs.bulk_load(
+                        [(name,) for name in names], fields=[Refs.name], batch_size=2
+                    )
+                    assert [ref.name for ref in Refs.fetch_all(ids)] == names
+                    df = pd.DataFrame(dict(name=["test_bulk_load_df"], description=[None]))
+                    ids = Refs.bulk_load(df)
+                    assert Refs.fetch(ids[0]).description is None
+                    with pytest.raises(ValueError):
+                        Refs.bulk_load([("test_bulk_load",)])
+                # rows read in the transaction were not cached
+                assert Refs.fetch_or_none(names[0]) is None
+            finally:
+                backend.disable_write()
+
 
 if __name__ == ["__main__"]:
     pytest.main()
@@ -2,16 +2,13 @@
 Project metadata and convenience functions.
 """
 
+import functools
 import logging
-from contextlib import contextmanager
-from importlib.metadata import PackageNotFoundError
-from importlib.metadata import metadata as __load
+import time
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
-from typing import Generator, List, Mapping, Union
+from typing import TYPE_CHECKING, Any, Generator, List, Mapping, Optional, Union
 
-import peewee
-
-from valarpy.connection import Valar
 from valarpy.micromodels import (
     ValarLookupError,
     ValarTableTypeError,
@@ -19,24 +16,48 @@ from valarpy.micromodels import (
     WriteNotEnabledError,
 )
 
+if TYPE_CHECKING:  # pragma: no cover
+    from valarpy.connection import Valar
+
 pkg = Path(__file__).absolute().parent.name
 logger = logging.getLogger(pkg)
-_metadata = None
-try:
-    _metadata = __load(Path(__file__).absolute().parent.name)
-    __status__ = "Development"
-    __copyright__ = "Copyright 2016–2021"
-    __date__ = "2020-12-29"
-    __uri__ = _metadata["home-page"]
-    __title__ = _metadata["name"]
-    __summary__ = _metadata["summary"]
-    __license__ = _metadata["license"]
-    __version__ = _metadata["version"]
-    __author__ = _metadata["author"]
-    __maintainer__ = _metadata["maintainer"]
-    __contact__ = _metadata["maintainer"]
-except PackageNotFoundError:  # pragma: no cover
-    logger.error(f"Could not load package metadata for {pkg}. Is it installed?")
+__status__ = "Development"
+__copyright__ = "Copyright 2016–2021"
+__date__ = "2020-12-29"
+# loaded on first access by __getattr__, so that importing valarpy stays fast
+_METADATA_KEYS = dict(
+    __uri__="home-page",
+    __title__="name",
+    __summary__="summary",
+    __license__="license",
+    __version__="version",
+    __author__="author",
+    __maintainer__="maintainer",
+    __contact__="maintainer",
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _metadata() -> Optional[Mapping[str, str]]:
+    from importlib.metadata import PackageNotFoundError
+    from importlib.metadata import metadata as load
+
+    try:
+        return load(pkg)
+    except PackageNotFoundError:  # pragma: no cover
+        logger.error(f"Could not load package metadata for {pkg}. Is it installed?")
+        return None
+
+
+def __getattr__(name: str) -> Any:
+    # PEP 562: defer importing peewee and PyMySQL (through Valar) and reading package metadata
+    if name == "Valar":
+        from valarpy.connection import Valar
+
+        return Valar
+    if name in _METADATA_KEYS and _metadata() is not None:
+        return _metadata()[_METADATA_KEYS[name]]
+    raise AttributeError(f"module {__name__} has no attribute {name}")
 
 
 def new_model():
@@ -68,6 +89,8 @@ def opened(
     Yields:
         The ``model`` module, with an attached ``.conn`` of type ``Valar``
     """
+    from valarpy.connection import Valar
+
     with Valar(config) as valar:
         from valarpy import model
 
@@ -75,34 +98,105 @@ def opened(
         yield model
 
 
-def valarpy_info() -> Generator[str, None, None]:
+@asynccontextmanager
+async def aopened(
+    config: Union[
+        None, str, Path, List[Union[str, Path, None]], Mapping[str, Union[str, int]]
+    ] = None,
+    max_workers: Optional[int] = None,
+):
+    """
+    Async context manager. Opens a connection and returns the model.
+    Closes the connection, including those of worker threads, when the block exits.
+    Use the async methods of the models, like ``afetch``, to avoid blocking the event loop.
+
+    Examples:
+        async with valarpy.aopened() as model:
+            refs = await model.Refs.afetch_all(["ref_four", 1])
+
+    Args:
+        config: Passed to ``Valar.__init__``
+        max_workers: The number of worker threads that run queries (see ``valarpy.aio``);
+                     defaults to ``max_connections`` if pooled
+
+    Yields:
+        The ``model`` module, with an attached ``.conn`` of type ``Valar``
+    """
+    from valarpy import aio
+    from valarpy.connection import Valar
+
+    valar = Valar(config)
+    if max_workers is None and valar.is_pooled:
+        max_workers = valar._pool_config.get("max_connections")
+    if max_workers is not None:
+        aio.set_max_workers(max_workers)
+    # open and bind in this task's context, so that worker threads inherit the connection
+    valar.open()
+    try:
+        from valarpy import model
+
+        model.conn = valar
+        yield model
+    finally:
+        await aio.close_workers()
+        valar.close()
+
+
+def valarpy_info(
+    exact: bool = False, max_workers: Optional[int] = None
+) -> Generator[str, None, None]:
     """
-    Gets lines describing valarpy metadata and database row counts.
+    Gets lines describing valarpy metadata and database row counts, with the time taken per table.
     Useful for verifying that the schema matches the valarpy model,
     and for printing info.
+    By default, the row counts are InnoDB estimates (marked with ``~``), which makes this a cheap health check.
+    See ``valarpy.info.table_stats``.
+
+    Args:
+        exact: Count rows exactly (concurrently), which scans every table
+        max_workers: The number of tables to check concurrently
 
     Yields:
         Lines of free text
 
     Raises:
-        InterfaceError: On some connection and schema mismatch errors
+        InterfaceError: On some connection errors
     """
-    if _metadata is not None:
-        yield "{} (v{})".format(_metadata["name"], _metadata["version"])
+    from valarpy.connection import Valar
+    from valarpy.info import DEFAULT_MAX_WORKERS, table_stats
+
+    metadata = _metadata()
+    if metadata is not None:
+        yield "{} (v{})".format(metadata["name"], metadata["version"])
     else:
         yield "Unknown project info"
     yield "Connecting..."
-    with opened(Valar.get_preferred_paths()) as m:
+    with opened(Valar.get_preferred_paths()):
         yield "Connected."
         yield ""
-        yield "Table                       N Rows"
-        yield "----------------------------------"
-        for sub in m.BaseModel.__subclasses__():
-            count = sub.select(peewee.fn.COUNT(sub.id).alias("count")).first()
-            yield f"{sub.__name__:<25} = {count.count}"
-        yield "----------------------------------"
+        yield "Table                          N Rows   Time (ms)"
+        yield "-------------------------------------------------"
+        t0 = time.monotonic()
+        stats = table_stats(exact=exact, max_workers=max_workers or DEFAULT_MAX_WORKERS)
+        elapsed = time.monotonic() - t0
+        for stat in stats:
+            if stat.error is not None:
+                count = "ERROR"
+            elif stat.n_rows is None:
+                count = "?"
+            else:
+                count = ("" if stat.exact else "~") + str(stat.n_rows)
+            yield f"{stat.name:<25} {count:>12} {1000 * stat.seconds:>11.1f}"
+        yield "-------------------------------------------------"
+        yield f"{len(stats)} tables in {1000 * elapsed:.1f} ms"
         yield ""
-    yield "All valarpy queries succeeded."
+        errors = [stat for stat in stats if stat.error is not None]
+        for stat in errors:
+            yield f"{stat.name} failed: {stat.error}"
+    if len(errors) == 0:
+        yield "All valarpy queries succeeded."
+    else:
+        yield f"Queries failed on {len(errors)} tables."
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -110,4 +204,4 @@ if __name__ == "__main__":  # pragma: no cover
         print(line)
 
 
-__all__ = ["Valar", "new_model", "opened", "opened", "valarpy_info"]
+__all__ = ["Valar", "aopened", "new_model", "opened", "opened", "valarpy_info"]
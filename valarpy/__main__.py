@@ -0,0 +1,105 @@
+"""
+Command-line interface.
+
+Examples:
+    python -m valarpy
+    python -m valarpy info --exact
+    python -m valarpy export Wells lake/wells --row-group-size 200000
+    python -m valarpy snapshot my_project.sqlite Projects:my_project Features Refs
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+from valarpy import Valar, opened, valarpy_info
+from valarpy.export import DEFAULT_ROW_GROUP_SIZE, DEFAULT_ROW_GROUPS_PER_FILE
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="valarpy", description="Python ORM to talk to Valar.")
+    commands = parser.add_subparsers(dest="command")
+    info = commands.add_parser("info", help="Show package info and table row counts (the default)")
+    info.add_argument(
+        "--exact", action="store_true", help="Count rows exactly instead of estimating"
+    )
+    info.add_argument("--max-workers", type=int, help="The number of tables to check concurrently")
+    export = commands.add_parser("export", help="Export a table to Parquet files")
+    export.add_argument("table", help="A model name (like Wells) or table name (like wells)")
+    export.add_argument("directory", type=Path, help="The output directory")
+    export.add_argument("--config", type=Path, help="The connection config JSON file")
+    export.add_argument("--row-group-size", type=int, default=DEFAULT_ROW_GROUP_SIZE)
+    export.add_argument("--row-groups-per-file", type=int, default=DEFAULT_ROW_GROUPS_PER_FILE)
+    export.add_argument(
+        "--restart", action="store_true", help="Start over instead of resuming from the watermark"
+    )
+    snap = commands.add_parser("snapshot", help="Copy rows into a local SQLite file")
+    snap.add_argument("path", type=Path, help="The SQLite file to create")
+    snap.add_argument(
+        "roots",
+        nargs="+",
+        help="Model:key (like Projects:my_project) for a row and the rows under it, or Model for a table",
+    )
+    snap.add_argument("--config", type=Path, help="The connection config JSON file")
+    snap.add_argument("--blobs", action="store_true", help="Also copy large blob columns")
+    return parser
+
+
+def main(args: Optional[Sequence[str]] = None) -> int:
+    """
+    Runs the command-line interface.
+
+    Args:
+        args: The command-line arguments, excluding the program name; defaults to ``sys.argv[1:]``
+
+    Returns:
+        The exit code
+    """
+    parser = _parser()
+    ns = parser.parse_args(args)
+    if ns.command is None or ns.command == "info":
+        exact = getattr(ns, "exact", False)
+        for line in valarpy_info(exact=exact, max_workers=getattr(ns, "max_workers", None)):
+            print(line)
+        return 0
+    config = Valar.get_preferred_paths() if ns.config is None else ns.config
+    with opened(config) as model:
+        models = {sub.__name__: sub for sub in model.BaseModel.__subclasses__()}
+        models.update({sub._meta.table_name: sub for sub in models.values()})
+        if ns.command == "snapshot":
+            return _snapshot(parser, ns, models)
+        from valarpy.export import export_parquet
+
+        if ns.table not in models:
+            parser.error(f"Unknown table {ns.table}")
+        result = export_parquet(
+            models[ns.table],
+            ns.directory,
+            row_group_size=ns.row_group_size,
+            row_groups_per_file=ns.row_groups_per_file,
+            resume=not ns.restart,
+        )
+    print(f"Exported {result.n_rows} rows through id {result.last_id} to {len(result.files)} files")
+    return 0
+
+
+def _snapshot(
+    parser: argparse.ArgumentParser, ns: argparse.Namespace, models: Dict[str, Any]
+) -> int:
+    from valarpy.snapshot import snapshot
+
+    roots = []
+    for root in ns.roots:
+        table, _, key = root.partition(":")
+        if table not in models:
+            parser.error(f"Unknown table {table}")
+        model = models[table]
+        roots.append(model if key == "" else model.fetch(int(key) if key.isdigit() else key))
+    counts = snapshot(ns.path, roots, blobs=ns.blobs)
+    print(f"Copied {sum(counts.values())} rows from {len(counts)} tables to {ns.path}")
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
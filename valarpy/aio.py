@@ -0,0 +1,172 @@
+"""
+Support for asyncio.
+Blocking queries run on a bounded pool of worker threads, so concurrent coroutines overlap their latency.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncGenerator, Callable, Iterator, List, Optional, Tuple
+
+import peewee
+
+from valarpy.connection import GlobalConnection
+
+logger = logging.getLogger("valarpy")
+
+DEFAULT_MAX_WORKERS = 16
+_executor: Optional[ThreadPoolExecutor] = None
+_max_workers = DEFAULT_MAX_WORKERS
+_lock = threading.Lock()
+# connections that worker threads keep open between calls (without a pool), closed by close_workers
+_worker_connections: List[Tuple[peewee.Database, Any]] = []
+
+
+def set_max_workers(max_workers: int) -> None:
+    """
+    Sets the number of worker threads, which limits the number of concurrent queries.
+    With a connection pool, this should not exceed the pool's ``max_connections``.
+    Running calls finish on the previous threads.
+    """
+    global _executor, _max_workers
+    with _lock:
+        _max_workers = max_workers
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Gets the executor that runs blocking calls, creating it if needed.
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(_max_workers, thread_name_prefix="valarpy")
+        return _executor
+
+
+async def run(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Runs a blocking function on a worker thread.
+    The function sees the caller's database and write flag (see ``GlobalConnection``).
+    With a connection pool, the worker returns its connection to the pool when the function finishes;
+    otherwise, each worker keeps its own connection open until ``close_workers``.
+
+    Args:
+        fn: Any function
+        args: Positional arguments to ``fn``
+        kwargs: Keyword arguments to ``fn``
+
+    Returns:
+        The value returned by ``fn``
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, _call, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
+
+
+async def close_workers() -> None:
+    """
+    Stops the worker threads after their running calls finish, and closes the connections they kept open.
+    Later calls start new threads. ``valarpy.aopened`` calls this on exit.
+    """
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        # wait on another thread, so that the event loop keeps running
+        await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+    with _lock:
+        connections = list(_worker_connections)
+        _worker_connections.clear()
+    for database, connection in connections:
+        try:
+            # noinspection PyProtectedMember
+            database._close(connection)
+        except Exception:
+            logger.debug("Failed to close a worker connection", exc_info=True)
+
+
+async def aiterate(query: peewee.Query, chunk_size: int = 1000) -> AsyncGenerator[Any, None]:
+    """
+    Iterates over the rows of a query without blocking the event loop.
+    The query runs and its rows are read on a thread dedicated to this iteration,
+    since a cursor (and a SQLite connection) belongs to one thread.
+    That thread's connection is closed (or returned to the pool) when iteration finishes.
+
+    Examples:
+        async for ref in aiterate(Refs.select()):
+            print(ref.name)
+
+    Args:
+        query: Any peewee query; for example, ``Wells.select().where(Wells.run == 5)``
+        chunk_size: The number of rows to read on a worker thread at a time
+
+    Yields:
+        The rows of the query
+    """
+    context = contextvars.copy_context()
+    executor = ThreadPoolExecutor(1, thread_name_prefix="valarpy-iter")
+    loop = asyncio.get_running_loop()
+    try:
+        iterator = await loop.run_in_executor(executor, context.run, query.iterator)
+        while True:
+            chunk = await loop.run_in_executor(
+                executor, context.run, _next_chunk, iterator, chunk_size
+            )
+            if len(chunk) == 0:
+                return
+            for row in chunk:
+                yield row
+    finally:
+        # runs after any pending chunk, without waiting
+        executor.submit(context.run, _close_connection)
+        executor.shutdown(wait=False)
+
+
+def _call(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    try:
+        return GlobalConnection.call(fn, *args, **kwargs)
+    finally:
+        _remember_connections()
+
+
+def _remember_connections() -> None:
+    # records the connections that this worker keeps open, once each
+    database = GlobalConnection.get_database()
+    if database is None:
+        return
+    for db in [database, *getattr(database, "replicas", [])]:
+        state = db._state
+        if not db.is_closed() and getattr(state, "valarpy_worker_conn", None) is not state.conn:
+            state.valarpy_worker_conn = state.conn
+            with _lock:
+                _worker_connections.append((db, state.conn))
+
+
+def _close_connection() -> None:
+    database = GlobalConnection.get_database()
+    if database is not None and not database.is_closed():
+        database.close()
+
+
+def _next_chunk(iterator: Iterator[Any], chunk_size: int) -> List[Any]:
+    return list(itertools.islice(iterator, chunk_size))
+
+
+__all__ = [
+    "DEFAULT_MAX_WORKERS",
+    "aiterate",
+    "close_workers",
+    "get_executor",
+    "run",
+    "set_max_workers",
+]
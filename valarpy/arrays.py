@@ -0,0 +1,424 @@
+"""
+Decoding of Valar's binary columns into NumPy arrays.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from numbers import Integral
+from pathlib import Path, PurePath
+from typing import TYPE_CHECKING, Dict, Generator, Iterable, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+import peewee
+
+from valarpy.caching import LruCache
+from valarpy.connection import streaming_cursor
+from valarpy.micromodels import ValarLookupError, ValarTableTypeError
+
+if TYPE_CHECKING:
+    from valarpy.blobs import BlobCache
+
+PathLike = Union[str, PurePath, os.PathLike]
+
+# the number of rows whose blobs are requested from a BlobCache at once
+_BLOB_CHUNK_SIZE = 256
+
+# Valar stores every multi-byte value big-endian
+_DTYPES = {
+    "byte": np.dtype("i1"),
+    "short": np.dtype(">i2"),
+    "int": np.dtype(">i4"),
+    "float": np.dtype(">f4"),
+    "double": np.dtype(">f8"),
+    "unsigned_byte": np.dtype("u1"),
+    "unsigned_short": np.dtype(">u2"),
+    "unsigned_int": np.dtype(">u4"),
+    "unsigned_float": np.dtype(">f4"),
+    "unsigned_double": np.dtype(">f8"),
+    "utf8_char": np.dtype("S1"),
+    "long": np.dtype(">i8"),
+    "unsigned_long": np.dtype(">u8"),
+}
+# for blobs of data type other, which have no defined encoding
+_RAW = np.dtype("u1")
+
+
+def dtype_of(data_type: str) -> np.dtype:
+    """
+    Gets the NumPy dtype, including byte order, of a ``data_type`` enum value.
+    These are the values of ``Features.data_type`` and ``Sensors.data_type``.
+
+    Args:
+        data_type: A value like ``float`` or ``unsigned_short``
+
+    Returns:
+        The dtype that ``np.frombuffer`` should use to decode the blob
+
+    Raises:
+        ValueError: If the data type is ``other`` or is unknown
+    """
+    if data_type not in _DTYPES:
+        raise ValueError(f"Cannot decode blobs with data type {data_type}")
+    return _DTYPES[data_type]
+
+
+class FeatureMatrix(NamedTuple):
+    """
+    A wells × frames matrix of one feature, with the ID of the well for each row.
+    Rows shorter than the longest row, or NULL, are padded with NaN.
+    """
+
+    data: np.ndarray
+    well_ids: np.ndarray
+
+
+def feature_matrix(
+    feature: Union[int, str, peewee.Model],
+    runs: Optional[Iterable[Union[int, str, peewee.Model]]] = None,
+    wells: Optional[Iterable[Union[int, peewee.Model]]] = None,
+    blob_cache: Optional[BlobCache] = None,
+) -> FeatureMatrix:
+    """
+    Loads one feature for many wells into a single preallocated float32 matrix.
+    The blobs are read as raw tuples by a single query (plus one to look up the feature if needed)
+    from an unbuffered cursor, and decoded with ``np.frombuffer`` without creating a model instance per row.
+    The row and frame counts are computed by the database with window functions.
+
+    Examples:
+        data, well_ids = feature_matrix("MI", runs=[12, 13])
+
+    Args:
+        feature: A ``Features`` instance, ID, or name
+        runs: Load every well in these runs (instances, IDs, or unique names)
+        wells: Load only these wells (instances or IDs)
+        blob_cache: Read the blobs through this cache, transferring only those not already on disk
+
+    Returns:
+        A ``FeatureMatrix`` with rows ordered by well ID
+
+    Raises:
+        ValueError: If neither or both of ``runs`` and ``wells`` were passed,
+                    or if the feature's data type is not numeric
+    """
+    from valarpy.model import Features, Runs, WellFeatures, Wells
+
+    if (runs is None) == (wells is None):
+        raise ValueError("Pass exactly one of runs or wells")
+    feature = Features.fetch(feature)
+    source_dtype = dtype_of(feature.data_type)
+    if source_dtype.kind not in "iuf":
+        raise ValueError(f"Feature {feature.name} has non-numeric type {feature.data_type}")
+    # with a cache, select the digests instead of the blobs
+    query = WellFeatures.select(
+        WellFeatures.well,
+        WellFeatures.floats if blob_cache is None else WellFeatures.sha1,
+        WellFeatures.id,
+        peewee.fn.COUNT(peewee.SQL("*")).over().alias("n_rows"),
+        peewee.fn.MAX(peewee.fn.LENGTH(WellFeatures.floats)).over().alias("max_bytes"),
+    ).where(WellFeatures.type == feature.id)
+    if runs is not None:
+        query = query.join(Wells).where(Wells.run << _to_ids(Runs, runs))
+    else:
+        query = query.where(WellFeatures.well << _to_ids(Wells, wells))
+    rows = _iter_blob_rows(query.order_by(WellFeatures.well), blob_cache, WellFeatures.floats)
+    data, well_ids = np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64)
+    for i, (well_id, blob, _, n_rows, max_bytes) in enumerate(rows):
+        if i == 0:
+            # MAX is NULL if every blob is
+            n_cols = 0 if max_bytes is None else max_bytes // source_dtype.itemsize
+            data = np.full((n_rows, n_cols), np.nan, dtype=np.float32)
+            well_ids = np.empty(n_rows, dtype=np.int64)
+        if blob is not None:
+            values = np.frombuffer(blob, dtype=source_dtype)
+            data[i, : len(values)] = values
+        well_ids[i] = well_id
+    return FeatureMatrix(data, well_ids)
+
+
+def _iter_blob_rows(
+    query: peewee.ModelSelect, blob_cache: Optional[BlobCache], field: peewee.Field
+) -> Generator[tuple, None, None]:
+    """
+    Iterates over the rows of a query as tuples, with a blob (or its digest) in position 1.
+    Without a cache, the rows are read from an unbuffered cursor (see ``streaming_cursor``),
+    so only one blob is held at a time, and the connection cannot run other queries until the rows are read.
+    With a cache, the digests are read at once, since the cache may query for the blobs it does not have.
+    """
+    query = query.tuples()
+    if blob_cache is not None:
+        yield from _with_cached_blobs(query.iterator(), blob_cache, field)
+        return
+    database = query.model._meta.database
+    if isinstance(database, peewee.DatabaseProxy):
+        database = database.obj
+    with streaming_cursor(database, query) as cursor:
+        yield from query._get_cursor_wrapper(cursor).iterator()
+
+
+def _with_cached_blobs(
+    rows: Iterable[tuple], blob_cache: BlobCache, field: peewee.Field
+) -> Generator[tuple, None, None]:
+    """
+    Replaces the digest in position 1 of each row with its blob, given the row ID in position 2.
+    Blobs are requested in chunks so that few are held (or memory-mapped) at once.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = [row for _, row in zip(range(_BLOB_CHUNK_SIZE), rows)]
+        if len(chunk) == 0:
+            return
+        blobs = blob_cache.get_all(field, [(row[2], row[1]) for row in chunk])
+        for row, blob in zip(chunk, blobs):
+            yield (row[0], blob, *row[2:])
+
+
+class SensorSeries(NamedTuple):
+    """
+    The decoded data of one sensor in one run.
+    """
+
+    run_id: int
+    sensor: peewee.Model
+    values: np.ndarray
+
+    @property
+    def times(self) -> Optional[np.ndarray]:
+        """
+        See ``sensor_time_axis``.
+        """
+        return sensor_time_axis(self.sensor, len(self.values))
+
+    @property
+    def time_unit(self) -> Optional[str]:
+        """
+        See ``sensor_time_unit``.
+        """
+        return sensor_time_unit(self.sensor)
+
+
+def sensor_time_unit(sensor: peewee.Model) -> Optional[str]:
+    """
+    Gets the unit of a sensor's time axis from its ``blob_type``.
+
+    Args:
+        sensor: A ``Sensors`` instance
+
+    Returns:
+        ``ms`` or ``frames``, or None if the values are not evenly sampled
+    """
+    return {"every_n_milliseconds": "ms", "every_n_frames": "frames"}.get(sensor.blob_type)
+
+
+def sensor_time_axis(sensor: peewee.Model, n_values: int) -> Optional[np.ndarray]:
+    """
+    Computes the time of each value of a sensor, starting at 0.
+    Only sensors sampled every ``n_between`` milliseconds or frames have a time axis;
+    the values of other blob types (like ``assay_start`` or ``arbitrary``) carry their own timing.
+
+    Args:
+        sensor: A ``Sensors`` instance
+        n_values: The number of decoded values
+
+    Returns:
+        An array of times in the unit given by ``sensor_time_unit``, or None
+    """
+    if sensor_time_unit(sensor) is None or sensor.n_between is None:
+        return None
+    return np.arange(n_values, dtype=np.int64) * sensor.n_between
+
+
+def iter_sensor_data(
+    runs: Iterable[Union[int, str, peewee.Model]],
+    sensors: Optional[Iterable[Union[int, str, peewee.Model]]] = None,
+    runs_per_query: int = 1,
+    blob_cache: Optional[BlobCache] = None,
+) -> Generator[SensorSeries, None, None]:
+    """
+    Lazily decodes sensor data for many runs.
+    Each blob is decoded with ``np.frombuffer`` using the dtype of its sensor's ``data_type``,
+    except that the blobs of sensors with data type ``other`` are returned as raw bytes (dtype ``u1``).
+    Only ``runs_per_query`` runs are requested at a time,
+    and without a ``blob_cache``, their rows are read from an unbuffered server-side cursor,
+    so memory use depends on the size of one blob, not on the number of runs.
+    The connection then cannot run other queries until the generator finishes or is closed;
+    to run queries while iterating, do so from another thread, which uses its own connection.
+
+    Examples:
+        for run_id, sensor, values in iter_sensor_data([12, 13]):
+            print(run_id, sensor.name, values.mean())
+
+    Args:
+        runs: Runs as instances, IDs, or unique names
+        sensors: Restrict to these sensors (instances, IDs, or names); all sensors by default
+        runs_per_query: The number of runs to fetch in each query
+        blob_cache: Read the blobs through this cache, transferring only those not already on disk
+
+    Yields:
+        A ``SensorSeries`` ``(run_id, sensor, values)`` per row of ``sensor_data``, ordered by run
+    """
+    from valarpy.model import Runs, SensorData, Sensors
+
+    run_ids = _to_ids(Runs, runs)
+    sensor_query = Sensors.select()
+    if sensors is not None:
+        sensor_query = sensor_query.where(Sensors.id << _to_ids(Sensors, sensors))
+    sensors = {sensor.id: sensor for sensor in sensor_query}
+    dtypes = {
+        sensor.id: _RAW if sensor.data_type == "other" else dtype_of(sensor.data_type)
+        for sensor in sensors.values()
+    }
+    for i in range(0, len(run_ids), runs_per_query):
+        query = (
+            SensorData.select(
+                SensorData.run,
+                SensorData.floats if blob_cache is None else SensorData.floats_sha1,
+                SensorData.id,
+                SensorData.sensor,
+            )
+            .where(SensorData.run << run_ids[i : i + runs_per_query])
+            .where(SensorData.sensor << list(sensors.keys()))
+            .order_by(SensorData.run, SensorData.sensor)
+        )
+        for run_id, blob, _, sensor_id in _iter_blob_rows(query, blob_cache, SensorData.floats):
+            yield SensorSeries(
+                run_id, sensors[sensor_id], np.frombuffer(blob, dtype=dtypes[sensor_id])
+            )
+
+
+class StimulusFrameCache:
+    """
+    A cache of decoded stimulus frames, keyed by ``Assays.frames_sha1``.
+    Because those frames are immutable and content-addressed, entries never need to be invalidated.
+    Frames are held in memory up to a byte budget,
+    and are optionally also written to (and read from) a directory of ``.npz`` files.
+    The first lookup of an assay fetches the frames of all its stimuli in one query;
+    later lookups by the same instance, ID, or name need no queries.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, directory: Optional[PathLike] = None):
+        """
+        Constructor.
+
+        Args:
+            max_bytes: The maximum number of bytes of decoded frames to hold in memory
+            directory: A directory for a persistent cache, created if needed; disabled if None
+        """
+        self._memory = LruCache(
+            max_bytes=max_bytes, sizeof=lambda frames: sum(a.nbytes for a in frames.values())
+        )
+        self._directory = None if directory is None else Path(directory)
+        if self._directory is not None:
+            self._directory.mkdir(parents=True, exist_ok=True)
+        # maps assay IDs and names to hex digests
+        self._digests: Dict[Union[int, str], str] = {}
+
+    def get(self, assay: Union[int, str, peewee.Model]) -> Dict[int, np.ndarray]:
+        """
+        Gets the frames of every stimulus in an assay.
+        Each frame is a single unsigned byte, so the arrays have dtype ``uint8``.
+        The arrays are shared by the cache and are read-only.
+
+        Args:
+            assay: An ``Assays`` instance, ID, or unique name
+
+        Returns:
+            A dict mapping each stimulus ID to its frames
+
+        Raises:
+            ValarLookupError: If the assay does not exist
+        """
+        from valarpy.model import Assays
+
+        if isinstance(assay, Assays):
+            digest = assay.frames_sha1.hex()
+        elif isinstance(assay, (Integral, str)):
+            digest = self._digests.get(int(assay) if isinstance(assay, Integral) else assay)
+        else:
+            raise TypeError(f"Cannot get frames for {assay} of type {type(assay)}")
+        frames = None if digest is None else self._get_cached(digest)
+        if frames is None:
+            digest, frames = self._fetch(assay)
+            self._memory.put(digest, frames)
+            if self._directory is not None:
+                self._write(digest, frames)
+        return dict(frames)
+
+    def info(self) -> Dict[str, int]:
+        """
+        Gets statistics about the in-memory cache; see ``LruCache.info``.
+        """
+        return self._memory.info()
+
+    def _get_cached(self, digest: str) -> Optional[Dict[int, np.ndarray]]:
+        frames = self._memory.get(digest)
+        if frames is None and self._directory is not None:
+            path = self._directory / f"{digest}.npz"
+            if path.exists():
+                with np.load(path) as npz:
+                    frames = {int(k): npz[k] for k in npz.files}
+                for array in frames.values():
+                    array.flags.writeable = False
+                self._memory.put(digest, frames)
+        return frames
+
+    def _fetch(self, assay: Union[int, str, peewee.Model]) -> Tuple[str, Dict[int, np.ndarray]]:
+        from valarpy.model import Assays, StimulusFrames
+
+        query = Assays.select(
+            Assays.id,
+            Assays.name,
+            Assays.frames_sha1,
+            StimulusFrames.stimulus,
+            StimulusFrames.frames,
+        ).join(StimulusFrames, peewee.JOIN.LEFT_OUTER)
+        if isinstance(assay, Assays):
+            query = query.where(Assays.id == assay.id)
+        elif isinstance(assay, str):
+            query = query.where(Assays.name == assay)
+        else:
+            query = query.where(Assays.id == int(assay))
+        digest, frames = None, {}
+        for assay_id, name, sha1, stimulus_id, blob in query.tuples():
+            digest = bytes(sha1).hex()
+            self._digests[assay_id] = self._digests[name] = digest
+            if stimulus_id is not None:
+                frames[stimulus_id] = np.frombuffer(blob, dtype=np.uint8)
+        if digest is None:
+            raise ValarLookupError(f"Could not find assay {assay}")
+        return digest, frames
+
+    def _write(self, digest: str, frames: Dict[int, np.ndarray]) -> None:
+        path = self._directory / f"{digest}.npz"
+        # write then rename so that concurrent readers never see a partial file
+        tmp = path.with_name(f".{digest}.{os.getpid()}.{threading.get_ident()}.npz")
+        np.savez(tmp, **{str(k): v for k, v in frames.items()})
+        os.replace(tmp, path)
+
+
+def _to_ids(model, things: Iterable[Union[int, str, peewee.Model]]) -> list:
+    """
+    Converts instances, IDs, and unique names to IDs, querying only if names were passed.
+    """
+    things = list(things)
+    for thing in things:
+        if isinstance(thing, peewee.Model) and not isinstance(thing, model):
+            raise ValarTableTypeError(
+                f"Got a {thing.__class__.__name__} instead of {model.__name__}"
+            )
+    if any(isinstance(thing, str) for thing in things):
+        return [thing.id for thing in model.fetch_all(things)]
+    return [int(thing) if isinstance(thing, Integral) else thing.id for thing in things]
+
+
+__all__ = [
+    "FeatureMatrix",
+    "SensorSeries",
+    "StimulusFrameCache",
+    "dtype_of",
+    "feature_matrix",
+    "iter_sensor_data",
+    "sensor_time_axis",
+    "sensor_time_unit",
+]
@@ -0,0 +1,216 @@
+"""
+A content-addressed on-disk cache of blobs, keyed by the SHA-1 digests that Valar stores beside them.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import mmap
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import peewee
+
+from valarpy.arrays import PathLike
+from valarpy.micromodels import ValarLookupError
+
+logger = logging.getLogger("valarpy")
+
+Blob = Union[memoryview, bytes, str]
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_MMAP_MIN_BYTES = 1024 * 1024
+
+
+class BlobCache:
+    """
+    A directory of blobs named by their SHA-1 digests.
+    Blob columns are declared with their digest columns by ``Meta.blob_hashes``;
+    for example, ``SensorData.floats`` is paired with ``SensorData.floats_sha1``.
+    A lookup first selects only the IDs and digests, serves the blobs that are on disk,
+    and transfers only the missing blobs from the database.
+    Because the files are content-addressed, they never need to be invalidated,
+    and one directory can be shared by processes and runs of an analysis.
+    A fetched blob whose SHA-1 does not match its stored digest is returned but not written.
+
+    Examples:
+        cache = BlobCache("~/.valarpy/blobs")
+        blobs = cache.fetch(SensorData.floats, SensorData.run == 12)
+        values = {i: np.frombuffer(b, dtype=">f4") for i, b in blobs.items()}
+    """
+
+    def __init__(
+        self,
+        directory: PathLike,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        mmap_min_bytes: int = DEFAULT_MMAP_MIN_BYTES,
+    ):
+        """
+        Constructor.
+
+        Args:
+            directory: The cache directory, created if needed
+            chunk_size: The maximum number of missing blobs to transfer per query
+            mmap_min_bytes: Memory-map files at least this large rather than reading them;
+                            each open mapping holds a file descriptor
+        """
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.mmap_min_bytes = mmap_min_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_fetched = 0
+
+    def fetch(
+        self, field: peewee.Field, *wheres: peewee.Expression, **values: Any
+    ) -> Dict[int, Blob]:
+        """
+        Gets the blobs in a column for the rows matching a WHERE clause.
+
+        Args:
+            field: A blob or text field declared in its model's ``Meta.blob_hashes``,
+                   like ``SensorData.floats``
+            wheres: Peewee WHERE expressions, joined by AND
+            values: Explicit values (like ``run=12``), also joined by AND
+
+        Returns:
+            A dict mapping each row ID to its blob; see ``get_all``
+        """
+        model = field.model
+        hash_field = self._hash_field(field)
+        query = model.select(model.id, hash_field)
+        for where in wheres:
+            query = query.where(where)
+        for name, value in values.items():
+            query = query.where(getattr(model, name) == value)
+        rows = list(query.tuples())
+        return dict(zip([row[0] for row in rows], self.get_all(field, rows)))
+
+    def get_all(
+        self, field: peewee.Field, rows: Sequence[Tuple[int, Optional[bytes]]]
+    ) -> List[Blob]:
+        """
+        Gets the blobs in a column for rows whose IDs and digests are already known.
+        This lets callers select the digests alongside other columns instead of the blobs.
+
+        Args:
+            field: A blob or text field declared in its model's ``Meta.blob_hashes``
+            rows: Pairs of row ID and the value of the digest column
+
+        Returns:
+            The blobs in the same order as ``rows``.
+            Binary blobs are ``bytes``, or read-only memory-mapped ``memoryview`` instances if large,
+            which ``np.frombuffer`` can decode without copying; text columns are ``str``.
+
+        Raises:
+            ValarLookupError: If a row was deleted before its blob was fetched
+        """
+        self._hash_field(field)
+        keys = [None if digest is None else bytes(digest).hex() for _, digest in rows]
+        found: Dict[str, Blob] = {}
+        # one row per missing digest, plus any rows without a digest
+        to_fetch: Dict[int, Optional[str]] = {}
+        pending = set()
+        for (row_id, _), key in zip(rows, keys):
+            if key is None:
+                to_fetch[row_id] = None
+            elif key not in found and key not in pending:
+                blob = self._read(key, field)
+                if blob is None:
+                    to_fetch[row_id] = key
+                    pending.add(key)
+                else:
+                    found[key] = blob
+        with self._lock:
+            self.hits += len(rows) - len(to_fetch)
+            self.misses += len(to_fetch)
+        fetched = self._fetch_missing(field, to_fetch)
+        for row_id, key in to_fetch.items():
+            if row_id not in fetched:
+                raise ValarLookupError(f"{field.model.__name__} {row_id} was deleted")
+            if key is not None:
+                found[key] = fetched[row_id]
+        return [
+            found[key] if key is not None else fetched[row_id]
+            for (row_id, _), key in zip(rows, keys)
+        ]
+
+    def info(self) -> Dict[str, int]:
+        """
+        Gets statistics about cache use by this instance.
+
+        Returns:
+            A dict with keys ``hits``, ``misses``, and ``bytes_fetched`` (transferred from the database)
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, bytes_fetched=self.bytes_fetched)
+
+    def path_of(self, digest: Union[bytes, str]) -> Path:
+        """
+        Gets the path of the file for a digest (which may not exist).
+
+        Args:
+            digest: The raw digest or its hex string
+        """
+        key = digest if isinstance(digest, str) else digest.hex()
+        return self.directory / key[:2] / key[2:]
+
+    def _fetch_missing(
+        self, field: peewee.Field, missing: Mapping[int, Optional[str]]
+    ) -> Dict[int, Blob]:
+        model = field.model
+        ids = list(missing.keys())
+        by_id = {}
+        for i in range(0, len(ids), self.chunk_size):
+            query = model.select(model.id, field).where(model.id << ids[i : i + self.chunk_size])
+            for row_id, blob in query.tuples().iterator():
+                data = blob.encode("utf8") if isinstance(blob, str) else bytes(blob)
+                with self._lock:
+                    self.bytes_fetched += len(data)
+                key = missing[row_id]
+                if key is not None:
+                    self._write(key, data)
+                by_id[row_id] = blob if isinstance(field, peewee.TextField) else data
+        return by_id
+
+    def _read(self, key: str, field: peewee.Field) -> Optional[Blob]:
+        path = self.path_of(key)
+        try:
+            with path.open("rb") as f:
+                if isinstance(field, peewee.TextField):
+                    return f.read().decode("utf8")
+                size = os.fstat(f.fileno()).st_size
+                if size == 0 or size < self.mmap_min_bytes:
+                    return f.read()
+                # the mapping stays valid after the file is closed
+                return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self.path_of(key)
+        if path.exists():
+            return
+        # a wrong digest would otherwise serve this blob for every row with that digest
+        if hashlib.sha1(data).hexdigest() != key:
+            logger.warning(f"Not caching a blob whose SHA-1 does not match its digest {key}")
+            return
+        path.parent.mkdir(exist_ok=True)
+        # write then rename so that concurrent readers never see a partial file
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def _hash_field(self, field: peewee.Field) -> peewee.Field:
+        # noinspection PyProtectedMember
+        hashes = field.model._valar_info.blob_hashes
+        if field.name not in hashes:
+            raise ValueError(f"{field.model.__name__}.{field.name} has no digest column")
+        return field.model._meta.fields[hashes[field.name]]
+
+
+__all__ = ["Blob", "BlobCache", "DEFAULT_CHUNK_SIZE", "DEFAULT_MMAP_MIN_BYTES"]
@@ -0,0 +1,182 @@
+"""
+Fast inserts of many rows, in statements sized to the server's ``max_allowed_packet``.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Generator, List, Optional, Sequence, Tuple, Type
+
+import peewee
+from playhouse.pool import PooledDatabase
+
+from valarpy.caching import DatabaseCaches
+
+if TYPE_CHECKING:  # pragma: no cover
+    from valarpy.metamodel import BaseModel
+
+logger = logging.getLogger("valarpy")
+
+# room for the statement text and the packet header
+PACKET_HEADROOM = 16 * 1024
+# the conservative default of SQLITE_MAX_VARIABLE_NUMBER, for databases other than MySQL
+_MAX_PARAMS_OTHER = 999
+# innodb_autoinc_lock_mode "interleaved", under which LOAD DATA may not get consecutive IDs
+_INTERLEAVED = 2
+
+
+def bulk_load(
+    model: Type[BaseModel],
+    fields: Sequence[peewee.Field],
+    rows: Sequence[Tuple[Any, ...]],
+    batch_size: Optional[int] = None,
+    infile_min_rows: Optional[int] = None,
+) -> List[int]:
+    """
+    Inserts rows atomically. See ``BaseModel.bulk_load``, which checks write access first.
+
+    Args:
+        model: The model to insert into
+        fields: The fields corresponding to the values in each row
+        rows: The rows, each a tuple of Python values
+        batch_size: The maximum number of rows per INSERT statement
+        infile_min_rows: Use ``LOAD DATA LOCAL INFILE`` if there are at least this many rows
+
+    Returns:
+        The ``id`` of each row, in order
+    """
+    if len(rows) == 0:
+        return []
+    database = model._meta.database
+    database = database.obj if isinstance(database, peewee.DatabaseProxy) else database
+    id_index = next((i for i, f in enumerate(fields) if f is model.id), None)
+    with _atomic(database):
+        if isinstance(database, peewee.MySQLDatabase):
+            packet, step, lock_mode = database.execute_sql(
+                "SELECT @@max_allowed_packet, @@auto_increment_increment, @@innodb_autoinc_lock_mode"
+            ).fetchone()
+            if infile_min_rows is not None and len(rows) >= infile_min_rows:
+                if lock_mode != _INTERLEAVED or id_index is not None:
+                    first = _load_infile(database, model, fields, rows)
+                    return _ids(rows, id_index, first, step)
+                logger.warning(
+                    "Not using LOAD DATA: with innodb_autoinc_lock_mode=2, IDs may not be consecutive"
+                )
+            batches = _batches_by_size(rows, int(packet) - PACKET_HEADROOM, batch_size)
+        else:
+            step = 1
+            n_per = max(1, _MAX_PARAMS_OTHER // len(fields))
+            n_per = n_per if batch_size is None else min(n_per, batch_size)
+            batches = [rows[i : i + n_per] for i in range(0, len(rows), n_per)]
+        ids = []
+        for batch in batches:
+            last = model.insert_many(batch, fields).execute()
+            # MySQL reports the first ID of a multi-row INSERT; SQLite reports the last
+            first = last if isinstance(database, peewee.MySQLDatabase) else last - len(batch) + 1
+            ids.extend(_ids(batch, id_index, first, step))
+        return ids
+
+
+def _ids(
+    rows: Sequence[Tuple[Any, ...]], id_index: Optional[int], first: int, step: int
+) -> List[int]:
+    # a single INSERT or LOAD DATA (with the table-level AUTO-INC lock) gets consecutive IDs
+    if id_index is not None:
+        return [row[id_index] for row in rows]
+    return list(range(first, first + step * len(rows), step))
+
+
+def _batches_by_size(
+    rows: Sequence[Tuple[Any, ...]], budget: int, batch_size: Optional[int]
+) -> List[Sequence[Tuple[Any, ...]]]:
+    batches, start, size = [], 0, 0
+    for i, row in enumerate(rows):
+        row_size = sum(_sql_size(value) for value in row) + 4
+        # a row larger than the budget goes alone; the server reports the error
+        if i > start and (size + row_size > budget or i - start == batch_size):
+            batches.append(rows[start:i])
+            start, size = i, 0
+        size += row_size
+    batches.append(rows[start:])
+    return batches
+
+
+def _sql_size(value: Any) -> int:
+    # an upper bound on the length of the escaped literal
+    if value is None:
+        return 5
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return 2 * len(value) + 10
+    if isinstance(value, str):
+        return 2 * len(value.encode("utf8")) + 3
+    return 32
+
+
+def _load_infile(
+    database: peewee.Database,
+    model: Type[BaseModel],
+    fields: Sequence[peewee.Field],
+    rows: Sequence[Tuple[Any, ...]],
+) -> int:
+    # requires local_infile to be enabled on the server and in connection.json
+    fd, path = tempfile.mkstemp(prefix="valarpy-", suffix=".tsv")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for row in rows:
+                values = [_tsv_value(field.db_value(v)) for field, v in zip(fields, row)]
+                f.write(b"\t".join(values) + b"\n")
+        columns = ", ".join(database.quote(field.column_name) for field in fields)
+        table = database.quote(model._meta.table_name)
+        cursor = database.execute_sql(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET binary ({columns})",
+            (path,),
+        )
+    finally:
+        os.unlink(path)
+    # with LOCAL, rows with duplicate keys are skipped with a warning rather than failing
+    if cursor.rowcount != len(rows):
+        raise peewee.IntegrityError(
+            f"LOAD DATA inserted {cursor.rowcount} of {len(rows)} rows into {model.__name__}"
+        )
+    return cursor.lastrowid
+
+
+def _tsv_value(value: Any) -> bytes:
+    # the default LOAD DATA format: tab-separated, backslash-escaped, with \N for NULL
+    if value is None:
+        return b"\\N"
+    if isinstance(value, bool):
+        return b"1" if value else b"0"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+    else:
+        # str() of datetimes, dates, and decimals is also the format MySQL reads
+        data = str(value).encode("utf8")
+    return (
+        data.replace(b"\\", b"\\\\")
+        .replace(b"\0", b"\\0")
+        .replace(b"\t", b"\\t")
+        .replace(b"\n", b"\\n")
+        .replace(b"\r", b"\\r")
+    )
+
+
+@contextmanager
+def _atomic(database: peewee.Database) -> Generator[None, None, None]:
+    # like Valar.atomic: clear the lookup caches, and return a connection checked out from a pool
+    checked_out = isinstance(database, PooledDatabase) and database.is_closed()
+    outermost = not database.in_transaction()
+    try:
+        with database.atomic():
+            yield
+    finally:
+        if outermost:
+            DatabaseCaches.clear_all(database)
+        if checked_out and not database.is_closed():
+            database.close()
+
+
+__all__ = ["PACKET_HEADROOM", "bulk_load"]
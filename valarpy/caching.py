@@ -0,0 +1,179 @@
+"""
+In-process caches.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LruCache:
+    """
+    A thread-safe least-recently-used cache.
+    Entries are evicted when any of the (optional) limits on count, total size, or age is exceeded.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        """
+        Constructor.
+
+        Args:
+            max_size: The maximum number of entries
+            max_bytes: The maximum sum of ``sizeof`` over the entries
+            ttl: The number of seconds after which an entry expires
+            sizeof: Computes the size of a value in bytes; required if ``max_bytes`` is set
+        """
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("sizeof is required with max_bytes")
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._lock = threading.RLock()
+        # maps key to (value, size in bytes, expiration time)
+        self._entries: OrderedDict = OrderedDict()
+        self._n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Gets a value and marks it as recently used, counting a hit or miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Adds or replaces a value, then evicts the least-recently used values as needed.
+        A value larger than ``max_bytes`` is not stored.
+        """
+        size = 0 if self._sizeof is None else self._sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires)
+            self._n_bytes += size
+            while (self.max_size is not None and len(self._entries) > self.max_size) or (
+                self.max_bytes is not None and self._n_bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def pop(self, key: Hashable) -> None:
+        """
+        Removes a value if it is present.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """
+        Removes all values (but does not reset the hit and miss counts).
+        """
+        with self._lock:
+            self._entries.clear()
+            self._n_bytes = 0
+
+    def info(self) -> Dict[str, int]:
+        """
+        Gets statistics about cache use.
+
+        Returns:
+            A dict with keys ``hits``, ``misses``, ``size`` (number of entries), and ``bytes``
+        """
+        with self._lock:
+            return dict(
+                hits=self.hits, misses=self.misses, size=len(self._entries), bytes=self._n_bytes
+            )
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry[2] is None or entry[2] >= time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Hashable) -> None:
+        self._n_bytes -= self._entries.pop(key)[1]
+
+
+class DatabaseCaches:
+    """
+    An ``LruCache`` per database, created on first use, for entries that hold rows of that database.
+    A database's cache is discarded when the database is garbage-collected.
+    Thread-safe.
+    """
+
+    # every instance, so that a database's entries can be cleared in all of them
+    _instances: "weakref.WeakSet[DatabaseCaches]" = weakref.WeakSet()
+
+    def __init__(self, **kwargs):
+        """
+        Constructor.
+
+        Args:
+            kwargs: Passed to ``LruCache`` for each database
+        """
+        self._kwargs = kwargs
+        self._caches: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        DatabaseCaches._instances.add(self)
+
+    def get(self, database: Any) -> LruCache:
+        """
+        Gets the cache of a database, creating it if needed.
+        """
+        with self._lock:
+            cache = self._caches.get(database)
+            if cache is None:
+                cache = LruCache(**self._kwargs)
+                self._caches[database] = cache
+            return cache
+
+    def clear(self, database: Optional[Any] = None) -> None:
+        """
+        Removes all values of a database, or of every database if ``database`` is None.
+        """
+        with self._lock:
+            caches = (
+                list(self._caches.values()) if database is None else [self._caches.get(database)]
+            )
+        for cache in caches:
+            if cache is not None:
+                cache.clear()
+
+    @classmethod
+    def clear_all(cls, database: Any) -> None:
+        """
+        Removes the values of a database from every ``DatabaseCaches``;
+        for example, when a transaction on it ends.
+        """
+        for caches in list(cls._instances):
+            caches.clear(database)
+
+
+__all__ = ["DatabaseCaches", "LruCache"]
@@ -1,19 +1,168 @@
+from __future__ import annotations
+
 import json
 import logging
 import os
-from contextlib import contextmanager
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar, Token
 from pathlib import Path
-from typing import Any, Dict, List, Mapping, Union, Generator, Type
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+    Generator,
+    Type,
+)
 
 import peewee
+import pymysql
 from peewee import _transaction as PeeweeTransaction
+from playhouse.pool import PooledDatabase, PooledMySQLDatabase
+
+from valarpy import instrumentation, replicas, temptables
+from valarpy.caching import DatabaseCaches
+from valarpy.instrumentation import (
+    DEFAULT_LOG_SIZE,
+    InstrumentedDatabase,
+    InstrumentedMySQLDatabase,
+    InstrumentedPooledMySQLDatabase,
+    QueryLog,
+)
+from valarpy.replicas import (
+    InstrumentedReplicatedMySQLDatabase,
+    InstrumentedReplicatedPooledMySQLDatabase,
+    ReplicatedDatabase,
+)
 
 logger = logging.getLogger("valarpy")
 
+# connection.json keys that enable pooling, mapped to PooledMySQLDatabase arguments
+_POOL_KEYS = {
+    "max_connections": "max_connections",
+    "stale_timeout": "stale_timeout",
+    "pool_timeout": "timeout",
+}
+
+
+# the database and write flag of the current thread or asyncio task; None falls back to GlobalConnection
+_scoped_database: ContextVar[Optional[peewee.Database]] = ContextVar(
+    "valarpy_database", default=None
+)
+_scoped_write_enabled: ContextVar[Optional[bool]] = ContextVar(
+    "valarpy_write_enabled", default=None
+)
+
+
+class ScopedDatabase(peewee.DatabaseProxy):  # pragma: no cover
+    """
+    A peewee ``DatabaseProxy`` that resolves to the database bound in the current context.
+    This is the ``Meta.database`` of every model.
+    """
+
+    __slots__ = ("_callbacks", "_Model")
+
+    @property
+    def obj(self) -> Optional[peewee.Database]:
+        return GlobalConnection.get_database()
+
+    def initialize(self, obj: Optional[peewee.Database]) -> None:
+        _scoped_database.set(obj)
+        for callback in self._callbacks:
+            callback(obj)
+
 
 class GlobalConnection:  # pragma: no cover
+    """
+    Tracks the active database and whether writes are enabled.
+    Both are scoped to the current thread or asyncio task (using ``contextvars``),
+    so threads and tasks can use independent connections and permissions.
+    Contexts that have not opened a connection use the first one opened in the process,
+    and contexts that have not called ``enable_write`` or ``disable_write`` cannot write.
+    """
+
     _peewee_database: peewee.Database = None
     _write_enabled: bool = False
+    database: ScopedDatabase = ScopedDatabase()
+
+    @classmethod
+    def get_database(cls) -> Optional[peewee.Database]:
+        """
+        Gets the database bound in the current context, or else the process-wide default.
+        """
+        database = _scoped_database.get()
+        return GlobalConnection._peewee_database if database is None else database
+
+    @classmethod
+    def bind(cls, database: Optional[peewee.Database]) -> Token:
+        """
+        Binds a database to the current context.
+        It is rare to need to call this directly; ``Valar.open`` calls it.
+
+        Returns:
+            A token to pass to ``unbind``
+        """
+        return _scoped_database.set(database)
+
+    @classmethod
+    def unbind(cls, token: Token) -> None:
+        """
+        Restores the database that was bound before ``bind`` returned ``token``.
+        """
+        _scoped_database.reset(token)
+
+    @classmethod
+    def call(cls, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Calls a function that uses the bound database, typically on a worker thread.
+        With a connection pool, a connection checked out for the call is returned afterward;
+        otherwise, the calling thread keeps its connection open.
+
+        Returns:
+            The value returned by ``fn``
+        """
+        database = cls.get_database()
+        if not isinstance(database, PooledDatabase) or not database.is_closed():
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            database.close()
+
+    @classmethod
+    def call_closing(cls, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Like ``call``, but closes every connection opened for the call, pooled or not, including to replicas.
+        Use this on worker threads that are discarded afterward, which would otherwise leave them open.
+
+        Returns:
+            The value returned by ``fn``
+        """
+        database = cls.get_database()
+        if database is None:
+            return fn(*args, **kwargs)
+        databases = [database, *getattr(database, "replicas", [])]
+        was_closed = [db.is_closed() for db in databases]
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            for db, closed in zip(databases, was_closed):
+                if closed and not db.is_closed():
+                    db.close()
+
+    @classmethod
+    def is_write_enabled(cls) -> bool:
+        """
+        Returns whether UPDATEs, INSERTs, and DELETEs are enabled in the current context.
+        """
+        enabled = _scoped_write_enabled.get()
+        return GlobalConnection._write_enabled if enabled is None else enabled
 
     @classmethod
     def enable_write(cls) -> None:
@@ -21,25 +170,81 @@ class GlobalConnection:  # pragma: no cover
         Enables running UPDATEs, INSERTs, and DELETEs.
         Otherwise, attempting will raise a ``WriteNotEnabledError``.
         The database user must additionally have the appropriate privileges.
-        Note that this function is **not thread-safe.**
+        This applies to the current thread or asyncio task (and tasks it later creates).
         """
-        # even though it's a classmethod, refer to the superclass member
-        GlobalConnection._write_enabled = True
+        _scoped_write_enabled.set(True)
 
     @classmethod
     def disable_write(cls) -> None:
         """
         Disables running UPDATEs, INSERTs, and DELETEs.
         See ``enable_write``.
-        Note that this function is **not thread-safe.**
         """
-        # even though it's a classmethod, refer to the superclass member
-        GlobalConnection._write_enabled = False
+        _scoped_write_enabled.set(False)
+
+
+@contextmanager
+def streaming_cursor(
+    database: peewee.Database,
+    query: Union[str, peewee.Query],
+    params: Optional[Sequence[Any]] = None,
+) -> Generator[Any, None, None]:
+    """
+    Executes a query on an unbuffered (server-side) cursor, so rows can be read with bounded memory.
+    The connection cannot run other queries until the cursor is closed on exit.
+    Closing early still reads (and discards) the remaining rows.
+    On databases other than MySQL, uses a normal cursor.
+    With replicas (see ``valarpy.replicas``), runs on the database that the SQL is routed to.
+    With a pool, a connection checked out for the cursor is returned when the cursor is closed,
+    including one checked out to compile ``query`` (see ``valarpy.temptables``).
+
+    Args:
+        database: A connected or connectable peewee database
+        query: The SQL to execute, or a peewee query to compile on ``database`` and execute
+        params: Parameters for ``query`` if it is SQL
+
+    Yields:
+        The DB-API cursor, after executing
+    """
+    with _returning_connection(database):
+        if isinstance(query, str):
+            sql = query
+        else:
+            with temptables.executing():
+                sql, params = database.get_sql_context().sql(query).query()
+        if isinstance(database, ReplicatedDatabase):
+            database = database.database_for(sql)
+        with _returning_connection(database):
+            connection = database.connection()
+            if isinstance(connection, pymysql.connections.Connection):
+                cursor = connection.cursor(pymysql.cursors.SSCursor)
+            else:
+                cursor = database.cursor()
+            n_bytes = getattr(connection, "bytes_read", None)
+            t0 = time.perf_counter()
+            try:
+                with peewee.__exception_wrapper__:
+                    cursor.execute(sql, params or ())
+                yield cursor
+            finally:
+                cursor.close()
+                if isinstance(database, InstrumentedDatabase):
+                    # the rows are read while iterating, so the query ends when the cursor closes
+                    n_rows = getattr(cursor, "rownumber", None)
+                    database.record(sql, time.perf_counter() - t0, n_rows, n_bytes)
+
+
+def _returning_connection(database: peewee.Database) -> ContextManager[None]:
+    # a connection checked out in the block goes back to the pool after it (see returning_connection)
+    if isinstance(database, InstrumentedPooledMySQLDatabase):
+        return database.returning_connection()
+    return nullcontext()
 
 
 class Valar:
     """
-    Global valarpy connection.
+    A valarpy connection.
+    Opening it binds its database to the current thread or asyncio task (see ``GlobalConnection``).
     """
 
     def __init__(
@@ -56,10 +261,20 @@ class Valar:
                 If a dict, used as-is. If a path or str, attempts to read JSON from that path.
                 If a list of paths, strs, and Nones, reads from the first extant file found in the list.
                 If None, attempts to read JSON from the ``VALARPY_CONFIG`` environment variable, if set.
+                If any of ``max_connections``, ``stale_timeout`` (seconds a connection can be reused),
+                or ``pool_timeout`` (seconds to wait for a free connection) is set,
+                uses a pool of connections (see ``is_pooled``).
+                ``slow_query_sec`` logs a warning for each query that takes at least that long,
+                and ``query_log_size`` sets the number of recent queries kept (see ``stats``).
+                ``replicas`` lists read replicas, each a host or a dict of parameters that override the others,
+                and ``replica_strategy`` is "round_robin" (the default) or "latency" (see ``is_replicated``).
+                If ``snapshot`` is set, opens that SQLite file (see ``valarpy.snapshot``) read-only
+                instead of connecting to the server; then "database" is optional and other keys are ignored.
 
         Raises:
             FileNotFoundError: If a path was supplied but does not point to a file
             TypeError: If the type was not recognized
+            ValueError: If ``replica_strategy`` is not recognized
             InterfaceError: On some connection issues
         """
         if config is None:
@@ -84,12 +299,118 @@ class Valar:
             raise TypeError(f"Invalid type {type(config)} of {config}")
         # make a copy! Otherwise we'll pop the passed argument, which could cause problems
         self._config: Dict[str, Union[str, int]] = {k: v for k, v in config.items()}
-        self._db_name = self._config.pop("database")
+        self._snapshot: Optional[str] = self._config.pop("snapshot", None)
+        if self._snapshot is None:
+            self._db_name = self._config.pop("database")
+        else:
+            self._db_name = self._config.pop("database", self._snapshot)
+        self._pool_config = {
+            arg: self._config.pop(key) for key, arg in _POOL_KEYS.items() if key in self._config
+        }
+        self._slow_query_sec: Optional[float] = self._config.pop("slow_query_sec", None)
+        self._query_log = QueryLog(self._config.pop("query_log_size", DEFAULT_LOG_SIZE))
+        self._replica_configs: List[Dict[str, Union[str, int]]] = [
+            dict(host=r) if isinstance(r, str) else dict(r)
+            for r in self._config.pop("replicas", [])
+        ]
+        self._replica_strategy: str = self._config.pop("replica_strategy", replicas.STRATEGIES[0])
+        if self._replica_strategy not in replicas.STRATEGIES:
+            raise ValueError(
+                f"Unknown replica_strategy {self._replica_strategy}; use one of {replicas.STRATEGIES}"
+            )
+        self._database: Optional[peewee.Database] = None
+        self._token: Optional[Token] = None
 
     @property
     def backend(self) -> Type[GlobalConnection]:
         return GlobalConnection
 
+    @property
+    def is_pooled(self) -> bool:
+        """
+        Whether connections are drawn from a pool.
+        Each thread checks out its own connection when it runs a query.
+        Outside a transaction, the connection is returned to the pool after each statement
+        (or when the cursor of ``iter_where`` is closed); otherwise, when the outermost ``atomic``
+        or ``rolling_back`` block exits. Replicas are pooled the same way.
+        """
+        return len(self._pool_config) > 0 and self._snapshot is None
+
+    @property
+    def is_snapshot(self) -> bool:
+        """
+        Whether this connection reads a local snapshot rather than the server.
+        """
+        return self._snapshot is not None
+
+    @property
+    def is_replicated(self) -> bool:
+        """
+        Whether reads are sent to replicas.
+        Plain SELECTs (like ``fetch``, ``select``, and ``iter_where``) go to a replica,
+        chosen in turn or by least latency (``replica_strategy``).
+        Writes, and everything inside ``atomic``, ``rolling_back``, or ``on_primary``, go to the primary,
+        as do the reads of model methods that write, like ``get_or_create`` and ``delete_instance``.
+        Queries that use the temporary tables of ``fetch_to_query`` also go to the primary.
+        """
+        return len(self._replica_configs) > 0 and self._snapshot is None
+
+    @property
+    def pool_stats(self) -> Optional[Dict[str, int]]:
+        """
+        Gets the state of the connection pool.
+
+        Returns:
+            None if not pooled; otherwise a dict with keys:
+
+                - ``max_connections`` (None if unlimited)
+                - ``in_use``: the number of connections checked out by threads
+                - ``idle``: the number of open connections available for reuse
+        """
+        if not self.is_pooled:
+            return None
+        # noinspection PyProtectedMember
+        return dict(
+            max_connections=self._db._max_connections,
+            in_use=len(self._db._in_use),
+            idle=len(self._db._connections),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the number, time, rows, and bytes of the queries run through this connection,
+        in total, per table, and per fingerprint (the SQL with parameter lists collapsed).
+        Includes queries from every thread that uses this connection, since it was created.
+
+        Returns:
+            A dict; see ``QueryLog.stats``
+        """
+        return self._query_log.stats()
+
+    @property
+    def query_log(self) -> QueryLog:
+        """
+        The log of this connection's queries, including the most recent ones.
+        """
+        return self._query_log
+
+    @contextmanager
+    def tracking(self) -> Generator[QueryLog, None, None]:
+        """
+        Records the queries run in the block in a separate ``QueryLog``.
+        Only queries from the current thread or asyncio task (or tasks it starts) are included.
+
+        Examples:
+            with valar.tracking() as log:
+                Runs.fetch_all(names)
+            print(log.stats()["n_queries"])
+
+        Yields:
+            The ``QueryLog``, whose ``stats()`` can be read during or after the block
+        """
+        with instrumentation.tracking(self._query_log.max_size) as log:
+            yield log
+
     @classmethod
     def find_extant_path(cls, *paths: Union[Path, str, None]) -> Path:
         """
@@ -130,6 +451,21 @@ class Valar:
             Path.home() / ".valarpy" / "read_only.json",
         ]
 
+    @contextmanager
+    def on_primary(self) -> Generator[None, None, None]:
+        """
+        Sends the reads in this block to the primary rather than a replica,
+        so that they see rows just written (which a replica may not have yet).
+        Applies to the current thread or asyncio task (and tasks it starts).
+
+        Examples:
+            Refs(name="new_ref").save()
+            with valar.on_primary():
+                ref = Refs.fetch("new_ref")
+        """
+        with replicas.on_primary():
+            yield
+
     @contextmanager
     def rolling_back(self) -> Generator[PeeweeTransaction, None, None]:
         """
@@ -140,15 +476,16 @@ class Valar:
             A peewee Transaction type; this should generally not be used
         """
         # noinspection PyBroadException
-        try:
-            with self._db.atomic() as t:
-                yield t
-        except BaseException:
-            logger.debug("Failed on transaction. Rolling back.")
-            raise
-        finally:
-            logger.debug("Succeeded on transaction. Rolling back.")
-            t.rollback()
+        with self._checked_out(), self._transaction_scope():
+            try:
+                with self._db.atomic() as t:
+                    yield t
+            except BaseException:
+                logger.debug("Failed on transaction. Rolling back.")
+                raise
+            finally:
+                logger.debug("Succeeded on transaction. Rolling back.")
+                t.rollback()
 
     @contextmanager
     def atomic(self) -> Generator[PeeweeTransaction, None, None]:
@@ -168,7 +505,7 @@ class Valar:
                     Refs(name="testing2").save()
         """
         # noinspection PyBroadException
-        with self._db.atomic() as t:
+        with self._checked_out(), self._transaction_scope(), self._db.atomic() as t:
             try:
                 yield t
             except BaseException:
@@ -176,6 +513,38 @@ class Valar:
                 # t.rollback()
                 raise
 
+    @contextmanager
+    def _checked_out(self) -> Generator[None, None, None]:
+        """
+        If pooled and this thread has no connection, checks one out and returns it on exit.
+        """
+        if self.is_pooled and self._db.is_closed():
+            self._db.connect()
+            try:
+                yield
+            finally:
+                self._db.close()
+        else:
+            yield
+
+    @contextmanager
+    def _transaction_scope(self) -> Generator[None, None, None]:
+        """
+        When the outermost block exits, clears the lookup caches of the database
+        (which may have been emptied while another thread read rows that this transaction changed)
+        and drops the temporary tables of IDs created in the transaction (see ``valarpy.temptables``).
+        """
+        outermost = not self._db.in_transaction()
+        try:
+            yield
+        finally:
+            if outermost:
+                DatabaseCaches.clear_all(self._db)
+                try:
+                    temptables.drop_id_tables(self._db, only_in_transaction=True)
+                except peewee.DatabaseError:
+                    logger.debug("Failed to drop temporary tables", exc_info=True)
+
     @property
     def _db(self) -> peewee.Database:
         """
@@ -185,7 +554,7 @@ class Valar:
         Returns:
             A peewee ``Database`` instance
         """
-        return GlobalConnection._peewee_database
+        return self._database
 
     def reconnect(self, hard: bool = False) -> None:
         """
@@ -199,7 +568,7 @@ class Valar:
             self.close()
             self.open()
         else:
-            GlobalConnection._peewee_database.connect(reuse_if_open=True)
+            self._database.connect(reuse_if_open=True)
 
     def open(self) -> None:
         """
@@ -207,20 +576,72 @@ class Valar:
         This is already called by ``__enter__``.
         """
         logging.info(f"Opening connection to {self._db_name}")
-        GlobalConnection._peewee_database = peewee.MySQLDatabase(
-            self._db_name, autorollback=True, **self._config
-        )
-        GlobalConnection._peewee_database.connect()
+        instrumented = dict(query_log=self._query_log, slow_query_sec=self._slow_query_sec)
+        if self.is_snapshot:
+            # imported here because valarpy.snapshot depends on the models, which depend on this module
+            from valarpy import snapshot
+
+            self._database = snapshot.connect(self._snapshot, **instrumented)
+        elif self.is_replicated:
+            # replicas connect on first use, so one that is down does not prevent opening
+            self._database = self._server_database(
+                self._config,
+                replicas=[
+                    self._server_database({**self._config, **replica}, **instrumented)
+                    for replica in self._replica_configs
+                ],
+                strategy=self._replica_strategy,
+                **instrumented,
+            )
+        else:
+            self._database = self._server_database(self._config, **instrumented)
+        self._database.connect()
         if self._db.in_transaction():
             raise AssertionError("In transaction on open() but should not be")
+        if self.is_pooled:
+            # the connection only checked that the server is reachable; queries check out their own
+            self._database.close()
+        self._token = GlobalConnection.bind(self._database)
+        if GlobalConnection._peewee_database is None:
+            GlobalConnection._peewee_database = self._database
+
+    def _server_database(
+        self, config: Mapping[str, Union[str, int]], **kwargs
+    ) -> InstrumentedMySQLDatabase:
+        # a primary if replicas are passed; otherwise a replica or the only database
+        config = dict(config)
+        name = config.pop("database", self._db_name)
+        if self.is_pooled:
+            kwargs.update(self._pool_config)
+        if "replicas" in kwargs:
+            if self.is_pooled:
+                kind = InstrumentedReplicatedPooledMySQLDatabase
+            else:
+                kind = InstrumentedReplicatedMySQLDatabase
+        else:
+            kind = InstrumentedPooledMySQLDatabase if self.is_pooled else InstrumentedMySQLDatabase
+        return kind(name, autorollback=True, **kwargs, **config)
 
     def close(self) -> None:
         """
         Closes the connection.
         This is already called by ``__exit__``.
         """
+        if self._database is None:
+            return
         logging.info(f"Closing connection to {self._db_name}")
-        GlobalConnection._peewee_database.close()
+        self._database.close()
+        if self.is_pooled:
+            self._database.close_all()
+        if self._token is not None:
+            try:
+                GlobalConnection.unbind(self._token)
+            except ValueError:
+                # the token was created in a different context, which has its own binding
+                logger.debug(f"Not unbinding {self._db_name} from a different context")
+            self._token = None
+        if GlobalConnection._peewee_database is self._database:
+            GlobalConnection._peewee_database = None
 
     def __enter__(self):
         self.open()
@@ -245,4 +666,4 @@ class Valar:
         return json.loads(Path(path).read_text(encoding="utf8"))
 
 
-__all__ = ["GlobalConnection", "Valar"]
+__all__ = ["GlobalConnection", "ScopedDatabase", "Valar", "streaming_cursor"]
@@ -0,0 +1,315 @@
+"""
+Exports tables or queries to Arrow record batches and Parquet files.
+Requires the optional dependency ``pyarrow`` (``pip install valarpy[arrow]``).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Type, Union
+
+import peewee
+
+from valarpy.metamodel import BaseModel, EnumField, ValarSelect
+
+DEFAULT_ROW_GROUP_SIZE = 100000
+DEFAULT_ROW_GROUPS_PER_FILE = 10
+WATERMARK_FILE = "_watermark.json"
+Source = Union[Type[BaseModel], ValarSelect]
+
+
+class ExportResult(NamedTuple):
+    """
+    The state of an export directory after ``export_parquet``.
+    """
+
+    n_rows: int
+    files: List[Path]
+    last_id: Optional[int]
+
+
+def arrow_type(field: peewee.Field) -> Any:
+    """
+    Gets the Arrow type for a peewee field.
+
+    Args:
+        field: Any field of a model
+
+    Returns:
+        A ``pyarrow.DataType``; ``string`` if the field type is not recognized
+    """
+    pa = _pyarrow()
+    if isinstance(field, (peewee.ForeignKeyField, peewee.IntegerField)):
+        return pa.int64()
+    elif isinstance(field, peewee.FloatField):
+        return pa.float64()
+    elif isinstance(field, peewee.DecimalField):
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    elif isinstance(field, peewee.BooleanField):
+        return pa.bool_()
+    elif isinstance(field, EnumField):
+        return pa.dictionary(pa.int32(), pa.string())
+    elif isinstance(field, peewee.BlobField):
+        return pa.binary()
+    elif isinstance(field, peewee.DateTimeField):
+        return pa.timestamp("us")
+    elif isinstance(field, peewee.DateField):
+        return pa.date32()
+    elif isinstance(field, peewee.TimeField):
+        return pa.time64("us")
+    return pa.string()
+
+
+def arrow_schema(source: Source) -> Any:
+    """
+    Gets the Arrow schema of a model or of a select whose columns are all fields.
+
+    Args:
+        source: A ``BaseModel`` subclass or a select on one
+
+    Returns:
+        A ``pyarrow.Schema`` with a nullable column for each nullable field
+
+    Raises:
+        ValueError: If a selected column is not a field (its type can't be known before running)
+    """
+    pa = _pyarrow()
+    query = _select(source)
+    fields = []
+    for node in query._returning:
+        if not isinstance(node, peewee.Field):
+            raise ValueError(f"Column {node} is not a field")
+        fields.append(pa.field(node.name, arrow_type(node), nullable=node.null))
+    return pa.schema(fields)
+
+
+def iter_batches(
+    source: Source, batch_size: int = DEFAULT_ROW_GROUP_SIZE, after_id: Optional[int] = None
+) -> Iterator[Any]:
+    """
+    Reads a model or select as Arrow record batches, in order of ``id``.
+    Each batch is read by its own query (``WHERE id > ... ORDER BY id LIMIT ...``),
+    so memory is bounded, and no connection is held across batches.
+    The rows that share the last ``id`` of a batch are all read into that batch (by ``WHERE id = ...``),
+    so the rows of an ``id`` are never split, even if a join gives it several.
+    The select must include the ``id`` of its model.
+
+    Examples:
+        for batch in iter_batches(Wells.select().where(Wells.run == 5), batch_size=1000):
+            print(batch.num_rows)
+
+    Args:
+        source: A ``BaseModel`` subclass or a select on one; a subclass selects all of its fields
+        batch_size: The number of rows per batch, which is exceeded only by rows that share its last ``id``
+        after_id: Start after this ``id``
+
+    Yields:
+        ``pyarrow.RecordBatch`` instances, with a column per selected field or alias.
+        Fields (also under an alias) have the type of ``arrow_type``.
+        Other columns take the type inferred from their first non-NULL values, and have type ``null`` before that.
+
+    Raises:
+        ValueError: If ``batch_size`` is not positive or the select does not include ``id``
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size is {batch_size} but must be positive")
+    query = _select(source)
+    model = query.model
+    id_index = _id_index(query)
+    return _iter_batches(query, model, id_index, batch_size, after_id)
+
+
+def export_parquet(
+    source: Source,
+    directory: Union[str, Path],
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    row_groups_per_file: int = DEFAULT_ROW_GROUPS_PER_FILE,
+    resume: bool = True,
+    compression: str = "snappy",
+) -> ExportResult:
+    """
+    Writes a model or select to a directory of Parquet files.
+    Rows are written in order of ``id`` to ``part-00000.parquet``, ``part-00001.parquet``, etc.
+    After each file is complete, the last ``id`` written is recorded in ``_watermark.json``;
+    with ``resume``, a later call continues after that ``id``, so an interrupted export loses at most one file.
+    Rows added later with higher IDs are picked up by running again.
+    A new file is also started if a column that is not a field gets a type (see ``iter_batches``);
+    the earlier files then have type ``null`` for that column.
+
+    Examples:
+        export_parquet(Wells, "lake/wells", row_group_size=200000)
+
+    Args:
+        source: A ``BaseModel`` subclass or a select on one; see ``iter_batches``
+        directory: The output directory, which is created if needed
+        row_group_size: The number of rows per Parquet row group (and per query)
+        row_groups_per_file: The number of row groups per file
+        resume: Continue from the watermark, if there is one; otherwise, delete the files it lists and start over
+        compression: Passed to ``pyarrow.parquet.ParquetWriter``
+
+    Returns:
+        The total number of rows, files, and last ``id`` in the directory
+
+    Raises:
+        ValueError: If the watermark is for a different table, or if an argument is invalid
+    """
+    pq = _pyarrow("parquet")
+    if row_groups_per_file < 1:
+        raise ValueError(f"row_groups_per_file is {row_groups_per_file} but must be positive")
+    query = _select(source)
+    table = query.model._meta.table_name
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    mark_path = directory / WATERMARK_FILE
+    mark = dict(table=table, last_id=None, n_rows=0, files=[])
+    if mark_path.exists():
+        old = json.loads(mark_path.read_text(encoding="utf8"))
+        if old["table"] != table:
+            raise ValueError(f"{directory} contains an export of {old['table']}, not {table}")
+        if resume:
+            mark = old
+        else:
+            for file in old["files"]:
+                (directory / file).unlink(missing_ok=True)
+    batches = iter_batches(query, batch_size=row_group_size, after_id=mark["last_id"])
+    id_index = _id_index(query)
+    writer, n_groups, n_rows, last_id, part = None, 0, 0, None, None
+    for batch in batches:
+        if writer is not None and not batch.schema.equals(writer.schema):
+            # a column that was all NULL has a type now, which the file cannot change
+            _finish_part(writer, directory, part, mark, mark_path, n_rows, last_id)
+            writer, n_groups, n_rows = None, 0, 0
+        if writer is None:
+            part = f"part-{len(mark['files']):05}.parquet"
+            writer = pq.ParquetWriter(
+                str(directory / (part + ".tmp")), batch.schema, compression=compression
+            )
+        writer.write_batch(batch, row_group_size=row_group_size)
+        n_groups += 1
+        n_rows += batch.num_rows
+        last_id = batch.column(id_index)[-1].as_py()
+        if n_groups == row_groups_per_file:
+            _finish_part(writer, directory, part, mark, mark_path, n_rows, last_id)
+            writer, n_groups, n_rows = None, 0, 0
+    if writer is not None:
+        _finish_part(writer, directory, part, mark, mark_path, n_rows, last_id)
+    return ExportResult(
+        n_rows=mark["n_rows"],
+        files=[directory / file for file in mark["files"]],
+        last_id=mark["last_id"],
+    )
+
+
+def _finish_part(
+    writer: Any,
+    directory: Path,
+    part: str,
+    mark: Dict[str, Any],
+    mark_path: Path,
+    n_rows: int,
+    last_id: int,
+) -> None:
+    # the file must be complete before the watermark moves past its rows
+    writer.close()
+    os.replace(directory / (part + ".tmp"), directory / part)
+    mark["files"].append(part)
+    mark["n_rows"] += n_rows
+    mark["last_id"] = last_id
+    tmp = mark_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(mark, indent=2), encoding="utf8")
+    os.replace(tmp, mark_path)
+
+
+def _iter_batches(
+    query: ValarSelect,
+    model: Type[BaseModel],
+    id_index: int,
+    batch_size: int,
+    after_id: Optional[int],
+) -> Iterator[Any]:
+    pa = _pyarrow()
+    names, types, converters = None, None, None
+    while True:
+        page = query.order_by(model.id).limit(batch_size)
+        if after_id is not None:
+            page = page.where(model.id > after_id)
+        cursor = model._meta.database.execute(page)
+        rows = cursor.fetchall()
+        if len(rows) == 0:
+            return
+        if names is None:
+            names, _ = page._frame_columns(cursor)
+            fields = [_field_of(n) for n in query._returning]
+            types = [None if f is None else arrow_type(f) for f in fields]
+            converters = [_converter(f) for f in fields]
+        done = len(rows) < batch_size
+        if not done:
+            # a join can give an id more rows than the page has room for; read all of them
+            last_id = rows[-1][id_index]
+            rows = [row for row in rows if row[id_index] != last_id]
+            rows += model._meta.database.execute(query.where(model.id == last_id)).fetchall()
+        columns = list(zip(*rows))
+        arrays = []
+        for i, column in enumerate(columns):
+            if converters[i] is not None:
+                column = [None if v is None else converters[i](v) for v in column]
+            array = pa.array(column, type=types[i])
+            # fix the types of other columns from the first batch with a value
+            if not pa.types.is_null(array.type):
+                types[i] = array.type
+            arrays.append(array)
+        yield pa.RecordBatch.from_arrays(arrays, names=names)
+        after_id = rows[-1][id_index]
+        if done:
+            return
+
+
+def _field_of(node: Any) -> Optional[peewee.Field]:
+    # the field selected, possibly under an alias; None for other expressions
+    if isinstance(node, peewee.Alias):
+        node = node.node
+    return node if isinstance(node, peewee.Field) else None
+
+
+def _converter(node: Any) -> Any:
+    # drivers other than PyMySQL (like sqlite3) return dates and times as strings
+    if isinstance(node, (peewee.DateTimeField, peewee.DateField, peewee.TimeField)):
+        return node.python_value
+    return None
+
+
+def _select(source: Source) -> ValarSelect:
+    if isinstance(source, type) and issubclass(source, BaseModel):
+        return source.select(*source._meta.sorted_fields)
+    if isinstance(source, ValarSelect):
+        return source
+    raise TypeError(f"Cannot export {source} of type {type(source)}")
+
+
+def _id_index(query: ValarSelect) -> int:
+    for i, node in enumerate(query._returning):
+        if node is query.model.id:
+            return i
+    raise ValueError(f"The select must include {query.model.__name__}.id")
+
+
+def _pyarrow(module: Optional[str] = None) -> Any:
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:  # pragma: no cover
+        raise ImportError("Export requires pyarrow; install it with 'pip install valarpy[arrow]'")
+    return pyarrow.parquet if module == "parquet" else pyarrow
+
+
+__all__ = [
+    "DEFAULT_ROW_GROUP_SIZE",
+    "DEFAULT_ROW_GROUPS_PER_FILE",
+    "ExportResult",
+    "arrow_schema",
+    "arrow_type",
+    "export_parquet",
+    "iter_batches",
+]
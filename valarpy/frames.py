@@ -0,0 +1,28 @@
+"""
+Pandas DataFrame subclasses returned by the models.
+This module imports pandas, so the models import it only when a frame is needed.
+"""
+
+from __future__ import annotations
+
+import pandas as pd
+
+
+class TableDescriptionFrame(pd.DataFrame):
+    """
+    A Pandas DataFrame subclass that contains the columns::
+
+        - keys name (str)
+        - type (str)
+        - length (int or None)
+        - nullable (bool)
+        - choices (set or list)
+        - primary (bool)
+        - unique (bool)
+        - constraints (list of constraint objects)
+    """
+
+    pass
+
+
+__all__ = ["TableDescriptionFrame"]
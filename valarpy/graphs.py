@@ -0,0 +1,197 @@
+"""
+Prefetching of the rows that describe runs, so that analyses can follow foreign keys without queries.
+"""
+
+from __future__ import annotations
+
+import functools
+import operator
+from numbers import Integral
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Union
+
+import peewee
+
+from valarpy.micromodels import ValarLookupError, ValarTableTypeError
+
+N_QUERIES = 3
+
+
+class RunGraph(NamedTuple):
+    """
+    Runs with their plates, experiments, wells, and treatments, loaded by ``load_runs``.
+    Every foreign key among these rows is already set on the instances,
+    so that, for example, ``well.run.experiment.battery`` and ``treatment.batch.compound`` run no queries.
+    Rows referenced more than once (like a batch used in many wells) are shared instances.
+    Other foreign keys (like ``run.experimentalist``) still query when accessed.
+    """
+
+    runs: Sequence[Any]
+    wells: Mapping[int, Sequence[Any]]
+    treatments: Mapping[int, Sequence[Any]]
+
+    def wells_of(self, run: Any) -> Sequence[Any]:
+        """
+        Gets the wells of a run, in order of ``well_index``.
+
+        Args:
+            run: One of ``runs``, or its ID
+        """
+        return self.wells.get(run if isinstance(run, Integral) else run.id, [])
+
+    def treatments_of(self, well: Any) -> Sequence[Any]:
+        """
+        Gets the treatments of a well, in order of ``id``.
+
+        Args:
+            well: A well in ``wells``, or its ID
+        """
+        return self.treatments.get(well if isinstance(well, Integral) else well.id, [])
+
+    def all_wells(self) -> List[Any]:
+        """
+        Gets the wells of every run, in the order of ``runs``.
+        """
+        return [well for run in self.runs for well in self.wells_of(run)]
+
+
+def load_runs(runs: Iterable[Union[int, str, peewee.Model]]) -> RunGraph:
+    """
+    Loads runs and the rows that describe them in three queries, however many runs and wells there are:
+
+        1. ``Runs`` with ``Experiments``, ``Batteries``, ``SauronConfigs``, ``Plates``, and ``PlateTypes``
+        2. ``Wells`` of those runs with ``ControlTypes`` and ``GeneticVariants``
+        3. ``WellTreatments`` of those wells with ``Batches`` and ``Compounds``
+
+    Columns in ``Meta.deferred`` (like ``Runs.notes``) are not loaded.
+
+    Examples:
+        graph = load_runs([12, "my_run_tag"])
+        for run in graph.runs:
+            for well in graph.wells_of(run):
+                print(well.well_index, [t.batch.compound for t in graph.treatments_of(well)])
+
+    Args:
+        runs: Run IDs, names, tags, or instances (which are loaded again)
+
+    Returns:
+        A ``RunGraph``, whose ``runs`` are in the order given
+
+    Raises:
+        ValarLookupError: If a run was not found
+        ValarTableTypeError: If an instance is not of ``Runs``
+        TypeError: If a run is not an int, str, or model instance
+    """
+    from valarpy.model import (
+        Batches,
+        Batteries,
+        Compounds,
+        ControlTypes,
+        Experiments,
+        GeneticVariants,
+        Plates,
+        PlateTypes,
+        Runs,
+        SauronConfigs,
+        Wells,
+        WellTreatments,
+    )
+
+    runs = list(runs)
+    ids, strs = set(), set()
+    for run in runs:
+        if isinstance(run, Runs):
+            ids.add(run.id)
+        elif isinstance(run, peewee.Model):
+            raise ValarTableTypeError(f"Fetching a {run.__class__.__name__} on Runs")
+        elif isinstance(run, Integral):
+            ids.add(int(run))
+        elif isinstance(run, str):
+            strs.add(run)
+        else:
+            raise TypeError(f"Invalid type {type(run)} for run {run}")
+    if len(runs) == 0:
+        return RunGraph([], {}, {})
+    # 1. runs, by ID or by any unique string column
+    conditions = [Runs.id << list(ids)] + [
+        getattr(Runs, col) << list(strs) for col in Runs._valar_info.indexing_cols
+    ]
+    query = (
+        Runs.select(*_fields(Runs, Experiments, Batteries, SauronConfigs, Plates, PlateTypes))
+        .join_from(Runs, Experiments)
+        .join_from(Experiments, Batteries)
+        .join_from(Runs, SauronConfigs)
+        .join_from(Runs, Plates)
+        .join_from(Plates, PlateTypes, peewee.JOIN.LEFT_OUTER)
+        .where(functools.reduce(operator.or_, conditions))
+    )
+    shared: Dict[type, Dict[int, peewee.Model]] = {}
+    found = {}
+    for run in query:
+        _share(_share(run, "experiment", shared), "battery", shared)
+        _share(run, "sauron_config", shared)
+        _share(_share(run, "plate", shared), "plate_type", shared)
+        found[run.id] = run
+        for col in Runs._valar_info.indexing_cols:
+            found.setdefault(getattr(run, col), run)
+    ordered = []
+    for run in runs:
+        key = run.id if isinstance(run, Runs) else run
+        if key not in found:
+            raise ValarLookupError(f"Could not find run {key}")
+        ordered.append(found[key])
+    by_id = {run.id: run for run in ordered}
+    # 2. wells
+    query = (
+        Wells.select(*_fields(Wells, ControlTypes, GeneticVariants))
+        .join_from(Wells, ControlTypes, peewee.JOIN.LEFT_OUTER)
+        .join_from(Wells, GeneticVariants, peewee.JOIN.LEFT_OUTER)
+        .where(Wells.run << list(by_id.keys()))
+        .order_by(Wells.run, Wells.well_index)
+    )
+    wells: Dict[int, List[peewee.Model]] = {run_id: [] for run_id in by_id}
+    wells_by_id = {}
+    for well in query:
+        well.__rel__["run"] = by_id[well.__data__["run"]]
+        _share(well, "control_type", shared)
+        _share(well, "variant", shared)
+        wells[well.__data__["run"]].append(well)
+        wells_by_id[well.id] = well
+    # 3. treatments
+    query = (
+        WellTreatments.select(*_fields(WellTreatments, Batches, Compounds))
+        .join_from(WellTreatments, Batches)
+        .join_from(Batches, Compounds, peewee.JOIN.LEFT_OUTER)
+        .join_from(WellTreatments, Wells)
+        .where(Wells.run << list(by_id.keys()))
+        .order_by(WellTreatments.well, WellTreatments.id)
+    )
+    treatments: Dict[int, List[peewee.Model]] = {}
+    for treatment in query:
+        treatment.__rel__["well"] = wells_by_id[treatment.__data__["well"]]
+        _share(_share(treatment, "batch", shared), "compound", shared)
+        treatments.setdefault(treatment.__data__["well"], []).append(treatment)
+    return RunGraph(ordered, wells, treatments)
+
+
+def _fields(*models: type) -> List[peewee.Field]:
+    # noinspection PyProtectedMember
+    return [field for model in models for field in model._valar_info.default_fields]
+
+
+def _share(
+    row: Optional[peewee.Model], name: str, shared: Dict[type, Dict[int, peewee.Model]]
+) -> Optional[peewee.Model]:
+    # replace a joined row with the first instance with the same ID; the rows are identical
+    if row is None:
+        return None
+    value = row.__rel__.get(name)
+    if value is None or value.id is None:
+        # a LEFT JOIN that matched nothing
+        row.__rel__.pop(name, None)
+        return None
+    value = shared.setdefault(type(value), {}).setdefault(value.id, value)
+    row.__rel__[name] = value
+    return value
+
+
+__all__ = ["N_QUERIES", "RunGraph", "load_runs"]
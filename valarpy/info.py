@@ -0,0 +1,95 @@
+"""
+Row counts and schema checks for every table, for health checks and ``valarpy_info``.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Type
+
+import peewee
+
+from valarpy.connection import GlobalConnection
+from valarpy.metamodel import BaseModel
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class TableStats(NamedTuple):
+    """
+    The row count of a table and how long it took to check.
+    """
+
+    model: Type[BaseModel]
+    n_rows: Optional[int]
+    exact: bool
+    seconds: float
+    error: Optional[str]
+
+    @property
+    def name(self) -> str:
+        return self.model.__name__
+
+
+def table_stats(exact: bool = False, max_workers: int = DEFAULT_MAX_WORKERS) -> List[TableStats]:
+    """
+    Checks every table of the model against the database,
+    verifying that every column exists with a ``LIMIT 0`` select per table.
+    In fast mode, reads InnoDB's row estimates from ``information_schema.TABLES`` in one query.
+    In exact mode, runs ``COUNT(*)`` on every table.
+    Up to ``max_workers`` tables are checked concurrently, each on its own connection.
+    Requires an open connection.
+
+    Args:
+        exact: Count rows exactly, which scans every table
+        max_workers: The number of tables to check concurrently
+
+    Returns:
+        A ``TableStats`` per model, in alphabetical order.
+        ``n_rows`` is None if it is unknown or the check failed, in which case ``error`` is set.
+
+    Raises:
+        ValueError: If ``max_workers`` is not positive
+    """
+    if max_workers < 1:
+        raise ValueError(f"max_workers is {max_workers} but must be positive")
+    models = sorted(BaseModel.__subclasses__(), key=lambda m: m.__name__)
+    estimates = {} if exact else _estimates()
+
+    def check(model: Type[BaseModel]) -> TableStats:
+        t0 = time.monotonic()
+        try:
+            # fails if a column of the model is missing
+            model.select(*model._meta.sorted_fields).limit(0).execute()
+            if exact:
+                n_rows = model.select(peewee.fn.COUNT(peewee.SQL("*"))).scalar()
+            else:
+                n_rows = estimates.get(model._meta.table_name)
+            error = None
+        except peewee.DatabaseError as e:
+            n_rows, error = None, f"{e.__class__.__name__}: {e}"
+        return TableStats(model, n_rows, exact, time.monotonic() - t0, error)
+
+    if max_workers == 1:
+        return [check(model) for model in models]
+    with ThreadPoolExecutor(max_workers, thread_name_prefix="valarpy") as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, GlobalConnection.call_closing, check, model)
+            for model in models
+        ]
+        return [future.result() for future in futures]
+
+
+def _estimates() -> Dict[str, int]:
+    database = GlobalConnection.get_database()
+    if not isinstance(database, peewee.MySQLDatabase):
+        return {}
+    cursor = database.execute_sql(
+        "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()"
+    )
+    return {name: n for name, n in cursor.fetchall()}
+
+
+__all__ = ["DEFAULT_MAX_WORKERS", "TableStats", "table_stats"]
@@ -0,0 +1,353 @@
+"""
+Timings and counts of the queries that valarpy sends, collected by the databases that ``Valar`` opens.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Generator, List, NamedTuple, Optional, Tuple
+
+import peewee
+import pymysql
+from playhouse.pool import PooledMySQLDatabase
+
+from valarpy import temptables
+
+logger = logging.getLogger("valarpy")
+
+DEFAULT_LOG_SIZE = 1000
+# longer statements (usually with long IN lists) are not cached by fingerprint, to bound the memory held
+MAX_CACHED_SQL = 4096
+
+# logs that record the queries of the current thread or asyncio task, in addition to the database's
+_trackers: ContextVar[Tuple[QueryLog, ...]] = ContextVar("valarpy_trackers", default=())
+
+# packages whose frames are skipped when finding the call site of a slow query
+_INTERNAL_MODULES = ("valarpy", "peewee", "playhouse", "pymysql", "contextlib", "concurrent")
+_IN_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)|\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_LIST = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_NUMBER = re.compile(r"\b\d+\b")
+_SPACE = re.compile(r"\s+")
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+[`\"]?(\w+)", re.IGNORECASE)
+
+
+class QueryRecord(NamedTuple):
+    """
+    One executed statement.
+    ``n_rows`` is the number of rows returned or affected, if the driver reports it;
+    ``n_bytes`` is the number of bytes read from the server, which is only known for MySQL.
+    """
+
+    fingerprint: str
+    table: Optional[str]
+    seconds: float
+    n_rows: Optional[int]
+    n_bytes: Optional[int]
+    timestamp: float
+
+
+class QueryLog:
+    """
+    The most recent queries, in a ring buffer, and totals per table and fingerprint over all queries.
+    A fingerprint is the SQL with lists of parameters and numbers collapsed,
+    so that, for example, every ``fetch_all`` on ``Refs`` shares one fingerprint.
+    Thread-safe.
+    """
+
+    def __init__(self, max_size: Optional[int] = DEFAULT_LOG_SIZE):
+        """
+        Constructor.
+
+        Args:
+            max_size: The number of recent queries to keep; None for no limit
+        """
+        self.max_size = max_size
+        self._records: Deque[QueryRecord] = deque(maxlen=max_size)
+        self._by_table: Dict[Optional[str], List[Any]] = {}
+        self._by_fingerprint: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, record: QueryRecord) -> None:
+        """
+        Adds a query.
+        """
+        with self._lock:
+            self._records.append(record)
+            for key, totals in [
+                (record.table, self._by_table),
+                (record.fingerprint, self._by_fingerprint),
+            ]:
+                if key not in totals:
+                    totals[key] = [record.table, 0, 0.0, 0.0, 0, 0]
+                t = totals[key]
+                t[1] += 1
+                t[2] += record.seconds
+                t[3] = max(t[3], record.seconds)
+                t[4] += record.n_rows or 0
+                t[5] += record.n_bytes or 0
+
+    def recent(self) -> List[QueryRecord]:
+        """
+        Gets the queries in the ring buffer, oldest first.
+        """
+        with self._lock:
+            return list(self._records)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets totals over every query added.
+
+        Returns:
+            A dict with keys:
+
+                - ``n_queries``, ``seconds``, ``n_rows``, and ``n_bytes``: totals
+                - ``by_table``: a dict mapping each table (None if unknown) to a dict of
+                  ``n_queries``, ``seconds``, ``max_seconds``, ``n_rows``, and ``n_bytes``
+                - ``by_fingerprint``: the same, per fingerprint, with a ``table`` key,
+                  in decreasing order of total time
+        """
+        with self._lock:
+            by_table = {k: self._totals(v) for k, v in self._by_table.items()}
+            by_fingerprint = {
+                k: dict(table=v[0], **self._totals(v))
+                for k, v in sorted(self._by_fingerprint.items(), key=lambda kv: -kv[1][2])
+            }
+        return dict(
+            n_queries=sum(v["n_queries"] for v in by_table.values()),
+            seconds=sum(v["seconds"] for v in by_table.values()),
+            n_rows=sum(v["n_rows"] for v in by_table.values()),
+            n_bytes=sum(v["n_bytes"] for v in by_table.values()),
+            by_table=by_table,
+            by_fingerprint=by_fingerprint,
+        )
+
+    def clear(self) -> None:
+        """
+        Discards the recent queries and totals.
+        """
+        with self._lock:
+            self._records.clear()
+            self._by_table.clear()
+            self._by_fingerprint.clear()
+
+    def _totals(self, t: List[Any]) -> Dict[str, Any]:
+        return dict(n_queries=t[1], seconds=t[2], max_seconds=t[3], n_rows=t[4], n_bytes=t[5])
+
+
+def fingerprint(sql: str) -> Tuple[str, Optional[str]]:
+    """
+    Gets the fingerprint and first table of a SQL statement.
+    The results for statements shorter than ``MAX_CACHED_SQL`` characters are cached.
+
+    Returns:
+        The fingerprint and the table name, or None if no table was found
+    """
+    if len(sql) < MAX_CACHED_SQL:
+        return _cached_fingerprint(sql)
+    return _fingerprint(sql)
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_fingerprint(sql: str) -> Tuple[str, Optional[str]]:
+    return _fingerprint(sql)
+
+
+def _fingerprint(sql: str) -> Tuple[str, Optional[str]]:
+    fp = _IN_LIST.sub("(...)", sql)
+    fp = _VALUES_LIST.sub("(...)", fp)
+    fp = _SPACE.sub(" ", _NUMBER.sub("?", fp)).strip()
+    match = _TABLE.search(sql)
+    return fp, None if match is None else match.group(1)
+
+
+@contextmanager
+def tracking(max_size: Optional[int] = DEFAULT_LOG_SIZE) -> Generator[QueryLog, None, None]:
+    """
+    Records the queries run in this block by the current thread or asyncio task (and tasks it starts)
+    in a new ``QueryLog``, in addition to the database's log.
+    Blocks can be nested.
+
+    Args:
+        max_size: The number of recent queries to keep in the new log
+
+    Yields:
+        The new ``QueryLog``
+    """
+    log = QueryLog(max_size)
+    token = _trackers.set(_trackers.get() + (log,))
+    try:
+        yield log
+    finally:
+        _trackers.reset(token)
+
+
+class CountingConnection(pymysql.connections.Connection):
+    """
+    A PyMySQL connection that counts the bytes it reads from the server.
+    """
+
+    bytes_read = 0
+
+    def _read_bytes(self, num_bytes: int) -> bytes:
+        data = super()._read_bytes(num_bytes)
+        self.bytes_read += len(data)
+        return data
+
+
+class InstrumentedDatabase(peewee.Database):
+    """
+    A peewee database mixin that records every ``execute_sql`` call in a ``QueryLog``
+    and logs a warning with the call site of each query slower than ``slow_query_sec``.
+    """
+
+    def __init__(
+        self,
+        *args,
+        query_log: Optional[QueryLog] = None,
+        slow_query_sec: Optional[float] = None,
+        **kwargs,
+    ):
+        self.query_log = QueryLog() if query_log is None else query_log
+        self.slow_query_sec = slow_query_sec
+        super().__init__(*args, **kwargs)
+
+    def execute(self, query, *args, **kwargs):
+        # the statement is compiled to run, so temporary tables may be created for it
+        with temptables.executing():
+            return super().execute(query, *args, **kwargs)
+
+    def execute_sql(self, sql, params=None, *args, **kwargs):
+        n_bytes = self.bytes_read()
+        t0 = time.perf_counter()
+        cursor = None
+        try:
+            cursor = super().execute_sql(sql, params, *args, **kwargs)
+            return cursor
+        finally:
+            n_rows = None if cursor is None else cursor.rowcount
+            self.record(sql, time.perf_counter() - t0, n_rows, n_bytes)
+
+    def bytes_read(self) -> Optional[int]:
+        """
+        Gets the number of bytes that this thread's connection has read, if it is known.
+        """
+        return getattr(self._state.conn, "bytes_read", None)
+
+    def record(
+        self, sql: str, seconds: float, n_rows: Optional[int], bytes_before: Optional[int]
+    ) -> None:
+        """
+        Records a query that was executed on this database.
+
+        Args:
+            sql: The SQL, with placeholders for parameters
+            seconds: The time taken, including reading the rows
+            n_rows: The number of rows returned or affected; negative or None if unknown
+            bytes_before: The value of ``bytes_read()`` before executing
+        """
+        bytes_after = self.bytes_read()
+        n_bytes = None
+        if bytes_before is not None and bytes_after is not None:
+            n_bytes = bytes_after - bytes_before
+        fp, table = fingerprint(sql)
+        n_rows = None if n_rows is None or n_rows < 0 else n_rows
+        record = QueryRecord(fp, table, seconds, n_rows, n_bytes, time.time())
+        self.query_log.add(record)
+        for log in _trackers.get():
+            log.add(record)
+        if self.slow_query_sec is not None and seconds >= self.slow_query_sec:
+            logger.warning(f"Slow query ({seconds:.3f} s) from {_call_site()}: {fp}")
+
+
+class InstrumentedMySQLDatabase(InstrumentedDatabase, peewee.MySQLDatabase):
+    """
+    A ``MySQLDatabase`` that records its queries and the bytes read.
+    """
+
+    def _connect(self):
+        return CountingConnection(db=self.database, autocommit=True, **self.connect_params)
+
+
+class InstrumentedPooledMySQLDatabase(PooledMySQLDatabase, InstrumentedMySQLDatabase):
+    """
+    A ``PooledMySQLDatabase`` that records its queries and the bytes read.
+    A connection checked out to run a statement outside a transaction is returned to the pool after it,
+    so threads that only read do not hold connections.
+    Before returning a connection to the pool, drops its temporary tables (see ``valarpy.temptables``).
+    """
+
+    def execute(self, query, *args, **kwargs):
+        # compiling can create temporary tables (see temptables.IdIn), so keep the connection until the end
+        with self.returning_connection():
+            return super().execute(query, *args, **kwargs)
+
+    def execute_sql(self, sql, params=None, *args, **kwargs):
+        with self.returning_connection():
+            return super().execute_sql(sql, params, *args, **kwargs)
+
+    @contextmanager
+    def returning_connection(self) -> Generator[None, None, None]:
+        """
+        Returns a connection that this thread checks out in the block to the pool on exit,
+        unless a transaction is still open.
+        A connection that the thread already had is kept.
+        Rows of ordinary (buffered) cursors can still be read after the connection is returned.
+        """
+        checked_out = self.is_closed()
+        try:
+            yield
+        finally:
+            if checked_out and not self.is_closed() and not self.in_transaction():
+                try:
+                    self.close()
+                except peewee.DatabaseError:
+                    logger.debug("Failed to return a connection to the pool", exc_info=True)
+
+    def _close(self, conn, close_conn=False):
+        if not close_conn:
+            try:
+                temptables.drop_id_tables(self)
+            except peewee.DatabaseError:
+                # don't return a connection that may still hold tables
+                logger.debug("Closing a connection that failed to drop its tables", exc_info=True)
+                close_conn = True
+        super()._close(conn, close_conn=close_conn)
+
+
+class InstrumentedSqliteDatabase(InstrumentedDatabase, peewee.SqliteDatabase):
+    """
+    A ``SqliteDatabase`` that records its queries, for snapshots (see ``valarpy.snapshot``).
+    """
+
+
+def _call_site() -> str:
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith(_INTERNAL_MODULES):
+            return f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "<unknown>"
+
+
+__all__ = [
+    "CountingConnection",
+    "DEFAULT_LOG_SIZE",
+    "InstrumentedDatabase",
+    "InstrumentedMySQLDatabase",
+    "InstrumentedPooledMySQLDatabase",
+    "InstrumentedSqliteDatabase",
+    "MAX_CACHED_SQL",
+    "QueryLog",
+    "QueryRecord",
+    "fingerprint",
+    "tracking",
+]
@@ -1,9 +1,30 @@
 from __future__ import annotations
+
+import contextvars
+import functools
+import itertools
+import operator
+import sys
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from numbers import Integral
-from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Union
+from types import MappingProxyType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-import pandas as pd
 import peewee
 from peewee import *
 
@@ -13,9 +34,17 @@ from valarpy import (
     UnsupportedOperationError,
     WriteNotEnabledError,
 )
-from valarpy.connection import GlobalConnection
+from valarpy import replicas, temptables
+from valarpy.caching import DatabaseCaches
+from valarpy.connection import GlobalConnection, streaming_cursor
+
+if TYPE_CHECKING:  # pragma: no cover
+    import pandas as pd
 
-database = GlobalConnection._peewee_database
+    from valarpy.frames import TableDescriptionFrame
+
+database = GlobalConnection.database
+DEFAULT_BATCH_SIZE = 10000
 
 
 # noinspection PyProtectedMember
@@ -55,24 +84,278 @@ class UnknownField(object):  # pragma: no cover
         pass
 
 
-class TableDescriptionFrame(pd.DataFrame):
+def __getattr__(name: str) -> Any:
+    # PEP 562: defer importing pandas
+    if name == "TableDescriptionFrame":
+        from valarpy.frames import TableDescriptionFrame
+
+        return TableDescriptionFrame
+    raise AttributeError(f"module {__name__} has no attribute {name}")
+
+
+def _is_data_frame(obj: Any) -> bool:
+    # a DataFrame can only exist if pandas was already imported
+    pd = sys.modules.get("pandas")
+    return pd is not None and isinstance(obj, pd.DataFrame)
+
+
+def _dtype_of(field: peewee.Field) -> str:
+    # nullable pandas types, so that NULLs don't turn integer columns into floats
+    if isinstance(field, (peewee.ForeignKeyField, peewee.IntegerField)):
+        return "Int64"
+    elif isinstance(field, peewee.FloatField):
+        return "float64"
+    elif isinstance(field, peewee.BooleanField):
+        return "boolean"
+    elif isinstance(field, EnumField):
+        return "category"
+    elif isinstance(field, (peewee.DateTimeField, peewee.DateField)):
+        return "datetime64[ns]"
+    return "object"
+
+
+class ModelInfo:
+    """
+    Metadata about a model that is computed once, when its class is created.
+    Lookup methods like ``fetch`` use this rather than inspecting the fields on every call.
+    """
+
+    def __init__(self, model: type):
+        """
+        Constructor.
+
+        Args:
+            model: A fully created subclass of ``BaseModel``
+        """
+        fields = model._meta.fields
+        self.model = model
+        # columns that fetch() matches strings against
+        self.indexing_cols: Tuple[str, ...] = tuple(
+            k for k, v in fields.items() if v.unique and v.field_type in {"VARCHAR", "CHAR", "ENUM"}
+        )
+        self.blob_cols: Tuple[str, ...] = tuple(
+            k for k, v in fields.items() if isinstance(v, peewee.BlobField)
+        )
+        self.text_cols: Tuple[str, ...] = tuple(
+            k for k, v in fields.items() if isinstance(v, peewee.TextField)
+        )
+        # maps each foreign key column to the model it references
+        self.foreign_keys: Mapping[str, type] = MappingProxyType(
+            {k: v.rel_model for k, v in fields.items() if isinstance(v, peewee.ForeignKeyField)}
+        )
+        self.dtypes: Mapping[str, str] = MappingProxyType(
+            {k: _dtype_of(v) for k, v in fields.items()}
+        )
+        self.description: Tuple[Mapping[str, Any], ...] = tuple(
+            MappingProxyType(
+                {
+                    "name": v.name,
+                    "type": v.field_type,
+                    "nullable": v.null,
+                    "choices": v.choices if hasattr(v, "choices") else None,
+                    "primary": v.primary_key,
+                    "unique": v.unique,
+                    "constraints": 0 if v.constraints is None else len(v.constraints),
+                }
+            )
+            for v in fields.values()
+        )
+        self.schema = ",\n".join(
+            [
+                " ".join(
+                    [
+                        d["name"],
+                        d["type"] + (str(d["choices"]) if d["choices"] is not None else ""),
+                        ("NULL" if d["nullable"] else "NOT NULL"),
+                        ("PRIMARY KEY" if d["primary"] else ("UNIQUE" if d["unique"] else "")),
+                    ]
+                ).rstrip()
+                for d in self.description
+            ]
+        )
+        # maps each blob or text column to the column that holds its SHA-1 digest
+        self.blob_hashes: Mapping[str, str] = MappingProxyType(
+            dict(getattr(model._meta, "blob_hashes", {}))
+        )
+        for col, hash_col in self.blob_hashes.items():
+            if col not in fields or hash_col not in fields:
+                raise ValueError(f"Invalid blob_hashes {col}: {hash_col} in {model.__name__}")
+        # columns left out of select() until accessed; see DeferredAccessor
+        self.deferred: Tuple[str, ...] = tuple(getattr(model._meta, "deferred", ()))
+        for col in self.deferred:
+            if col not in fields:
+                raise ValueError(f"Invalid deferred column {col} in {model.__name__}")
+        self.default_fields: Tuple[peewee.Field, ...] = tuple(
+            f for f in model._meta.sorted_fields if f.name not in self.deferred
+        )
+        cache = getattr(model._meta, "cache", None)
+        self.lookup_cache: Optional[DatabaseCaches] = None
+        if cache is not None:
+            # each row is stored under its id and under each of its unique string values
+            max_size = cache.get("max_size")
+            if max_size is not None:
+                max_size *= 1 + len(self.indexing_cols)
+            self.lookup_cache = DatabaseCaches(max_size=max_size, ttl=cache.get("ttl"))
+        # SQL to select one row by id or by unique string value, compiled once per database type
+        self._lookup_templates: Dict[Tuple[type, bool], Tuple[peewee.ModelSelect, str]] = {}
+
+    def lookup_template(self, db: peewee.Database, by_str: bool) -> Tuple[peewee.ModelSelect, str]:
+        """
+        Gets a query that selects a row by ``id`` (if not ``by_str``) or by the indexing columns.
+        The SQL takes one parameter for ``id``, or the string once per indexing column.
+
+        Args:
+            db: The database the SQL will be executed on
+            by_str: Match the indexing columns rather than ``id``
+
+        Returns:
+            The query (for reading rows from the cursor) and its SQL
+        """
+        key = type(db), by_str
+        template = self._lookup_templates.get(key)
+        if template is None:
+            model = self.model
+            query = model.select()
+            if by_str:
+                query = query.where(
+                    functools.reduce(
+                        operator.or_, [getattr(model, col) == "" for col in self.indexing_cols]
+                    )
+                )
+            else:
+                query = query.where(model.id == 0)
+            sql, _ = db.get_sql_context().sql(query).query()
+            template = query, sql
+            self._lookup_templates[key] = template
+        return template
+
+
+class ValarSelect(peewee.ModelSelect):
+    """
+    A peewee ``ModelSelect`` that can also read its results directly into a DataFrame.
+    ``BaseModel.select`` returns this.
+    """
+
+    def to_frame(self, chunk_size: int = DEFAULT_BATCH_SIZE) -> pd.DataFrame:
+        """
+        Runs the query and builds a DataFrame without creating model instances.
+        Columns are named by field name or alias; field names that occur more than once
+        (from joined tables) are prefixed by their table name after the first.
+        The dtypes come from the fields; for example, an ``EnumField`` becomes categorical
+        and an ``IntegerField`` becomes a nullable ``Int64``.
+
+        Examples:
+            Wells.select(Wells.id, Wells.well_index).where(Wells.run == 5).to_frame()
+
+        Args:
+            chunk_size: The number of rows to read from the cursor at a time
+
+        Returns:
+            A DataFrame with a column per selected expression
+        """
+        cursor = self._database.execute(self)
+        names, dtypes = self._frame_columns(cursor)
+        buffers = [[] for _ in names]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if len(rows) == 0:
+                break
+            for buffer, values in zip(buffers, zip(*rows)):
+                buffer.extend(values)
+        return self._build_frame(names, dtypes, buffers)
+
+    def _frame_columns(self, cursor: Any) -> Tuple[List[str], List[Optional[str]]]:
+        names, dtypes = [], []
+        for i, node in enumerate(self._returning):
+            dtype = None
+            if isinstance(node, peewee.Field):
+                name = node.name
+                info = getattr(node.model, "_valar_info", None)
+                if info is not None:
+                    dtype = info.dtypes.get(node.name)
+                if name in names:
+                    name = f"{node.model._meta.table_name}.{name}"
+            elif isinstance(node, peewee.Alias):
+                name = node._alias
+            else:
+                name = cursor.description[i][0]
+            names.append(name)
+            dtypes.append(dtype)
+        return names, dtypes
+
+    def _build_frame(
+        self,
+        names: Sequence[str],
+        dtypes: Sequence[Optional[str]],
+        columns: Sequence[Sequence[Any]],
+    ) -> pd.DataFrame:
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                name: pd.Series(column, dtype=dtype)
+                for name, dtype, column in zip(names, dtypes, columns)
+            }
+        )
+
+
+class _Patterns(peewee._HashableSource, peewee.BaseTable):
+    """
+    A derived table of ``(idx, pattern)`` rows, written as ``SELECT ... UNION ALL SELECT ...``,
+    which (unlike ``VALUES`` lists) MySQL, MariaDB, and SQLite all accept.
+    """
+
+    def __init__(self, patterns: Sequence[str], alias: str = "valar_patterns"):
+        self._patterns = patterns
+        super().__init__(alias=alias)
+
+    def _get_hash(self):
+        return hash((self.__class__, id(self._patterns), self._alias))
+
+    def __sql__(self, ctx):
+        ctx.alias_manager[self] = self._alias
+        if ctx.scope != peewee.SCOPE_SOURCE:
+            return ctx.sql(peewee.Entity(self._alias))
+        ctx.literal("(")
+        for i, pattern in enumerate(self._patterns):
+            if i > 0:
+                ctx.literal(" UNION ALL ")
+            ctx.literal("SELECT ").value(i).literal(" AS ").sql(peewee.Entity("idx"))
+            ctx.literal(", ").value(pattern).literal(" AS ").sql(peewee.Entity("pattern"))
+        return ctx.literal(") AS ").sql(peewee.Entity(self._alias))
+
+
+class DeferredAccessor(peewee.FieldAccessor):
     """
-    A Pandas DataFrame subclass that contains the columns::
-
-        - keys name (str)
-        - type (str)
-        - length (int or None)
-        - nullable (bool)
-        - choices (set or list)
-        - primary (bool)
-        - unique (bool)
-        - constraints (list of constraint objects)
+    Accessor for a column in ``Meta.deferred``, which ``select()`` leaves out by default.
+    The value is queried on first access if the instance was loaded without it.
+    To load it for many instances in one query, use ``BaseModel.load_deferred``.
     """
 
-    pass
+    def __get__(self, instance, instance_type=None):
+        if instance is not None and self.name not in instance.__data__ and instance.id is not None:
+            value = (
+                self.model.select(self.field).where(self.model.id == instance.id).tuples().scalar()
+            )
+            # not a change, so it must not be marked dirty
+            instance.__data__[self.name] = value
+        return super().__get__(instance, instance_type)
 
 
-class BaseModel(Model):
+class ValarModelBase(peewee.ModelBase):
+    """
+    Metaclass of ``BaseModel`` that attaches a ``ModelInfo`` to each model class.
+    """
+
+    def __new__(mcs, name, bases, attrs, **kwargs):
+        cls = super().__new__(mcs, name, bases, attrs, **kwargs)
+        cls._valar_info = ModelInfo(cls)
+        for col in cls._valar_info.deferred:
+            setattr(cls, col, DeferredAccessor(cls, cls._meta.fields[col], col))
+        return cls
+
+
+class BaseModel(Model, metaclass=ValarModelBase):
     """
     A table model in Valar through Valarpy and peewee.
     Provides functions in additional to the normal peewee functions.
@@ -83,11 +366,73 @@ class BaseModel(Model):
 
     def save(self, force_insert=False, only=None) -> Union[bool, int]:
         self._ensure_write()
-        return super().save(force_insert, only)
+        with replicas.on_primary():
+            return super().save(force_insert, only)
 
     def delete_instance(self, recursive=False, delete_nullable=False) -> Any:
         self._ensure_write()
-        return super().delete_instance(recursive, delete_nullable)
+        with replicas.on_primary():
+            return super().delete_instance(recursive, delete_nullable)
+
+    @classmethod
+    def select(cls, *fields) -> ValarSelect:
+        """
+        Starts a SELECT query.
+        By default, selects every column except those in ``Meta.deferred``;
+        those are loaded on access or by ``load_deferred``.
+
+        Args:
+            fields: Select only these fields, models, or expressions
+
+        Returns:
+            A ``ValarSelect``, which is a peewee ``ModelSelect``
+        """
+        is_default = not fields
+        if not fields:
+            fields = cls._valar_info.default_fields
+        return ValarSelect(cls, fields, is_default=is_default)
+
+    @classmethod
+    def load_deferred(
+        cls, rows: Iterable[BaseModel], *fields: Union[str, peewee.Field]
+    ) -> Sequence[BaseModel]:
+        """
+        Loads deferred columns into many instances, with one query per ``DEFAULT_BATCH_SIZE`` rows.
+        Values that are already loaded are not queried again.
+
+        Examples:
+            runs = Runs.list_where(Runs.experiment == 5)
+            Runs.load_deferred(runs, Runs.notes)
+
+        Args:
+            rows: Instances of this model
+            fields: Fields or field names; all of ``Meta.deferred`` by default
+
+        Returns:
+            The instances, as a list
+
+        Raises:
+            ValarTableTypeError: If a row is not an instance of this model
+            ValueError: If a field does not belong to this model
+        """
+        rows = list(rows)
+        if len(fields) == 0:
+            fields = cls._valar_info.deferred
+        fields = cls.__fields_of(fields)
+        by_id = defaultdict(list)
+        for row in rows:
+            if not isinstance(row, cls):
+                raise ValarTableTypeError(f"Loading a {row.__class__.__name__} on {cls.__name__}")
+            if row.id is not None and any(f.name not in row.__data__ for f in fields):
+                by_id[row.id].append(row)
+        ids = list(by_id.keys())
+        for i in range(0, len(ids), DEFAULT_BATCH_SIZE):
+            query = cls.select(cls.id, *fields).where(cls.id << ids[i : i + DEFAULT_BATCH_SIZE])
+            for row_id, *values in query.tuples().iterator():
+                for row in by_id[row_id]:
+                    for field, value in zip(fields, values):
+                        row.__data__.setdefault(field.name, value)
+        return rows
 
     @classmethod
     def update(cls, __data=None, **update) -> peewee.ModelUpdate:
@@ -104,6 +449,57 @@ class BaseModel(Model):
         cls._ensure_write()
         return super().insert_many(rows, fields)
 
+    @classmethod
+    def bulk_load(
+        cls,
+        rows: Union[pd.DataFrame, Iterable[Sequence[Any]]],
+        fields: Optional[Sequence[Union[str, peewee.Field]]] = None,
+        batch_size: Optional[int] = None,
+        infile_min_rows: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Inserts many rows in one transaction, using as few statements as possible.
+        Each INSERT is sized to fit in the server's ``max_allowed_packet``.
+        With ``infile_min_rows``, a larger set of rows is instead written to a temporary file
+        and sent with ``LOAD DATA LOCAL INFILE``,
+        which requires ``"local_infile": true`` in the connection config and ``local_infile`` on the server.
+        Either all rows are inserted or none are.
+
+        Examples:
+            ids = Wells.bulk_load(df[["run", "well_index", "control_type"]])
+            ids = Refs.bulk_load([("ref_a",), ("ref_b",)], fields=[Refs.name])
+
+        Args:
+            rows: A DataFrame whose columns are field names, or tuples of values in the order of ``fields``;
+                  null values in a DataFrame (like ``NaN``) are inserted as NULL
+            fields: Fields or field names; defaults to the DataFrame's columns, and required for tuples
+            batch_size: The maximum number of rows per INSERT, if it should be less than what fits
+            infile_min_rows: Use ``LOAD DATA LOCAL INFILE`` if there are at least this many rows
+
+        Returns:
+            The ``id`` of each inserted row, in order
+
+        Raises:
+            WriteNotEnabledError: If writes are not enabled
+            ValueError: If ``fields`` is missing or contains a field of another model
+            peewee.IntegrityError: If ``LOAD DATA`` skipped rows (like those with duplicate keys)
+        """
+        cls._ensure_write()
+        if _is_data_frame(rows):
+            fields = list(rows.columns) if fields is None else fields
+            objects = rows.astype(object)
+            rows = list(objects.where(objects.notna(), None).itertuples(index=False, name=None))
+        elif fields is None:
+            raise ValueError(f"fields must be given to load tuples into {cls.__name__}")
+        else:
+            rows = [tuple(row) for row in rows]
+        fields = cls.__fields_of(fields)
+        from valarpy import bulk
+
+        return bulk.bulk_load(
+            cls, fields, rows, batch_size=batch_size, infile_min_rows=infile_min_rows
+        )
+
     @classmethod
     def insert_from(cls, query, fields) -> peewee.ModelInsert:
         cls._ensure_write()
@@ -131,32 +527,39 @@ class BaseModel(Model):
     @classmethod
     def create(cls, **query) -> BaseModel:
         cls._ensure_write()
-        return super().create(**query)
+        with replicas.on_primary():
+            return super().create(**query)
 
     @classmethod
     def bulk_create(cls, model_list, batch_size=None) -> Optional[Any]:
         cls._ensure_write()
-        return super().bulk_create(model_list, batch_size)
+        with replicas.on_primary():
+            return super().bulk_create(model_list, batch_size)
 
     @classmethod
     def bulk_update(cls, model_list, fields, batch_size=None) -> int:
         cls._ensure_write()
-        return super().bulk_update(model_list, fields, batch_size)
+        with replicas.on_primary():
+            return super().bulk_update(model_list, fields, batch_size)
 
     @classmethod
     def set_by_id(cls, key, value) -> Any:
         cls._ensure_write()
-        return super().set_by_id(key, value)
+        with replicas.on_primary():
+            return super().set_by_id(key, value)
 
     @classmethod
     def delete_by_id(cls, pk) -> Any:
         cls._ensure_write()
-        return super().delete_by_id(pk)
+        with replicas.on_primary():
+            return super().delete_by_id(pk)
 
     @classmethod
     def get_or_create(cls, **kwargs) -> BaseModel:
         cls._ensure_write()
-        return super().get_or_create(**kwargs)
+        # the SELECT (and the retry after an IntegrityError) must see rows a replica may not have yet
+        with replicas.on_primary():
+            return super().get_or_create(**kwargs)
 
     @classmethod
     def drop_table(cls, safe=True, drop_sequences=True, **options) -> None:
@@ -168,8 +571,66 @@ class BaseModel(Model):
 
     @classmethod
     def _ensure_write(cls):
-        if not GlobalConnection._write_enabled:
+        if not GlobalConnection.is_write_enabled():
             raise WriteNotEnabledError()
+        # every write path calls this, so it's where we invalidate
+        cls.clear_cache()
+
+    @classmethod
+    def cache_info(cls) -> Optional[Dict[str, int]]:
+        """
+        Gets statistics about the lookup cache, which is enabled per model by setting ``cache`` in ``Meta``.
+        If enabled, ``fetch``, ``fetch_or_none``, ``fetch_all``, ``fetch_all_or_none``, and ``fetch_to_query``
+        first look up rows by ``id`` and the values of ``get_indexing_cols()`` in the cache.
+        ``Meta.cache`` is a dict with optional keys ``ttl`` (seconds) and ``max_size`` (number of rows).
+        Each database (like a server connection or a snapshot) has its own cache.
+        The cache is cleared on every write through the model in this process,
+        and every cache of a database is cleared when a transaction on it (``atomic`` or ``rolling_back``) ends.
+        Rows read inside a transaction are not cached.
+        Rows changed by other processes can be stale for up to ``ttl`` seconds.
+
+        Examples:
+            class Refs(BaseModel):
+                ...
+                class Meta:
+                    cache = {"ttl": 600, "max_size": 1000}
+
+        Returns:
+            None if not enabled; otherwise see ``LruCache.info``, for the cache of the bound database
+        """
+        cache = cls._valar_info.lookup_cache
+        db = cls.__resolved_database()
+        return None if cache is None or db is None else cache.get(db).info()
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """
+        Empties the lookup cache of every database; see ``cache_info``.
+        """
+        cache = cls._valar_info.lookup_cache
+        if cache is not None:
+            cache.clear()
+
+    @classmethod
+    def __get_cached(cls, key: Union[int, str]) -> Optional[BaseModel]:
+        cache = cls._valar_info.lookup_cache
+        db = cls.__resolved_database()
+        return None if cache is None or db is None else cache.get(db).get(key)
+
+    @classmethod
+    def __put_cached(cls, row: Optional[BaseModel]) -> Optional[BaseModel]:
+        cache = cls._valar_info.lookup_cache
+        db = cls.__resolved_database()
+        # rows read in a transaction may be uncommitted
+        if cache is None or row is None or db is None or db.in_transaction():
+            return row
+        cache = cache.get(db)
+        cache.put(row.id, row)
+        for col in cls._valar_info.indexing_cols:
+            value = getattr(row, col)
+            if value is not None:
+                cache.put(value, row)
+        return row
 
     def get_data(self) -> Dict[str, Any]:
         """
@@ -218,7 +679,7 @@ class BaseModel(Model):
                   - unique (bool)
                   - constraints (list of constraint objects)
         """
-        return cls.__description()
+        return [dict(d) for d in cls._valar_info.description]
 
     @classmethod
     def get_desc(cls) -> TableDescriptionFrame:
@@ -248,8 +709,12 @@ class BaseModel(Model):
             else:
                 return dataframe[col_seq + [c for c in dataframe.columns if c not in col_seq]]
 
+        import pandas as pd
+
+        from valarpy.frames import TableDescriptionFrame
+
         # noinspection PyTypeChecker
-        df = pd.DataFrame.from_dict(cls.__description())
+        df = pd.DataFrame.from_dict(cls.get_desc_list())
         return TableDescriptionFrame(
             _cfirst(df, ["name", "type", "nullable", "choices", "primary", "unique"])
         )
@@ -262,34 +727,7 @@ class BaseModel(Model):
         Returns:
             A string that is **approximately** the text returned by the SQL ``SHOW CREATE TABLE tablename``
         """
-        return ",\n".join(
-            [
-                " ".join(
-                    [
-                        d["name"],
-                        d["type"] + (str(d["choices"]) if d["choices"] is not None else ""),
-                        ("NULL" if d["nullable"] else "NOT NULL"),
-                        ("PRIMARY KEY" if d["primary"] else ("UNIQUE" if d["unique"] else "")),
-                    ]
-                ).rstrip()
-                for d in cls.__description()
-            ]
-        )
-
-    @classmethod
-    def __description(cls) -> List[Dict[str, str]]:  # pragma: no cover
-        return [
-            {
-                "name": v.name,
-                "type": v.field_type,
-                "nullable": v.null,
-                "choices": v.choices if hasattr(v, "choices") else None,
-                "primary": v.primary_key,
-                "unique": v.unique,
-                "constraints": 0 if v.constraints is None else len(v.constraints),
-            }
-            for k, v in cls._meta.fields.items()
-        ]
+        return cls._valar_info.schema
 
     @classmethod
     def list_where(cls, *wheres: Sequence[peewee.Expression], **values: Mapping[str, Any]):
@@ -303,12 +741,121 @@ class BaseModel(Model):
         Returns:
             The table rows in a list
         """
+        return list(cls._where(*wheres, **values))
+
+    @classmethod
+    def iter_where(
+        cls,
+        *wheres: Sequence[peewee.Expression],
+        chunk_size: Optional[int] = None,
+        as_frame: bool = False,
+        **values: Mapping[str, Any],
+    ) -> Iterator[Union[BaseModel, List[BaseModel], pd.DataFrame]]:
+        """
+        Like ``list_where``, but streams the rows so that memory use is bounded.
+        Rows are read from an unbuffered server-side cursor (see ``valarpy.connection.streaming_cursor``),
+        so the connection cannot run other queries until iteration finishes.
+        To run queries while iterating, do so from another thread, which uses its own connection.
+
+        Examples:
+            for wells in Wells.iter_where(Wells.run == 5, chunk_size=1000):
+                print(len(wells))
+
+        Args:
+            wheres: List of Peewee WHERE expressions (like ``Users.id==1``) to be joined by AND
+            chunk_size: If set, yield lists of up to this many rows
+            as_frame: Yield DataFrames of up to ``chunk_size`` rows (default 10,000), with a column per field
+            values: Explicit values (like ``id=1``), also joined by AND
+
+        Returns:
+            An iterator of model instances, or of lists or DataFrames if ``chunk_size`` or ``as_frame`` is set
+
+        Raises:
+            ValueError: If ``chunk_size`` is not positive
+        """
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError(f"chunk_size is {chunk_size} but must be positive")
+        query = cls._where(*wheres, **values)
+        if as_frame:
+            chunk_size = DEFAULT_BATCH_SIZE if chunk_size is None else chunk_size
+        return cls.__stream(query, chunk_size, as_frame)
+
+    @classmethod
+    def __stream(
+        cls, query: ValarSelect, chunk_size: Optional[int], as_frame: bool
+    ) -> Iterator[Union[BaseModel, List[BaseModel], pd.DataFrame]]:
+        with streaming_cursor(cls.__resolved_database(), query) as cursor:
+            if as_frame:
+                names, dtypes = query._frame_columns(cursor)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if len(rows) == 0:
+                        return
+                    yield query._build_frame(names, dtypes, list(zip(*rows)))
+            rows = query._get_cursor_wrapper(cursor).iterator()
+            if chunk_size is None:
+                yield from rows
+                return
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if len(chunk) == 0:
+                    return
+                yield chunk
+
+    @classmethod
+    def frame_where(
+        cls,
+        *wheres: Sequence[peewee.Expression],
+        columns: Optional[Sequence[Union[str, peewee.Field]]] = None,
+        **values: Mapping[str, Any],
+    ) -> pd.DataFrame:
+        """
+        Like ``list_where``, but returns a DataFrame without creating model instances.
+        See ``ValarSelect.to_frame``.
+
+        Examples:
+            Wells.frame_where(Wells.run == 5, columns=["id", "well_index", "control_type"])
+
+        Args:
+            wheres: List of Peewee WHERE expressions (like ``Users.id==1``) to be joined by AND
+            columns: Only select these fields or field names, in order;
+                     leaving out large ``BLOB`` and ``TEXT`` columns avoids transferring them
+            values: Explicit values (like ``id=1``), also joined by AND
+
+        Returns:
+            A DataFrame with a column per field
+
+        Raises:
+            ValueError: If a column name is not a field of this model
+        """
+        query = cls._where(*wheres, **values)
+        if columns is not None:
+            query = query.select(*cls.__fields_of(columns))
+        return query.to_frame()
+
+    @classmethod
+    def __fields_of(cls, columns: Sequence[Union[str, peewee.Field]]) -> List[peewee.Field]:
+        fields = []
+        for column in columns:
+            if isinstance(column, str):
+                if column not in cls._meta.fields:
+                    raise ValueError(f"{column} is not a field of {cls.__name__}")
+                column = cls._meta.fields[column]
+            elif isinstance(column, peewee.Field) and column.model is not cls:
+                raise ValueError(f"{column} is not a field of {cls.__name__}")
+            fields.append(column)
+        return fields
+
+    @classmethod
+    def _where(
+        cls, *wheres: Sequence[peewee.Expression], **values: Mapping[str, Any]
+    ) -> ValarSelect:
         query = cls.select()
         for where in wheres:
             query = query.where(where)
         for name, value in values.items():
             query = query.where(getattr(cls, name) == value)
-        return list(query)
+        return query
 
     @classmethod
     def fetch_or_none(
@@ -348,10 +895,18 @@ class BaseModel(Model):
                 f"Fetching a {thing.__class__.__name__} on class {cls.__name__}"
             )
         elif isinstance(thing, Integral) or isinstance(thing, float):
-            # noinspection PyUnresolvedReferences
-            return cls.get_or_none(cls.id == int(thing))
-        elif isinstance(thing, str) and len(cls.__indexing_cols()) > 0:
-            return cls.get_or_none(cls._build_or_query([thing], like=like, regex=regex))
+            cached = cls.__get_cached(int(thing))
+            if cached is not None:
+                return cached
+            return cls.__put_cached(cls.__lookup_one(False, (int(thing),)))
+        elif isinstance(thing, str) and len(cls._valar_info.indexing_cols) > 0:
+            if like or regex:
+                return cls.get_or_none(cls._build_or_query([thing], like=like, regex=regex))
+            cached = cls.__get_cached(thing)
+            if cached is not None:
+                return cached
+            params = (thing,) * len(cls._valar_info.indexing_cols)
+            return cls.__put_cached(cls.__lookup_one(True, params))
         else:
             raise TypeError(
                 f"Fetching with unknown type {thing.__class__.__name__} on class {cls.__name__}"
@@ -396,24 +951,33 @@ class BaseModel(Model):
 
     @classmethod
     def fetch_all(
-        cls, things: Iterable[Union[Integral, str, peewee.Model]]
+        cls,
+        things: Iterable[Union[Integral, str, peewee.Model]],
+        batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+        max_workers: int = 1,
     ) -> Sequence[peewee.Model]:
         """
         Fetches rows corresponding to ``things`` from their instances, IDs, or values from unique columns.
         See ``fetch`` for full information.
         Also see ``fetch_all_or_none`` for a similar function.
         This method is preferrable to calling ``fetch`` repeatedly because it minimizes the number of queries.
-        Specifically, it will perform 0, 1, or 2 queries depending on the passed types::
+        Specifically, it performs one query per ``batch_size`` distinct IDs and string values::
 
-            - If only instances are passed, it just returns them (0 queries)
-            - If only IDs or only string values are passed, it performs 1 query
-            - If both IDs and string values are passed, it performs 2 queries
+            - If only instances (or cached rows) are passed, it just returns them (0 queries)
+            - Otherwise, IDs and string values are looked up together in the same queries
 
         Examples:
             # assuming John has ID 2 and Alex has user ID 14
             users = Users.fetch_all(['john', 14, 'john', Users.get(Users.id == 2)])
             print(users)  # [Users(2), Users(14), Users(2), Users(2)]
 
+        Args:
+            things: The instances, IDs, and values to look up
+            batch_size: The maximum number of distinct IDs and values to look up per query
+                        (None for no limit)
+            max_workers: Run this many queries concurrently (each on its own connection);
+                         inside a transaction, they run one at a time so that they see its rows
+
         Returns:
             A sequence of the rows found, in the same order as they were passed
 
@@ -428,30 +992,45 @@ class BaseModel(Model):
                 raise ValarLookupError(f"Could not find {thing} in {cls}")
             return thing
 
-        return [_x(thing) for thing in cls.fetch_all_or_none(things)]
+        return [
+            _x(thing)
+            for thing in cls.fetch_all_or_none(
+                things, batch_size=batch_size, max_workers=max_workers
+            )
+        ]
 
     @classmethod
     def fetch_all_or_none(
         cls,
         things: Iterable[Union[Integral, str, peewee.Model]],
         join_fn: Optional[Callable[[peewee.Expression], peewee.Expression]] = None,
-    ) -> Iterable[peewee.Model]:
+        batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+        max_workers: int = 1,
+    ) -> Sequence[Optional[peewee.Model]]:
         """
         Fetches rows corresponding to ``things`` from their instances, IDs, or values from unique columns.
         See ``fetch`` for full information.
         Also see ``fetch_all`` for a similar function.
         This method is preferrable to calling ``fetch`` repeatedly because it minimizes the number of queries.
-        Specifically, it will perform 0, 1, or 2 queries depending on the passed types::
+        Specifically, it performs one query per ``batch_size`` distinct IDs and string values::
 
-            - If only instances are passed, it just returns them (0 queries)
-            - If only IDs or only string values are passed, it performs 1 query
-            - If both IDs and string values are passed, it performs 2 queries
+            - If only instances (or cached rows) are passed, it just returns them (0 queries)
+            - Otherwise, IDs and string values are looked up together in the same queries
 
         Examples:
             # assuming John has ID 2 and Alex has user ID 14
             users = Users.fetch_all_or_none(['john', 14, 'john', Users.get(Users.id == 2)])
             print(users)  # [Users(2), Users(14), Users(2), Users(2)]
 
+        Args:
+            things: The instances, IDs, and values to look up
+            join_fn: Modifies each query, such as by joining on other tables;
+                     instances are then re-fetched too
+            batch_size: The maximum number of distinct IDs and values to look up per query
+                        (None for no limit)
+            max_workers: Run this many queries concurrently (each on its own connection);
+                         inside a transaction, they run one at a time so that they see its rows
+
         Returns:
             A sequence of the rows found, or None if they were not found; in the same order as they were passed
 
@@ -467,58 +1046,178 @@ class BaseModel(Model):
             def join_fn(s):
                 return s
 
-        # handle errors
-        bad_models = [
-            isinstance(thing, peewee.Model) and not isinstance(thing, cls) for thing in things
-        ]
-        if any(bad_models):
-            raise ValarTableTypeError(
-                f"Fetching a {cls.__name__} on invalid classes {set(bad_models)}"
+        # in one pass, check the types and map every distinct key to its indices in things
+        # if we need to join on other tables, we'll to do queries anyway, so instances become IDs
+        matches: List[Optional[BaseModel]] = [None] * len(things)
+        id_things, str_things = defaultdict(list), defaultdict(list)
+        for i, thing in enumerate(things):
+            if isinstance(thing, cls):
+                if has_join_fn:
+                    id_things[thing.id].append(i)
+                else:
+                    matches[i] = thing
+            elif isinstance(thing, peewee.Model):
+                raise ValarTableTypeError(
+                    f"Fetching a {cls.__name__} on invalid class {thing.__class__.__name__}"
+                )
+            elif isinstance(thing, Integral):
+                id_things[int(thing)].append(i)
+            elif isinstance(thing, str):
+                str_things[thing].append(i)
+            else:
+                raise TypeError(f"Fetching a {cls.__name__} on unknown type {type(thing)}")
+        if not has_join_fn:
+            # serve what we can from the lookup cache, leaving only the misses to query
+            for dct in [id_things, str_things]:
+                for thing in list(dct.keys()):
+                    cached = cls.__get_cached(thing)
+                    if cached is not None:
+                        for ind in dct.pop(thing):
+                            matches[ind] = cached
+        # IDs and strings are looked up together: one query per batch
+        keys = [*id_things.keys(), *str_things.keys()]
+        if len(keys) == 0:
+            return matches
+        if batch_size is None:
+            batch_size = len(keys)
+        batches = [keys[i : i + batch_size] for i in range(0, len(keys), batch_size)]
+        cols = cls._valar_info.indexing_cols
+
+        def do_q(batch):
+            for match in join_fn(cls.select()).where(cls._build_or_query(batch)).iterator():
+                if not has_join_fn:
+                    cls.__put_cached(match)
+                for ind in id_things.get(match.id, []):
+                    matches[ind] = match
+                for col in cols:
+                    for ind in str_things.get(getattr(match, col), []):
+                        matches[ind] = match
+
+        # workers have their own connections, so they cannot see rows written in this transaction
+        concurrent = not cls.__resolved_database().in_transaction()
+        if max_workers > 1 and len(batches) > 1 and concurrent:
+            with ThreadPoolExecutor(max_workers, thread_name_prefix="valarpy") as pool:
+                futures = [
+                    pool.submit(
+                        contextvars.copy_context().run, GlobalConnection.call_closing, do_q, b
+                    )
+                    for b in batches
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            for batch in batches:
+                do_q(batch)
+        return matches
+
+    @classmethod
+    def fetch_all_like(
+        cls,
+        patterns: Iterable[str],
+        limit: Optional[int] = None,
+        batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+    ) -> Sequence[Sequence[BaseModel]]:
+        """
+        Finds the rows whose unique string columns contain each pattern, as with ``fetch(like=True)``.
+        Rather than one ``LIKE`` term per pattern and column, the patterns are sent as a derived table
+        and joined against the table, so each batch of patterns is resolved in a single scan.
+
+        Examples:
+            matches = Compounds.fetch_all_like(["QTBSBXVTEAMEQO", "BSYNRYMUTXBXSQ"], limit=5)
+
+        Args:
+            patterns: Substrings, each wrapped in ``%`` (and may contain other ``LIKE`` wildcards)
+            limit: The maximum number of rows per pattern, by increasing ``id``; None for no limit
+            batch_size: The maximum number of patterns per query (None for no limit)
+
+        Returns:
+            For each pattern, in order, the rows that matched it by increasing ``id``.
+            A row that matches more than one pattern is the same instance in each.
+
+        Raises:
+            TypeError: If a pattern is not a str
+        """
+        return cls.__fetch_all_matching(
+            ["%" + p + "%" if isinstance(p, str) else p for p in patterns],
+            lambda attr, pattern: attr % pattern,
+            limit,
+            batch_size,
+        )
+
+    @classmethod
+    def fetch_all_regex(
+        cls,
+        patterns: Iterable[str],
+        limit: Optional[int] = None,
+        batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+    ) -> Sequence[Sequence[BaseModel]]:
+        """
+        Like ``fetch_all_like``, but matches regular expressions, as with ``fetch(regex=True)``.
+
+        Examples:
+            matches = Batches.fetch_all_regex(["^AB0+12$", "^CD"], limit=10)
+
+        Args:
+            patterns: Regular expressions in the database's syntax
+            limit: The maximum number of rows per pattern, by increasing ``id``; None for no limit
+            batch_size: The maximum number of patterns per query (None for no limit)
+
+        Returns:
+            For each pattern, in order, the rows that matched it by increasing ``id``
+
+        Raises:
+            TypeError: If a pattern is not a str
+        """
+        return cls.__fetch_all_matching(
+            list(patterns), lambda attr, pattern: attr.regexp(pattern), limit, batch_size
+        )
+
+    @classmethod
+    def __fetch_all_matching(
+        cls,
+        patterns: List[str],
+        function: Callable[[peewee.Field, peewee.ColumnBase], peewee.Expression],
+        limit: Optional[int],
+        batch_size: Optional[int],
+    ) -> Sequence[Sequence[BaseModel]]:
+        for pattern in patterns:
+            if not isinstance(pattern, str):
+                raise TypeError(f"Invalid type {type(pattern)} for pattern {pattern}")
+        matches: List[List[BaseModel]] = [[] for _ in patterns]
+        cols = cls._valar_info.indexing_cols
+        if len(patterns) == 0 or len(cols) == 0:
+            return matches
+        if batch_size is None:
+            batch_size = len(patterns)
+        shared: Dict[int, BaseModel] = {}
+        for start in range(0, len(patterns), batch_size):
+            table = _Patterns(patterns[start : start + batch_size])
+            on = functools.reduce(
+                operator.or_, [function(getattr(cls, col), table.c.pattern) for col in cols]
             )
-        bad_types = [not isinstance(thing, (cls, Integral, str)) for thing in things]
-        if any(bad_types):
-            raise TypeError(f"Fetching a {cls.__name__} on unknown types {set(bad_types)}")
-        # utility functions
-        def do_q():
-            return join_fn(cls.select())
-
-        def make_dct(the_type):
-            dct = defaultdict(list)
-            for i, thing in enumerate(things):
-                if isinstance(thing, the_type):
-                    dct[thing].append(i)
-            return dct
-
-        # now we fetch
-        # this will become a dict mapping every index in things to its instance
-        index_to_match = {}
-        # first, we can add all of the actual instances
-        # if we need to join on other tables, we'll to do queries anyway
-        model_things = make_dct(cls)
-        if has_join_fn and len(model_things) > 0:
-            for match in do_q().where(cls.id << [z.id for z in model_things.keys()]):
-                for ind in model_things[match]:
-                    index_to_match[ind] = match
-        elif len(model_things) > 0:
-            for thing in model_things:
-                for ind in model_things[thing]:
-                    index_to_match[ind] = thing
-        # now let's collect those that are ints and those that are strs
-        # unfortunately right now we have to do 2 queries (ID and names), or we'll get type a mismatch error
-        int_things = make_dct(Integral)
-        str_things = make_dct(str)
-        if len(int_things) > 0:
-            for match in do_q().where(cls.id << {int(t) for t, ilist in int_things.items()}):
-                for ind in int_things[match.id]:
-                    index_to_match[ind] = match
-        if len(str_things) > 0:
-            for match in do_q().where(cls._build_or_query(list(set(str_things.keys())))):
-                for col in cls.__indexing_cols():
-                    my_attr = getattr(match, col)
-                    if my_attr in str_things:
-                        for ind in str_things[my_attr]:
-                            index_to_match[ind] = match
-        return [index_to_match.get(i, None) for i in range(0, len(things))]
+            fields = cls._valar_info.default_fields
+            if limit is None:
+                query = cls.select(*fields, table.c.idx.alias("valar_idx")).join(table, on=on)
+                query = query.order_by(table.c.idx, cls.id)
+            else:
+                # number the matches of each pattern so that the server returns only the first few
+                rank = fn.ROW_NUMBER().over(partition_by=[table.c.idx], order_by=[cls.id])
+                ranked = (
+                    cls.select(cls.id, table.c.idx.alias("idx"), rank.alias("valar_rank"))
+                    .join(table, on=on)
+                    .alias("valar_ranked")
+                )
+                query = (
+                    cls.select(*fields, ranked.c.idx.alias("valar_idx"))
+                    .join(ranked, on=(cls.id == ranked.c.id))
+                    .where(ranked.c.valar_rank <= limit)
+                    .order_by(ranked.c.idx, cls.id)
+                )
+            # objects() sets the pattern index as an attribute rather than nesting it
+            for row in query.objects().iterator():
+                found = matches[start + row.__dict__.pop("valar_idx")]
+                found.append(shared.setdefault(row.id, row))
+        return matches
 
     @classmethod
     def fetch_to_query(
@@ -541,6 +1240,13 @@ class BaseModel(Model):
               matched by ID or unique column value as needed
             - If the instance is a Peewee expression itself, that the expression matches
 
+        With at least ``valarpy.temptables.MIN_IDS`` ints, strings, and instances,
+        the expression is ``id IN (SELECT id FROM ...)`` on a temporary table of the IDs,
+        which the server plans as a join, rather than a long ``IN`` list.
+        The table is found or created on the executing connection each time the query runs
+        (see ``valarpy.temptables.IdIn``), so the expression can be kept and reused like any other.
+        Then IDs are not checked to exist, which does not change the rows matched.
+
         Args:
             thing: An int-type to be looked up by the ``id`` column, a ``str``.
                 Looked up by::
@@ -562,17 +1268,117 @@ class BaseModel(Model):
         if all(isinstance(t, peewee.Expression) for t in thing):
             return thing
         elif all(isinstance(t, (Integral, str, Model)) for t in thing):
-            # noinspection PyTypeChecker,PyUnresolvedReferences
-            return [cls.id << {x.id for x in cls.fetch_all_or_none(thing) if x is not None}]
+            if len(thing) < temptables.MIN_IDS:
+                # noinspection PyTypeChecker,PyUnresolvedReferences
+                return [cls.id << {x.id for x in cls.fetch_all_or_none(thing) if x is not None}]
+            # only strings need a lookup; fetch_all_or_none also checks the types of instances
+            ids = {int(t) for t in thing if isinstance(t, Integral)}
+            others = [t for t in thing if not isinstance(t, Integral)]
+            ids.update(x.id for x in cls.fetch_all_or_none(others) if x is not None)
+            if len(ids) < temptables.MIN_IDS:
+                return [cls.id << ids]
+            return [temptables.IdIn(cls.id, ids)]
         raise TypeError(f"Invalid type for {thing} in {cls}")
 
+    @classmethod
+    async def afetch(
+        cls, thing: Union[Integral, str, peewee.Model], like: bool = False, regex: bool = False
+    ) -> peewee.Model:
+        """
+        Async version of ``fetch``, which runs on a worker thread (see ``valarpy.aio``).
+        """
+        from valarpy import aio
+
+        return await aio.run(cls.fetch, thing, like=like, regex=regex)
+
+    @classmethod
+    async def afetch_or_none(
+        cls, thing: Union[Integral, str, peewee.Model], like: bool = False, regex: bool = False
+    ) -> Optional[peewee.Model]:
+        """
+        Async version of ``fetch_or_none``, which runs on a worker thread (see ``valarpy.aio``).
+        """
+        from valarpy import aio
+
+        return await aio.run(cls.fetch_or_none, thing, like=like, regex=regex)
+
+    @classmethod
+    async def afetch_all(
+        cls,
+        things: Iterable[Union[Integral, str, peewee.Model]],
+        batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+        max_workers: int = 1,
+    ) -> Sequence[peewee.Model]:
+        """
+        Async version of ``fetch_all``, which runs on a worker thread (see ``valarpy.aio``).
+        """
+        from valarpy import aio
+
+        return await aio.run(
+            cls.fetch_all, list(things), batch_size=batch_size, max_workers=max_workers
+        )
+
+    @classmethod
+    async def afetch_all_or_none(
+        cls,
+        things: Iterable[Union[Integral, str, peewee.Model]],
+        join_fn: Optional[Callable[[peewee.Expression], peewee.Expression]] = None,
+        batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+        max_workers: int = 1,
+    ) -> Sequence[Optional[peewee.Model]]:
+        """
+        Async version of ``fetch_all_or_none``, which runs on a worker thread (see ``valarpy.aio``).
+        """
+        from valarpy import aio
+
+        return await aio.run(
+            cls.fetch_all_or_none,
+            list(things),
+            join_fn=join_fn,
+            batch_size=batch_size,
+            max_workers=max_workers,
+        )
+
+    @classmethod
+    async def alist_where(
+        cls, *wheres: Sequence[peewee.Expression], **values: Mapping[str, Any]
+    ) -> List[peewee.Model]:
+        """
+        Async version of ``list_where``, which runs on a worker thread (see ``valarpy.aio``).
+        """
+        from valarpy import aio
+
+        return await aio.run(cls.list_where, *wheres, **values)
+
+    @classmethod
+    def aiter_where(
+        cls, *wheres: Sequence[peewee.Expression], **values: Mapping[str, Any]
+    ) -> AsyncGenerator[peewee.Model, None]:
+        """
+        Like ``list_where``, but returns an async generator that does not block the event loop.
+
+        Examples:
+            async for well in Wells.aiter_where(Wells.run == 5):
+                print(well.well_index)
+
+        Args:
+            wheres: List of Peewee WHERE expressions (like ``Users.id==1``) to be joined by AND
+            values: Explicit values (like ``id=1``), also joined by AND
+
+        Returns:
+            An async generator of the rows; see ``valarpy.aio.aiterate``
+        """
+        from valarpy import aio
+
+        return aio.aiterate(cls._where(*wheres, **values))
+
     @classmethod
     def _build_or_query(
         cls, values: Sequence[Union[Model, int, str]], like: bool = False, regex: bool = False
     ) -> Optional[peewee.Expression]:  # pragma: no cover
         if like and regex:
             raise ValueError(f"Cannot call with both like and regex")
-        cols = list(cls.__indexing_cols())
+        cols = cls._valar_info.indexing_cols
         if len(values) == 0:
             return None
         ids = [i for i in values if isinstance(i, int)]
@@ -603,12 +1409,17 @@ class BaseModel(Model):
         return query
 
     @classmethod
-    def __indexing_cols(cls):  # pragma: no cover
-        return {
-            k
-            for k, v in cls._meta.fields.items()
-            if v.unique and v.field_type in {"VARCHAR", "CHAR", "ENUM"}
-        }
+    def __lookup_one(cls, by_str: bool, params: Tuple[Any, ...]) -> Optional[BaseModel]:
+        # runs the precompiled SQL directly, skipping peewee's query building and compilation
+        db = cls.__resolved_database()
+        query, sql = cls._valar_info.lookup_template(db, by_str)
+        cursor = db.execute_sql(sql, params)
+        return next(iter(query._get_cursor_wrapper(cursor)), None)
+
+    @classmethod
+    def __resolved_database(cls) -> peewee.Database:
+        db = cls._meta.database
+        return db.obj if isinstance(db, peewee.DatabaseProxy) else db
 
     @classmethod
     def get_indexing_cols(cls):  # pragma: no cover
@@ -618,4 +1429,4 @@ class BaseModel(Model):
         Returns:
             The columns, of course
         """
-        return cls.__indexing_cols()
+        return set(cls._valar_info.indexing_cols)
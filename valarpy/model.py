@@ -19,6 +19,9 @@ from valarpy.micromodels import (
     UnsupportedOperationError,
 )
 
+# small tables that rarely change, which fetch can serve from memory
+_LOOKUP_CACHE = dict(ttl=600, max_size=10000)
+
 
 class Suppliers(BaseModel):  # pragma: no cover
     created = DateTimeField(constraints=[SQL("DEFAULT current_timestamp()")])
@@ -53,6 +56,7 @@ class Users(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "users"
+        cache = _LOOKUP_CACHE
 
 
 class Plates(BaseModel):  # pragma: no cover
@@ -104,6 +108,7 @@ class ProjectTypes(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "project_types"
+        cache = _LOOKUP_CACHE
 
 
 class Projects(BaseModel):  # pragma: no cover
@@ -171,6 +176,7 @@ class Saurons(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "saurons"
+        cache = _LOOKUP_CACHE
 
 
 class SauronConfigs(BaseModel):  # pragma: no cover
@@ -208,6 +214,8 @@ class ConfigFiles(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "config_files"
+        deferred = ("toml_text",)
+        blob_hashes = {"toml_text": "text_sha1"}
 
 
 class Runs(BaseModel):  # pragma: no cover
@@ -233,6 +241,7 @@ class Runs(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "runs"
+        deferred = ("notes",)
 
 
 class TemplateAssays(BaseModel):  # pragma: no cover
@@ -271,6 +280,7 @@ class ControlTypes(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "control_types"
+        cache = _LOOKUP_CACHE
 
 
 class GeneticVariants(BaseModel):  # pragma: no cover
@@ -377,6 +387,8 @@ class AudioFiles(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "audio_files"
+        deferred = ("data",)
+        blob_hashes = {"data": "sha1"}
 
 
 class Locations(BaseModel):  # pragma: no cover
@@ -407,6 +419,7 @@ class Refs(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "refs"
+        cache = _LOOKUP_CACHE
 
 
 class Compounds(BaseModel):  # pragma: no cover
@@ -499,6 +512,7 @@ class Sensors(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "sensors"
+        cache = _LOOKUP_CACHE
 
 
 class Stimuli(BaseModel):  # pragma: no cover
@@ -520,6 +534,7 @@ class Stimuli(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "stimuli"
+        cache = _LOOKUP_CACHE
 
 
 class CompoundLabels(BaseModel):  # pragma: no cover
@@ -556,6 +571,7 @@ class Features(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "features"
+        cache = _LOOKUP_CACHE
 
 
 class LogFiles(BaseModel):  # pragma: no cover
@@ -566,6 +582,8 @@ class LogFiles(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "log_files"
+        deferred = ("text",)
+        blob_hashes = {"text": "text_sha1"}
 
 
 class MandosInfo(BaseModel):  # pragma: no cover
@@ -703,6 +721,8 @@ class SensorData(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "sensor_data"
+        deferred = ("floats",)
+        blob_hashes = {"floats": "floats_sha1"}
 
 
 class StimulusFrames(BaseModel):  # pragma: no cover
@@ -713,6 +733,7 @@ class StimulusFrames(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "stimulus_frames"
+        blob_hashes = {"frames": "frames_sha1"}
         indexes = ((("assay", "stimulus"), True),)
 
 
@@ -790,6 +811,7 @@ class WellFeatures(BaseModel):  # pragma: no cover
 
     class Meta:
         table_name = "well_features"
+        blob_hashes = {"floats": "sha1"}
 
 
 class WellTreatments(BaseModel):  # pragma: no cover
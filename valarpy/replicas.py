@@ -0,0 +1,225 @@
+"""
+Routing of reads to MySQL read replicas, used by ``Valar`` when its config lists ``replicas``.
+"""
+
+from __future__ import annotations
+
+import functools
+import itertools
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Generator, List, Optional, Sequence
+
+import peewee
+
+from valarpy import temptables
+from valarpy.instrumentation import (
+    MAX_CACHED_SQL,
+    InstrumentedMySQLDatabase,
+    InstrumentedPooledMySQLDatabase,
+)
+
+logger = logging.getLogger("valarpy")
+
+STRATEGIES = ("round_robin", "latency")
+# seconds before a replica that failed to connect is tried again
+RETRY_SEC = 30.0
+# seconds between measurements of replica latency, for the "latency" strategy
+PROBE_SEC = 60.0
+
+# MySQL client errors for a connection that failed or was lost, after which a read is retried on the primary
+_CONNECTION_ERRORS = frozenset({2002, 2003, 2005, 2006, 2013, 2055})
+_SELECT = re.compile(r"^\s*\(*\s*SELECT\b", re.IGNORECASE)
+# reads that lock rows, depend on the session, or use a temporary table that exists only on the primary
+_PRIMARY_ONLY = re.compile(
+    r"\bFOR\s+UPDATE\b|\bFOR\s+SHARE\b|\bLOCK\s+IN\s+SHARE\s+MODE\b|\bLAST_INSERT_ID\b|\bGET_LOCK\b|"
+    + re.escape(temptables.PREFIX),
+    re.IGNORECASE,
+)
+
+# whether reads in the current thread or asyncio task go to the primary
+_on_primary: ContextVar[bool] = ContextVar("valarpy_on_primary", default=False)
+
+
+@contextmanager
+def on_primary() -> Generator[None, None, None]:
+    """
+    Sends every query in this block, from the current thread or asyncio task (and tasks it starts),
+    to the primary. Use this to read rows just written, which a replica may not have yet.
+    Blocks can be nested.
+    """
+    token = _on_primary.set(True)
+    try:
+        yield
+    finally:
+        _on_primary.reset(token)
+
+
+def is_replica_safe(sql: str) -> bool:
+    """
+    Returns whether a statement is a plain ``SELECT`` that a replica can answer.
+    Like ``fingerprint``, caches the results for statements shorter than ``MAX_CACHED_SQL`` characters.
+    """
+    if len(sql) < MAX_CACHED_SQL:
+        return _cached_is_replica_safe(sql)
+    return _is_replica_safe(sql)
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_is_replica_safe(sql: str) -> bool:
+    return _is_replica_safe(sql)
+
+
+def _is_replica_safe(sql: str) -> bool:
+    return _SELECT.match(sql) is not None and _PRIMARY_ONLY.search(sql) is None
+
+
+class ReplicatedDatabase(peewee.Database):
+    """
+    A peewee database mixin that sends reads to replicas and everything else to itself (the primary).
+    A statement goes to a replica only if ``is_replica_safe`` and
+    it is outside a transaction and outside an ``on_primary`` block.
+    A replica is chosen per statement, by ``strategy``:
+
+        - ``round_robin``: in turn
+        - ``latency``: the one that answered ``SELECT 1`` fastest, measured every ``PROBE_SEC``
+
+    If a replica cannot be reached, the read is retried on the primary,
+    and the replica is skipped for ``RETRY_SEC``.
+    Replicas connect on first use, and each thread has its own connections, which ``close`` also closes.
+    """
+
+    def __init__(
+        self,
+        *args,
+        replicas: Sequence[peewee.Database] = (),
+        strategy: str = "round_robin",
+        **kwargs,
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown replica strategy {strategy}; use one of {STRATEGIES}")
+        self.replicas: List[peewee.Database] = list(replicas)
+        self.strategy = strategy
+        self._turn = itertools.count()
+        self._down_until: Dict[int, float] = {}
+        self._latencies: List[float] = [0.0 for _ in self.replicas]
+        self._probed_at: Optional[float] = None
+        self._probe_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def database_for(self, sql: str) -> peewee.Database:
+        """
+        Gets the database that a statement will run on in the current context: a replica or this one.
+        """
+        if _on_primary.get() or self.in_transaction() or not is_replica_safe(sql):
+            return self
+        replica = self._choose()
+        return self if replica is None else replica
+
+    def execute_sql(self, sql, params=None, *args, **kwargs):
+        database = self.database_for(sql)
+        if database is self:
+            return super().execute_sql(sql, params, *args, **kwargs)
+        try:
+            return database.execute_sql(sql, params, *args, **kwargs)
+        except (peewee.OperationalError, peewee.InterfaceError) as e:
+            if not _is_connection_error(e):
+                raise
+            self._mark_down(database, e)
+        return super().execute_sql(sql, params, *args, **kwargs)
+
+    def close(self):
+        for replica in self.replicas:
+            if not replica.is_closed():
+                replica.close()
+        return super().close()
+
+    def _choose(self) -> Optional[peewee.Database]:
+        now = time.monotonic()
+        if self.strategy == "latency":
+            self._probe(now)
+        up = [i for i in range(len(self.replicas)) if self._down_until.get(i, now) <= now]
+        if len(up) == 0:
+            return None
+        if self.strategy == "latency":
+            return self.replicas[min(up, key=lambda i: self._latencies[i])]
+        return self.replicas[up[next(self._turn) % len(up)]]
+
+    def _probe(self, now: float) -> None:
+        # one thread measures; the others use the previous measurements meanwhile
+        if self._probed_at is not None and now - self._probed_at < PROBE_SEC:
+            return
+        if not self._probe_lock.acquire(blocking=False):
+            return
+        try:
+            self._probed_at = now
+            for i, replica in enumerate(self.replicas):
+                # a pooled connection checked out for the probe goes back to the pool after it
+                returning = nullcontext()
+                if isinstance(replica, InstrumentedPooledMySQLDatabase):
+                    returning = replica.returning_connection()
+                t0 = time.perf_counter()
+                try:
+                    with returning, peewee.__exception_wrapper__:
+                        cursor = replica.cursor()
+                        cursor.execute("SELECT 1")
+                        cursor.fetchall()
+                except (peewee.OperationalError, peewee.InterfaceError) as e:
+                    if not _is_connection_error(e):
+                        raise
+                    self._mark_down(replica, e)
+                    self._latencies[i] = float("inf")
+                else:
+                    self._latencies[i] = time.perf_counter() - t0
+        finally:
+            self._probe_lock.release()
+
+    def _mark_down(self, replica: peewee.Database, error: Exception) -> None:
+        logger.warning(f"Replica {replica.connect_params.get('host')} is unavailable: {error}")
+        self._down_until[self.replicas.index(replica)] = time.monotonic() + RETRY_SEC
+        try:
+            replica.close()
+        except peewee.DatabaseError:
+            logger.debug("Failed to close a replica connection", exc_info=True)
+
+
+class InstrumentedReplicatedMySQLDatabase(ReplicatedDatabase, InstrumentedMySQLDatabase):
+    """
+    An ``InstrumentedMySQLDatabase`` that sends reads to replicas.
+    """
+
+
+class InstrumentedReplicatedPooledMySQLDatabase(
+    ReplicatedDatabase, InstrumentedPooledMySQLDatabase
+):
+    """
+    An ``InstrumentedPooledMySQLDatabase`` that sends reads to replicas, which are pooled too.
+    """
+
+    def close_all(self):
+        for replica in self.replicas:
+            replica.close_all()
+        super().close_all()
+
+
+def _is_connection_error(error: peewee.DatabaseError) -> bool:
+    # peewee passes the original arguments on; for PyMySQL, the first is the error code
+    return isinstance(error, peewee.InterfaceError) or (
+        len(error.args) > 0 and error.args[0] in _CONNECTION_ERRORS
+    )
+
+
+__all__ = [
+    "InstrumentedReplicatedMySQLDatabase",
+    "InstrumentedReplicatedPooledMySQLDatabase",
+    "PROBE_SEC",
+    "RETRY_SEC",
+    "ReplicatedDatabase",
+    "STRATEGIES",
+    "is_replica_safe",
+    "on_primary",
+]
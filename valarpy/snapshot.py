@@ -0,0 +1,262 @@
+"""
+Local SQLite copies of subsets of Valar, which ``Valar`` opens in place of the server
+when its config has a ``snapshot`` path.
+"""
+
+from __future__ import annotations
+
+import datetime
+import decimal
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Type, Union
+
+import peewee
+
+from valarpy.instrumentation import InstrumentedSqliteDatabase
+from valarpy.metamodel import BaseModel
+from valarpy.micromodels import ValarTableTypeError
+
+DEFAULT_CHUNK_SIZE = 1000
+PathLike = Union[str, os.PathLike]
+Root = Union[BaseModel, Type[BaseModel]]
+
+
+def snapshot(
+    path: PathLike,
+    roots: Iterable[Root],
+    blobs: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Dict[str, int]:
+    """
+    Copies rows from the open database into a new SQLite file.
+    Starting from ``roots``, follows foreign keys in two directions:
+
+        1. Down: rows that reference a copied row, recursively;
+           for example, the experiments of a project, the runs of those experiments, and their wells
+        2. Up: rows that a copied row references, recursively;
+           for example, the batteries, plates, users, batches, and compounds that those rows use
+
+    Rows are streamed in chunks, so memory use is bounded by ``chunk_size`` rows (plus the copied IDs).
+    The file is written to a temporary path and renamed when complete.
+    Every table is created, so the snapshot can be opened with the same read API;
+    set ``"snapshot": "<path>"`` in the connection config (see ``Valar``).
+
+    Examples:
+        snapshot("my_project.sqlite", [Projects.fetch("my_project"), Features, Refs])
+
+    Args:
+        path: The SQLite file to create
+        roots: Instances (copied with the rows under them) or model classes (copied in full, without descending)
+        blobs: Also copy the columns declared in ``Meta.blob_hashes``, like ``WellFeatures.floats``;
+               otherwise they are NULL. Their digest columns are always copied.
+        chunk_size: The maximum number of rows per query
+
+    Returns:
+        A dict mapping each table name to the number of rows copied
+
+    Raises:
+        FileExistsError: If ``path`` exists
+        ValarTableTypeError: If a root is not a ``BaseModel`` instance or subclass
+    """
+    from valarpy import model
+
+    path = Path(path)
+    if path.exists():
+        raise FileExistsError(f"Snapshot {path} already exists")
+    full, ids = [], defaultdict(set)
+    for root in roots:
+        if isinstance(root, type) and issubclass(root, BaseModel):
+            full.append(root)
+        elif isinstance(root, BaseModel):
+            ids[type(root)].add(root.id)
+        else:
+            raise ValarTableTypeError(f"Cannot snapshot {root} of type {type(root)}")
+    source = model.BaseModel._meta.database
+    tmp = path.with_name(path.name + ".tmp")
+    if tmp.exists():
+        tmp.unlink()
+    target = peewee.SqliteDatabase(str(tmp), pragmas=dict(journal_mode="off", synchronous=0))
+    try:
+        create_schema(target)
+        _descend(ids, chunk_size)
+        copier = _Copier(source, target, blobs, chunk_size)
+        for m in full:
+            copier.copy_table(m)
+        for m, m_ids in ids.items():
+            copier.found[m] |= m_ids
+        # copying rows finds the rows they reference, until none are left
+        while True:
+            pending = {m: v - copier.copied[m] for m, v in copier.found.items()}
+            pending = {m: v for m, v in pending.items() if len(v) > 0}
+            if len(pending) == 0:
+                break
+            copier.found = defaultdict(set)
+            for m, m_ids in pending.items():
+                copier.copy_rows(m, m_ids)
+        target.close()
+        os.replace(tmp, path)
+    except BaseException:
+        target.close()
+        if tmp.exists():
+            tmp.unlink()
+        raise
+    return {m._meta.table_name: len(v) for m, v in copier.copied.items()}
+
+
+def connect(path: PathLike, **kwargs) -> InstrumentedSqliteDatabase:
+    """
+    Opens a snapshot read-only.
+    ``Valar.open`` calls this when the config has a ``snapshot`` path.
+
+    Args:
+        path: A file created by ``snapshot``
+        kwargs: Passed to ``InstrumentedSqliteDatabase``, like ``query_log``
+
+    Returns:
+        An unconnected database, with ``REGEXP`` defined
+
+    Raises:
+        FileNotFoundError: If ``path`` does not exist
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"Snapshot {path} does not exist")
+    database = InstrumentedSqliteDatabase(f"file:{path.resolve()}?mode=ro", uri=True, **kwargs)
+    database.register_function(_regexp, "regexp", 2)
+    return database
+
+
+def create_schema(database: peewee.SqliteDatabase) -> None:
+    """
+    Creates a table for every model in a SQLite database, with indices for unique, indexed, and foreign key columns.
+    Columns are nullable and have no defaults or foreign key constraints.
+    """
+    from valarpy import model
+
+    for m in model.BaseModel.__subclasses__():
+        table = m._meta.table_name
+        columns = []
+        for f in m._meta.sorted_fields:
+            kind = "INTEGER PRIMARY KEY" if f.primary_key else _sqlite_type(f)
+            columns.append(f"{_quote(f.column_name)} {kind}")
+        database.execute_sql(f"CREATE TABLE {_quote(table)} ({', '.join(columns)})")
+        for f in m._meta.sorted_fields:
+            if not f.primary_key and (f.unique or f.index or isinstance(f, peewee.ForeignKeyField)):
+                unique = "UNIQUE " if f.unique else ""
+                index = _quote(f"{table}_{f.column_name}")
+                database.execute_sql(
+                    f"CREATE {unique}INDEX {index} ON {_quote(table)} " f"({_quote(f.column_name)})"
+                )
+
+
+class _Copier:
+    def __init__(
+        self, source: peewee.Database, target: peewee.Database, blobs: bool, chunk_size: int
+    ):
+        self.source, self.target = source, target
+        self.blobs, self.chunk_size = blobs, chunk_size
+        self.copied: Dict[Type[BaseModel], Set[int]] = defaultdict(set)
+        self.found: Dict[Type[BaseModel], Set[int]] = defaultdict(set)
+
+    def copy_table(self, model: Type[BaseModel]) -> None:
+        fields = self._fields(model)
+        after = None
+        while True:
+            query = model.select(*fields).order_by(model.id).limit(self.chunk_size)
+            if after is not None:
+                query = query.where(model.id > after)
+            rows = self.source.execute(query).fetchall()
+            self._insert(model, fields, rows)
+            if len(rows) < self.chunk_size:
+                return
+            after = rows[-1][0]
+
+    def copy_rows(self, model: Type[BaseModel], ids: Set[int]) -> None:
+        fields = self._fields(model)
+        ids = sorted(ids)
+        for i in range(0, len(ids), self.chunk_size):
+            query = model.select(*fields).where(model.id << ids[i : i + self.chunk_size])
+            self._insert(model, fields, self.source.execute(query).fetchall())
+
+    def _fields(self, model: Type[BaseModel]) -> List[peewee.Field]:
+        # the id first, then every column except blobs (unless requested)
+        # noinspection PyProtectedMember
+        blobs = () if self.blobs else model._valar_info.blob_hashes.keys()
+        return [model.id] + [
+            f for f in model._meta.sorted_fields if f is not model.id and f.name not in blobs
+        ]
+
+    def _insert(
+        self, model: Type[BaseModel], fields: Sequence[peewee.Field], rows: List[Tuple[Any, ...]]
+    ) -> None:
+        if len(rows) == 0:
+            return
+        refs = [
+            (i, f.rel_model) for i, f in enumerate(fields) if isinstance(f, peewee.ForeignKeyField)
+        ]
+        for row in rows:
+            self.copied[model].add(row[0])
+            for i, rel in refs:
+                if row[i] is not None:
+                    self.found[rel].add(row[i])
+        columns = ", ".join(_quote(f.column_name) for f in fields)
+        sql = (
+            f"INSERT OR IGNORE INTO {_quote(model._meta.table_name)} ({columns}) "
+            f"VALUES ({', '.join('?' * len(fields))})"
+        )
+        with self.target.atomic():
+            self.target.cursor().executemany(sql, [tuple(map(_sqlite_value, r)) for r in rows])
+
+
+def _descend(ids: Dict[Type[BaseModel], Set[int]], chunk_size: int) -> None:
+    # adds the IDs of rows that reference the rows in ids, recursively
+    frontier = {m: set(v) for m, v in ids.items()}
+    while len(frontier) > 0:
+        found = defaultdict(set)
+        for parent, parent_ids in frontier.items():
+            parent_ids = sorted(parent_ids)
+            for fk, child in parent._meta.backrefs.items():
+                for i in range(0, len(parent_ids), chunk_size):
+                    query = child.select(child.id).where(fk << parent_ids[i : i + chunk_size])
+                    for (child_id,) in query.tuples().iterator():
+                        if child_id not in ids[child]:
+                            ids[child].add(child_id)
+                            found[child].add(child_id)
+        frontier = found
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sqlite_type(field: peewee.Field) -> str:
+    # a declared type with the right SQLite affinity; for example, "ENUM" would have NUMERIC affinity
+    if isinstance(field, (peewee.IntegerField, peewee.ForeignKeyField, peewee.BooleanField)):
+        return "INTEGER"
+    if isinstance(field, peewee.FloatField):
+        return "REAL"
+    if isinstance(field, peewee.BlobField):
+        return "BLOB"
+    return "TEXT"
+
+
+def _sqlite_value(value: Any) -> Any:
+    # sqlite3 cannot bind decimals or times, and its datetime adapters are deprecated
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.time, datetime.timedelta)):
+        return str(value)
+    return value
+
+
+def _regexp(pattern: Optional[str], value: Optional[str]) -> Optional[bool]:
+    # like REGEXP BINARY, which peewee's regexp() uses on MySQL
+    if pattern is None or value is None:
+        return None
+    return re.search(pattern, str(value)) is not None
+
+
+__all__ = ["DEFAULT_CHUNK_SIZE", "connect", "create_schema", "snapshot"]
@@ -0,0 +1,210 @@
+"""
+Session temporary tables of IDs, which replace very long ``IN`` lists in queries.
+"""
+
+from __future__ import annotations
+
+import array
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Collection, Generator, List, Optional, Set
+
+import peewee
+
+logger = logging.getLogger("valarpy")
+
+# fetch_to_query loads at least this many IDs into a temporary table
+MIN_IDS = 10000
+# the number of tables kept per connection; the least recently used one is dropped beyond this
+MAX_TABLES = 16
+# the start of every table name
+PREFIX = "valarpy_ids_"
+_INSERT_BATCH_SIZE = 10000
+
+# the statement being compiled on this thread and the tables it uses
+_compiling = threading.local()
+# whether statements compiled in the current context are about to run (see executing)
+_executing: ContextVar[bool] = ContextVar("valarpy_executing", default=False)
+
+
+@contextmanager
+def executing() -> Generator[None, None, None]:
+    """
+    Marks the statements compiled in this block as about to run, so that ``IdIn`` may create tables for them.
+    The databases that ``Valar`` opens do this in ``execute``, as does ``valarpy.connection.streaming_cursor``.
+    """
+    token = _executing.set(True)
+    try:
+        yield
+    finally:
+        _executing.reset(token)
+
+
+class IdIn(peewee.ColumnBase):
+    """
+    The expression ``column IN (ids)`` for a large set of IDs.
+    Each time it is compiled to SQL, which peewee does just before executing,
+    it finds or creates a temporary table of the IDs on the current thread's connection (see ``id_table``)
+    and renders ``column IN (SELECT id FROM <table>)``.
+    So the expression works on any thread, in any transaction, and after its table was dropped.
+    It lists the IDs instead if the table cannot be created,
+    if the same IDs already appear in the statement (MySQL cannot open a temporary table twice in one query),
+    or if the statement is only being compiled, as by ``str(query)`` or ``query.sql()`` (see ``executing``).
+    """
+
+    def __init__(self, column: peewee.Field, ids: Collection[int]):
+        """
+        Constructor.
+
+        Args:
+            column: A field of a model, usually ``id``; the model's database is resolved when compiled
+            ids: The IDs, which may contain duplicates
+        """
+        super().__init__()
+        self.column = column
+        self.ids: List[int] = sorted(set(ids))
+        self.name = table_name(self.ids)
+
+    def __sql__(self, ctx: peewee.Context) -> peewee.Context:
+        if len(self.ids) == 0:
+            return ctx.literal("0 = 1")
+        database = self.column.model._meta.database
+        if isinstance(database, peewee.DatabaseProxy):
+            database = database.obj
+        if getattr(_compiling, "ctx", None) is not ctx:
+            _compiling.ctx, _compiling.names = ctx, set()
+        names: Set[str] = _compiling.names
+        table = None
+        if database is not None and self.name not in names and _executing.get():
+            table = id_table(database, self.ids, keep=names)
+        ctx.literal("(").sql(self.column).literal(" IN ")
+        if table is None:
+            with ctx(converter=self.column.db_value):
+                ctx.sql(peewee.Value(self.ids))
+        else:
+            names.add(self.name)
+            ctx.sql(table.select(table.id))
+        return ctx.literal(")")
+
+
+def table_name(ids: Collection[int]) -> str:
+    """
+    Gets the name of the table for a set of IDs, which is a hash of the sorted, distinct IDs.
+    """
+    ids = sorted(set(ids))
+    return PREFIX + hashlib.sha1(array.array("q", ids).tobytes()).hexdigest()[:16]
+
+
+def id_table(
+    database: peewee.Database, ids: Collection[int], keep: Collection[str] = ()
+) -> Optional[peewee.Table]:
+    """
+    Finds or creates a temporary table with a single column ``id`` containing ``ids``.
+    The table is on this thread's connection, so it is visible only to that connection.
+    A table created outside a transaction is reused for the same set of IDs.
+    One created inside a transaction is created again each time, since a rollback could have emptied or removed it.
+    Usually, use ``IdIn``, which calls this for each statement.
+
+    The table is dropped:
+
+        - if it was created inside a transaction, when the outermost ``Valar.atomic`` or ``Valar.rolling_back`` exits
+        - when a pooled connection is returned to the pool (see ``drop_id_tables``)
+        - when the connection is closed
+        - when more than ``MAX_TABLES`` have been created on the connection (the least recently used),
+          except for those in ``keep``, and not inside a transaction
+
+    Args:
+        database: A connected or connectable peewee database
+        ids: The IDs, which may contain duplicates
+        keep: Names of tables that the current statement uses, which are not dropped
+
+    Returns:
+        A ``peewee.Table`` bound to ``database``,
+        or None if the table could not be created (for example, without the ``CREATE TEMPORARY TABLES`` privilege)
+    """
+    ids = sorted(set(ids))
+    name = table_name(ids)
+    tables = _tables(database)
+    table = peewee.Table(name, ("id",)).bind(database)
+    in_transaction = database.in_transaction()
+    if tables.get(name) is True:
+        # created outside a transaction, so no rollback can have changed it
+        tables.move_to_end(name)
+        return table
+    if name in tables:
+        # created in a transaction, which may have rolled back
+        tables.pop(name)
+        _drop(database, name)
+    try:
+        database.execute_sql(f"CREATE TEMPORARY TABLE {name} (id BIGINT NOT NULL PRIMARY KEY)")
+    except (peewee.OperationalError, peewee.ProgrammingError, peewee.InternalError):
+        logger.debug(f"Could not create temporary table {name}", exc_info=True)
+        return None
+    try:
+        for i in range(0, len(ids), _INSERT_BATCH_SIZE):
+            rows = [(j,) for j in ids[i : i + _INSERT_BATCH_SIZE]]
+            table.insert(rows, columns=[table.id]).execute()
+    except BaseException:
+        _drop(database, name)
+        raise
+    # True if reusable
+    tables[name] = not in_transaction
+    # a rollback would restore a table dropped in a transaction (on SQLite), so evict only outside of one
+    for oldest in [n for n in tables if n != name and n not in keep]:
+        if len(tables) <= MAX_TABLES or in_transaction:
+            break
+        tables.pop(oldest)
+        _drop(database, oldest)
+    return table
+
+
+def drop_id_tables(database: peewee.Database, only_in_transaction: bool = False) -> None:
+    """
+    Drops the tables that ``id_table`` created on this thread's connection, if it is open.
+
+    Args:
+        database: The database
+        only_in_transaction: Drop only the tables created inside a transaction, which cannot be reused
+    """
+    if database.is_closed():
+        return
+    tables = _tables(database)
+    for name, reusable in list(tables.items()):
+        if not (only_in_transaction and reusable):
+            tables.pop(name)
+            _drop(database, name)
+
+
+def _drop(database: peewee.Database, name: str) -> None:
+    # TEMPORARY guarantees that MySQL never drops a permanent table; SQLite has no such clause
+    if isinstance(database, peewee.MySQLDatabase):
+        database.execute_sql(f"DROP TEMPORARY TABLE IF EXISTS {name}")
+    else:
+        database.execute_sql(f"DROP TABLE IF EXISTS temp.{name}")
+
+
+def _tables(database: peewee.Database) -> OrderedDict:
+    # the tables are stored with the connection they were created on (in peewee's per-thread state),
+    # since a new connection (after a reconnect or from a pool) has none of them
+    state = database._state
+    conn = database.connection()
+    if getattr(state, "valarpy_id_conn", None) is not conn:
+        state.valarpy_id_conn = conn
+        state.valarpy_id_tables = OrderedDict()
+    return state.valarpy_id_tables
+
+
+__all__ = [
+    "IdIn",
+    "MAX_TABLES",
+    "MIN_IDS",
+    "PREFIX",
+    "drop_id_tables",
+    "executing",
+    "id_table",
+    "table_name",
+]
@@ -0,0 +1,376 @@
+"""
+A compact, columnar table of wells, for holding many runs in memory.
+"""
+
+from __future__ import annotations
+
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import peewee
+
+from valarpy.metamodel import DEFAULT_BATCH_SIZE
+
+# the value of NULL in integer columns; IDs, indices, and ages are never negative
+NULL = -1
+
+WELL_COLUMNS: Mapping[str, np.dtype] = MappingProxyType(
+    {
+        "id": np.dtype(np.int64),
+        "run_id": np.dtype(np.int64),
+        "well_index": np.dtype(np.int32),
+        "n": np.dtype(np.int32),
+        "age": np.dtype(np.int32),
+        "control_type_id": np.dtype(np.int64),
+        "variant_id": np.dtype(np.int64),
+    }
+)
+TREATMENT_COLUMNS: Mapping[str, np.dtype] = MappingProxyType(
+    {
+        "well_id": np.dtype(np.int64),
+        "batch_id": np.dtype(np.int64),
+        "micromolar_dose": np.dtype(np.float64),
+    }
+)
+FEATURE_COLUMNS: Mapping[str, np.dtype] = MappingProxyType(
+    {
+        "id": np.dtype(np.int64),
+        "well_id": np.dtype(np.int64),
+        "type_id": np.dtype(np.int64),
+    }
+)
+Columns = Mapping[str, np.ndarray]
+# columns that can be NULL, which become nullable pandas integer columns
+_NULLABLE = frozenset({"age", "control_type_id", "variant_id"})
+
+
+class WellTable:
+    """
+    Wells stored as one NumPy array per column, with their treatments and ``WellFeatures`` references.
+    A well takes 44 bytes (plus 24 per treatment and feature) rather than the 1–2 KB of a ``Wells`` instance.
+    NULL is stored as ``NULL`` (-1) in integer columns and NaN in ``micromolar_dose``.
+    Treatments and feature references are stored in their own columns, keyed by ``well_id``,
+    and filtering the wells filters them too.
+
+    Examples:
+        table = WellTable.load(Wells.run << run_ids)
+        controls = table.filter(control_type_id=[1, 2])
+        for run_id, wells in table.group_by("run_id").items():
+            print(run_id, len(wells), np.unique(wells.treatments["batch_id"]))
+        df = table.to_frame()
+    """
+
+    def __init__(
+        self,
+        wells: Columns,
+        treatments: Optional[Columns] = None,
+        features: Optional[Columns] = None,
+    ):
+        """
+        Constructor.
+
+        Args:
+            wells: An array for each of ``WELL_COLUMNS``
+            treatments: An array for each of ``TREATMENT_COLUMNS``; empty if None
+            features: An array for each of ``FEATURE_COLUMNS``; empty if None
+
+        Raises:
+            ValueError: If a column is missing or the arrays of a table have different lengths
+        """
+        self.wells = _checked(wells, WELL_COLUMNS, "wells")
+        self.treatments = _checked(treatments, TREATMENT_COLUMNS, "treatments")
+        self.features = _checked(features, FEATURE_COLUMNS, "features")
+
+    @classmethod
+    def load(
+        cls,
+        *wheres: peewee.Expression,
+        treatments: bool = True,
+        features: bool = True,
+        **values: Any,
+    ) -> WellTable:
+        """
+        Loads the wells matching a WHERE clause, without creating model instances.
+        Runs one query for the wells and one each for the treatments and feature references.
+
+        Args:
+            wheres: Peewee WHERE expressions on ``Wells``, joined by AND
+            treatments: Load the treatments
+            features: Load the ``WellFeatures`` IDs and types (not their data)
+            values: Explicit values on ``Wells`` (like ``run=12``), also joined by AND
+
+        Returns:
+            A ``WellTable`` ordered by well ID
+        """
+        from valarpy.model import WellFeatures, Wells, WellTreatments
+
+        def where(query: peewee.ModelSelect) -> peewee.ModelSelect:
+            for w in wheres:
+                query = query.where(w)
+            for name, value in values.items():
+                query = query.where(getattr(Wells, name) == value)
+            return query
+
+        fields = [Wells.id, Wells.run, Wells.well_index, Wells.n, Wells.age]
+        query = Wells.select(*fields, Wells.control_type, Wells.variant)
+        well_cols = _read(where(query).order_by(Wells.id), WELL_COLUMNS)
+        treatment_cols, feature_cols = None, None
+        if treatments:
+            fields = [WellTreatments.well, WellTreatments.batch, WellTreatments.micromolar_dose]
+            query = where(WellTreatments.select(*fields).join(Wells))
+            query = query.order_by(WellTreatments.well, WellTreatments.id)
+            treatment_cols = _read(query, TREATMENT_COLUMNS)
+        if features:
+            query = WellFeatures.select(WellFeatures.id, WellFeatures.well, WellFeatures.type)
+            query = where(query.join(Wells)).order_by(WellFeatures.well, WellFeatures.id)
+            feature_cols = _read(query, FEATURE_COLUMNS)
+        return cls(well_cols, treatment_cols, feature_cols)
+
+    @classmethod
+    def from_frame(
+        cls,
+        wells: pd.DataFrame,
+        treatments: Optional[pd.DataFrame] = None,
+        features: Optional[pd.DataFrame] = None,
+    ) -> WellTable:
+        """
+        Creates a table from DataFrames like those from ``to_frame``, ``treatments_frame``, and ``features_frame``.
+        Missing values (like ``pd.NA``) become ``NULL``.
+
+        Raises:
+            ValueError: If a column is missing
+        """
+        if treatments is not None:
+            treatments = _from_frame(treatments, TREATMENT_COLUMNS, "treatments")
+        if features is not None:
+            features = _from_frame(features, FEATURE_COLUMNS, "features")
+        return cls(_from_frame(wells, WELL_COLUMNS, "wells"), treatments, features)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Gets the wells as a DataFrame, with nullable integer columns for ``age``, ``control_type_id``, and ``variant_id``.
+        The columns share memory with this table.
+        """
+        return _to_frame(self.wells)
+
+    def treatments_frame(self) -> pd.DataFrame:
+        """
+        Gets the treatments as a DataFrame with columns ``well_id``, ``batch_id``, and ``micromolar_dose``.
+        """
+        return _to_frame(self.treatments)
+
+    def features_frame(self) -> pd.DataFrame:
+        """
+        Gets the feature references as a DataFrame with columns ``id``, ``well_id``, and ``type_id``.
+        """
+        return _to_frame(self.features)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.wells["id"]
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The total size of the arrays, in bytes.
+        """
+        tables = [self.wells, self.treatments, self.features]
+        return sum(array.nbytes for table in tables for array in table.values())
+
+    def filter(self, mask: Optional[np.ndarray] = None, **values: Any) -> WellTable:
+        """
+        Gets the wells matching a boolean mask and column values, with their treatments and features.
+
+        Examples:
+            table.filter(table["age"] > 5, run_id=[12, 13], control_type_id=NULL)
+
+        Args:
+            mask: A boolean array with an element per well
+            values: Column names mapped to a value or a list of allowed values
+
+        Returns:
+            A new ``WellTable``
+
+        Raises:
+            ValueError: If a column does not exist
+        """
+        keep = np.ones(len(self), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        for name, value in values.items():
+            if name not in self.wells:
+                raise ValueError(f"No column {name}")
+            if isinstance(value, (list, tuple, set, np.ndarray)):
+                keep &= np.isin(self.wells[name], list(value) if isinstance(value, set) else value)
+            else:
+                keep &= self.wells[name] == value
+        return self._take(keep)
+
+    def treated_with(self, batch_ids: Iterable[int]) -> np.ndarray:
+        """
+        Gets a boolean mask of the wells that have a treatment with any of the batches.
+
+        Args:
+            batch_ids: ``Batches`` IDs
+        """
+        treated = self.treatments["well_id"][np.isin(self.treatments["batch_id"], list(batch_ids))]
+        return np.isin(self.ids, treated)
+
+    def group_by(self, *columns: str) -> Dict[Union[int, Tuple[int, ...]], WellTable]:
+        """
+        Splits the wells by the values of columns, with a sort rather than a filter per group.
+
+        Args:
+            columns: Well column names
+
+        Returns:
+            A dict mapping each value (or tuple of values, for multiple columns) to a ``WellTable``, in sorted order
+
+        Raises:
+            ValueError: If no columns were given or a column does not exist
+        """
+        if len(columns) == 0:
+            raise ValueError("No columns to group by")
+        for name in columns:
+            if name not in self.wells:
+                raise ValueError(f"No column {name}")
+        keys = np.stack([self.wells[name].astype(np.int64) for name in columns], axis=1)
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        n_groups = len(unique)
+        wells = _split(self.wells, inverse, n_groups)
+        positions = [self._positions(self.treatments), self._positions(self.features)]
+        children = [
+            _split(
+                {k: v[pos >= 0] for k, v in table.items()},
+                inverse[pos[pos >= 0]],
+                n_groups,
+            )
+            for table, pos in zip([self.treatments, self.features], positions)
+        ]
+        groups = {}
+        for i, key in enumerate(unique):
+            key = int(key[0]) if len(columns) == 1 else tuple(int(k) for k in key)
+            groups[key] = WellTable(wells[i], children[0][i], children[1][i])
+        return groups
+
+    def to_wells(self, rows: Optional[Union[np.ndarray, Sequence[int]]] = None) -> List[Any]:
+        """
+        Loads ``Wells`` instances for some or all rows, in one query per ``DEFAULT_BATCH_SIZE`` wells.
+
+        Args:
+            rows: Row positions or a boolean mask; all rows if None
+
+        Returns:
+            The instances, in the order of the rows
+
+        Raises:
+            ValarLookupError: If a well was deleted
+        """
+        from valarpy.model import Wells
+
+        ids = self.ids if rows is None else self.ids[np.asarray(rows)]
+        return Wells.fetch_all([int(i) for i in ids], batch_size=DEFAULT_BATCH_SIZE)
+
+    def well(self, row: int) -> Any:
+        """
+        Loads the ``Wells`` instance at a row position.
+        """
+        return self.to_wells([row])[0]
+
+    def __len__(self) -> int:
+        return len(self.wells["id"])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.wells[name]
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(wells={len(self)}, treatments={len(self.treatments['well_id'])},"
+            + f" features={len(self.features['id'])}, nbytes={self.nbytes})"
+        )
+
+    def _take(self, keep: np.ndarray) -> WellTable:
+        if len(keep) != len(self):
+            raise ValueError(f"Mask has length {len(keep)}, not {len(self)}")
+        children = []
+        for table in [self.treatments, self.features]:
+            pos = self._positions(table)
+            child_keep = (pos >= 0) & keep[np.maximum(pos, 0)]
+            children.append({k: v[child_keep] for k, v in table.items()})
+        return WellTable({k: v[keep] for k, v in self.wells.items()}, *children)
+
+    def _positions(self, child: Columns) -> np.ndarray:
+        # the row of each child's well, or -1 if the well is not in this table
+        if len(self) == 0:
+            return np.full(len(child["well_id"]), -1, dtype=np.int64)
+        order = np.argsort(self.ids, kind="stable")
+        sorted_ids = self.ids[order]
+        pos = np.minimum(np.searchsorted(sorted_ids, child["well_id"]), len(order) - 1)
+        return np.where(sorted_ids[pos] == child["well_id"], order[pos], -1)
+
+
+def _read(query: peewee.ModelSelect, dtypes: Mapping[str, np.dtype]) -> Dict[str, np.ndarray]:
+    cursor = query.model._meta.database.execute(query)
+    chunks = {name: [] for name in dtypes}
+    while True:
+        rows = cursor.fetchmany(DEFAULT_BATCH_SIZE)
+        if len(rows) == 0:
+            break
+        block = np.array(rows, dtype=object).reshape(len(rows), len(dtypes))
+        for i, (name, dtype) in enumerate(dtypes.items()):
+            values = block[:, i]
+            nulls = np.equal(values, None)
+            values[nulls] = np.nan if dtype.kind == "f" else NULL
+            chunks[name].append(values.astype(dtype))
+    return {
+        name: np.concatenate(chunks[name]) if chunks[name] else np.empty(0, dtype=dtype)
+        for name, dtype in dtypes.items()
+    }
+
+
+def _checked(
+    columns: Optional[Columns], dtypes: Mapping[str, np.dtype], what: str
+) -> Dict[str, np.ndarray]:
+    if columns is None:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in dtypes.items()}
+    missing = set(dtypes) - set(columns)
+    if len(missing) > 0:
+        raise ValueError(f"Missing {what} columns {', '.join(sorted(missing))}")
+    checked = {name: np.asarray(columns[name], dtype=dtype) for name, dtype in dtypes.items()}
+    lengths = {len(array) for array in checked.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"The {what} columns have different lengths {lengths}")
+    return checked
+
+
+def _from_frame(df: pd.DataFrame, dtypes: Mapping[str, np.dtype], what: str) -> Columns:
+    missing = set(dtypes) - set(df.columns)
+    if len(missing) > 0:
+        raise ValueError(f"Missing {what} columns {', '.join(sorted(missing))}")
+    return {
+        name: df[name].to_numpy(dtype=dtype, na_value=np.nan if dtype.kind == "f" else NULL)
+        for name, dtype in dtypes.items()
+    }
+
+
+def _to_frame(columns: Columns) -> pd.DataFrame:
+    data = {}
+    for name, values in columns.items():
+        if name in _NULLABLE:
+            data[name] = pd.arrays.IntegerArray(values, values == NULL)
+        else:
+            data[name] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def _split(columns: Columns, groups: np.ndarray, n_groups: int) -> List[Dict[str, np.ndarray]]:
+    order = np.argsort(groups, kind="stable")
+    bounds = np.cumsum(np.bincount(groups, minlength=n_groups))[:-1]
+    return [
+        {name: values[indices] for name, values in columns.items()}
+        for indices in np.split(order, bounds)
+    ]
+
+
+__all__ = ["FEATURE_COLUMNS", "NULL", "TREATMENT_COLUMNS", "WELL_COLUMNS", "WellTable"]